@@ -0,0 +1,68 @@
+"""
+Startup-time regression check for the Streamlit app.
+
+Imports `main` in fresh interpreters (as a new server process does), reports
+the median import time, and fails if it exceeds the target or if any heavy
+module that should load lazily (yt-dlp, google-genai) was imported:
+
+    python benchmarks/bench_startup.py --runs 5 --target-ms 1500
+
+The exit status is non-zero on a regression, so it can run in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported until the first search or extraction
+LAZY_MODULES = ("yt_dlp", "google.genai", "pypdf")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'import_ms': elapsed * 1000,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def probe_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE % (LAZY_MODULES,)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start")
+    parser.add_argument("--target-ms", type=float, default=1500.0, help="maximum median import time of main.py")
+    args = parser.parse_args()
+
+    probes = [probe_once() for _ in range(args.runs)]
+    median_ms = statistics.median(p['import_ms'] for p in probes)
+    loaded = sorted({name for p in probes for name in p['loaded']})
+
+    print(f"import main: median {median_ms:.0f} ms over {args.runs} runs (target {args.target_ms:.0f} ms)")
+    failed = False
+    if median_ms > args.target_ms:
+        print("FAIL: startup is slower than the target")
+        failed = True
+    if loaded:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
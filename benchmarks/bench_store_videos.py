@@ -0,0 +1,88 @@
+"""
+Benchmark VideoStorage.store_videos_for_file throughput.
+
+Compares the batched write path against the previous row-by-row path
+(one SELECT + one INSERT per video plus one INSERT per link) on a
+throwaway database:
+
+    python benchmarks/bench_store_videos.py --videos 5000 --files 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import get_pool  # noqa: E402
+from storage_backends import SQLiteBackend  # noqa: E402
+from video_storage import VideoStorage  # noqa: E402
+
+
+def make_results(file_index: int, videos: int, concepts: int = 40, shared: float = 0.3):
+    """Synthetic search results; a `shared` fraction of URLs repeats across files."""
+    results = {}
+    for i in range(videos):
+        concept = f"Concept {i % concepts}"
+        if i < videos * shared:
+            url = f"https://www.youtube.com/watch?v=shared{i}"
+        else:
+            url = f"https://www.youtube.com/watch?v=f{file_index}v{i}"
+        results.setdefault(concept, []).append({'title': f"Video {i}", 'url': url})
+    return results
+
+
+def store_row_by_row(pool, file_hash, video_results):
+    """The previous implementation, kept here as the baseline."""
+    with pool.write() as conn:
+        conn.execute("INSERT OR IGNORE INTO file_hashes (hash) VALUES (?)", (file_hash,))
+        position = 0
+        for concept, videos in video_results.items():
+            for video in videos:
+                row = conn.execute("SELECT id FROM videos WHERE url = ?", (video['url'],)).fetchone()
+                if row:
+                    video_id = row[0]
+                else:
+                    video_id = conn.execute(
+                        "INSERT INTO videos (url, title, concept) VALUES (?, ?, ?)",
+                        (video['url'], video['title'], concept)
+                    ).lastrowid
+                conn.execute(
+                    "INSERT OR IGNORE INTO file_video_links (file_hash, video_id, concept, position) "
+                    "VALUES (?, ?, ?, ?)",
+                    (file_hash, video_id, concept, position)
+                )
+                position += 1
+
+
+def run(label, store, files, videos):
+    payloads = [make_results(f, videos) for f in range(files)]
+    start = time.perf_counter()
+    for f, payload in enumerate(payloads):
+        store(f"hash{f:08d}", payload)
+    elapsed = time.perf_counter() - start
+    total = files * videos
+    print(f"{label:<12} {total:>9} videos  {elapsed:8.3f}s  {total / elapsed:>12,.0f} videos/s  "
+          f"{elapsed / files * 1000:8.2f} ms/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=5000, help="videos per store_videos_for_file call")
+    parser.add_argument("--files", type=int, default=20, help="number of calls (one per file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline_db = os.path.join(tmp, "baseline.db")
+        batched_db = os.path.join(tmp, "batched.db")
+
+        pool = get_pool(baseline_db)
+        run("row-by-row", lambda h, r: store_row_by_row(pool, h, r), args.files, args.videos)
+
+        storage = VideoStorage(batched_db, SQLiteBackend(batched_db))
+        run("batched", storage.store_videos_for_file, args.files, args.videos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Deterministic, offline stand-ins for genai.Client and yt_dlp.YoutubeDL.
+
+Both sleep for a configurable latency per call so benchmarks exercise the
+same concurrency and caching paths as production without touching the network.
+"""
+import hashlib
+import itertools
+import time
+from types import SimpleNamespace
+from typing import List, Set
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def concept_response(count: int, seed: str = "") -> str:
+    """A model-style response listing `count` concepts in a ```python block."""
+    items = ", ".join(f"'Concept {seed}{i} {_digest(seed + str(i))[:8]}'" for i in range(count))
+    return f"Here are the key concepts:\n```python\nconcepts = [{items}]\n```\n"
+
+
+class FakeYoutubeDL:
+    """Stand-in for yt_dlp.YoutubeDL: returns `count` deterministic entries per ytsearch query."""
+
+    def __init__(self, opts=None, latency: float = 0.05):
+        self.opts = opts or {}
+        self.latency = latency
+
+    def extract_info(self, url: str, download: bool = False) -> dict:
+        time.sleep(self.latency)
+        prefix, query = url.split(':', 1)
+        count = int(prefix[len('ytsearch'):] or 1)
+        entries = []
+        for i in range(count):
+            video_id = _digest(f"{query}|{i}")[:11]
+            entries.append({
+                'title': f"{query} explained (part {i + 1})",
+                'url': f"https://www.youtube.com/watch?v={video_id}",
+            })
+        return {'entries': entries}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def youtube_dl_factory(latency: float = 0.05):
+    """Returns a ydl_factory for YouTubeSearcher that builds FakeYoutubeDL instances."""
+    return lambda opts: FakeYoutubeDL(opts, latency=latency)
+
+
+class FakeNotFound(Exception):
+    """What the fake client raises for an expired upload or context cache, like the API's 404."""
+    code = 404
+
+
+class FakeGenaiClient:
+    """
+    Stand-in for google.genai.Client covering the calls KeyConceptExtractor makes:
+    models.generate_content(_stream), files.upload and caches.create. Names
+    added to `expired` (file URIs or cache names) fail with FakeNotFound.
+    """
+
+    def __init__(self, latency: float = 0.5, concepts: int = 30, stream_chunks: int = 10):
+        self.latency = latency
+        self.concepts = concepts
+        self.stream_chunks = stream_chunks
+        self.calls: List[str] = []
+        self.expired: Set[str] = set()
+        # Unique handle names, even after `calls` is cleared
+        self._handles = itertools.count(1)
+        self.models = SimpleNamespace(
+            generate_content=self._generate_content,
+            generate_content_stream=self._generate_content_stream,
+        )
+        self.files = SimpleNamespace(upload=self._upload)
+        self.caches = SimpleNamespace(create=self._create_cache)
+
+    def _response_text(self, contents) -> str:
+        return concept_response(self.concepts, seed=str(len(repr(contents)) % 97))
+
+    def _check_live(self, contents, config) -> None:
+        names = {getattr(config, 'cached_content', None)}
+        names.update(getattr(getattr(part, 'file_data', None), 'file_uri', None) for part in contents)
+        expired = names & self.expired
+        if expired:
+            raise FakeNotFound(f"404 NOT_FOUND: {expired.pop()}")
+
+    def _generate_content(self, model, contents, config=None):
+        self.calls.append('generate_content')
+        self._check_live(contents, config)
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self._response_text(contents))
+
+    def _generate_content_stream(self, model, contents, config=None):
+        self.calls.append('generate_content_stream')
+        self._check_live(contents, config)
+        text = self._response_text(contents)
+        step = max(1, len(text) // self.stream_chunks)
+        for start in range(0, len(text), step):
+            time.sleep(self.latency / self.stream_chunks)
+            yield SimpleNamespace(text=text[start:start + step])
+
+    def _upload(self, file, config=None):
+        self.calls.append('files.upload')
+        time.sleep(self.latency / 5)
+        name = f"files/{_digest(str(next(self._handles)))[:12]}"
+        return SimpleNamespace(name=name, uri=f"https://fake.invalid/{name}",
+                               mime_type='application/pdf', expiration_time=None)
+
+    def _create_cache(self, model, config=None):
+        self.calls.append('caches.create')
+        time.sleep(self.latency / 5)
+        return SimpleNamespace(name=f"cachedContents/{next(self._handles)}", expire_time=None)
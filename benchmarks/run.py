@@ -0,0 +1,229 @@
+"""
+Offline benchmark suite for StudyBud.
+
+Runs entirely without network access: yt-dlp and Gemini are replaced by the
+deterministic stand-ins in benchmarks/fakes.py, with configurable latency.
+For each database size it builds a synthetic database and measures
+throughput and p50/p99 latency of the hot paths, then writes all results to
+a JSON file so runs can be compared:
+
+    python benchmarks/run.py --sizes 1k,100k --output benchmarks/results/latest.json
+    python benchmarks/run.py --sizes 1m --yt-latency-ms 20
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import concept_response, youtube_dl_factory  # noqa: E402
+from synthetic import SIZES, build_database, file_hash_for  # noqa: E402
+from hash_check import PDFDuplicateChecker, concept_cache  # noqa: E402
+from rate_limit import Backend  # noqa: E402
+from search_cache import SearchCache  # noqa: E402
+from storage import close_all  # noqa: E402
+from storage_backends import BACKEND_KINDS, create_backend, get_backend  # noqa: E402
+from stringextractor import StringExtractor  # noqa: E402
+from video_storage import VideoStorage, video_cache  # noqa: E402
+from youtube import YouTubeSearcher  # noqa: E402
+
+
+def measure(name: str, func, iterations: int, ops_per_call: int = 1, setup=None) -> dict:
+    """
+    Call `func(i)` `iterations` times and summarize latency and throughput.
+    `setup()`, if given, runs untimed before each call.
+    """
+    durations = []
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func(i)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    total = sum(durations)
+    result = {
+        'benchmark': name,
+        'iterations': iterations,
+        'p50_ms': durations[len(durations) // 2] * 1000,
+        'p99_ms': durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000,
+        'mean_ms': total / iterations * 1000,
+        'throughput_per_s': iterations * ops_per_call / total if total else None,
+    }
+    print(f"  {name:<42} p50 {result['p50_ms']:9.3f} ms   p99 {result['p99_ms']:9.3f} ms   "
+          f"{result['throughput_per_s']:>12,.1f} ops/s")
+    return result
+
+
+def clear_caches() -> None:
+    """Empty the in-process lookup caches, so reads measure the database rather than memory."""
+    video_cache.clear()
+    concept_cache.clear()
+
+
+def bench_database(db_path: str, size: int, iterations: int) -> list:
+    rng = random.Random(7)
+    results = []
+    # The synthetic database is a single SQLite file, whatever STUDYBUD_STORAGE says
+    backend = get_backend(db_path, 'sqlite')
+    storage = VideoStorage(db_path, backend)
+    checker = PDFDuplicateChecker(db_path, backend)
+
+    results.append(measure(
+        "get_videos_for_file",
+        lambda i: storage.get_videos_for_file(file_hash_for(rng.randrange(size))),
+        iterations, setup=clear_caches
+    ))
+
+    def store(i):
+        videos = {f"Concept {c}": [{'title': f"New {i}-{c}-{v}", 'url': f"https://www.youtube.com/watch?v=n{i}x{c}x{v}"}
+                                   for v in range(2)] for c in range(40)}
+        storage.store_videos_for_file(f"new{i:060d}", videos, filename=f"new_{i}.pdf")
+    results.append(measure("store_videos_for_file (40 concepts x 2)", store, iterations, ops_per_call=80))
+
+    results.append(measure(
+        "check_and_store_key_concepts (hit)",
+        lambda i: checker.check_and_store_key_concepts_for_hash(file_hash_for(rng.randrange(size)), []),
+        iterations, setup=clear_caches
+    ))
+    concepts = [f"Fresh concept {c}" for c in range(30)]
+    results.append(measure(
+        "check_and_store_key_concepts (miss)",
+        lambda i: checker.check_and_store_key_concepts(f"pdf-bytes-{size}-{i}".encode(), concepts),
+        iterations
+    ))
+    return results
+
+
+def bench_backends(tmp: str, iterations: int, threads: int) -> list:
+    """Concurrent document writes (concepts, then videos) against each storage backend."""
+    results = []
+    concepts = [f"Concept {c}" for c in range(30)]
+    for kind in BACKEND_KINDS:
+        db_path = os.path.join(tmp, f"backend_{kind}.db")
+        storage = VideoStorage(db_path, create_backend(kind, db_path))
+        checker = PDFDuplicateChecker(db_path, storage.backend)
+
+        def write_document(i, offset):
+            # Real document hashes, so documents spread over the shards as they would in use
+            file_hash = hashlib.sha256(f"document {offset + i}".encode()).hexdigest()
+            checker.check_and_store_key_concepts_for_hash(file_hash, concepts)
+            storage.store_videos_for_file(file_hash, {
+                concept: [{'title': f"Video {i}-{c}", 'url': f"https://www.youtube.com/watch?v=b{i}x{c}"}]
+                for c, concept in enumerate(concepts[:10])
+            })
+
+        def write_batch(i):
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                list(executor.map(lambda t: write_document(i, t * iterations), range(threads)))
+
+        results.append(measure(f"{kind}: write document ({threads} threads)", write_batch, iterations,
+                               ops_per_call=threads))
+    return results
+
+
+def bench_search(db_path: str, latency: float, concepts: int, iterations: int) -> list:
+    queries = [f"Concept {i}" for i in range(concepts)]
+    # The fake backend needs no rate limit; the app's shared limiter would dominate the timings
+    unlimited = Backend("youtube-bench", rate=1e9, burst=1e9)
+    uncached = YouTubeSearcher(ydl_factory=youtube_dl_factory(latency), backend=unlimited)
+    cache = SearchCache(db_path)
+    cached = YouTubeSearcher(cache=cache, ydl_factory=youtube_dl_factory(latency), backend=unlimited)
+    cached.search_multiple(queries)  # warm the cache
+
+    return [
+        measure(f"search_multiple ({concepts} queries, no cache)",
+                lambda i: uncached.search_multiple(queries), iterations, ops_per_call=concepts),
+        measure(f"search_multiple ({concepts} queries, warm cache)",
+                lambda i: cached.search_multiple(queries), iterations, ops_per_call=concepts),
+    ]
+
+
+def bench_string_extractor(iterations: int) -> list:
+    extractor = StringExtractor()
+    results = []
+    for count in (50, 1_000, 10_000):
+        response = concept_response(count)
+        results.append(measure(f"extract_list_from_string ({count} items)",
+                               lambda i: extractor.extract_list_from_string(response), iterations))
+        chunks = [response[i:i + 64] for i in range(0, len(response), 64)]
+        results.append(measure(f"iter_list_items ({count} items, streamed)",
+                               lambda i: list(extractor.iter_list_items(chunks)), iterations))
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma-separated database sizes from {', '.join(SIZES)}")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per database benchmark")
+    parser.add_argument("--yt-latency-ms", type=float, default=50.0, help="simulated latency per yt-dlp search")
+    parser.add_argument("--concepts", type=int, default=40, help="queries per search_multiple call")
+    parser.add_argument("--writer-threads", type=int, default=8, help="concurrent writers in the backend comparison")
+    parser.add_argument("--output", default=None, help="JSON results file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    started = datetime.now(timezone.utc)
+    report = {
+        'started_at': started.isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': vars(args),
+        'results': [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.sizes.split(','):
+            label = label.strip().lower()
+            size = SIZES[label]
+            db_path = os.path.join(tmp, f"bench_{label}.db")
+            print(f"[{label}] building synthetic database ({size:,} files, {size:,} videos)...")
+            build_seconds = build_database(db_path, size)
+            print(f"[{label}] built in {build_seconds:.1f}s")
+            for result in bench_database(db_path, size, args.iterations):
+                report['results'].append({'size': label, **result})
+            report['results'].append({'size': label, 'benchmark': 'build_database', 'seconds': build_seconds})
+
+        print(f"[backends] {', '.join(BACKEND_KINDS)}")
+        for result in bench_backends(tmp, max(10, args.iterations // 4), args.writer_threads):
+            report['results'].append({'size': None, **result})
+
+        print("[search] fake yt-dlp backend")
+        search_db = os.path.join(tmp, "search.db")
+        for result in bench_search(search_db, args.yt_latency_ms / 1000, args.concepts, max(3, args.iterations // 40)):
+            report['results'].append({'size': None, **result})
+
+        print("[parser] StringExtractor on large responses")
+        for result in bench_string_extractor(max(5, args.iterations // 10)):
+            report['results'].append({'size': None, **result})
+        close_all()
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", started.strftime("%Y%m%dT%H%M%SZ") + ".json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Synthetic StudyBud databases for benchmarks.
+
+`build_database(path, size)` creates `size` files and `size` videos, with each
+file linked to a few videos and concepts, using the application's own schema.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import get_pool  # noqa: E402
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+VIDEOS_PER_FILE = 4
+CONCEPTS_PER_FILE = 5
+BATCH = 50_000
+
+
+def file_hash_for(index: int) -> str:
+    return f"{index:064x}"
+
+
+def build_database(path: str, size: int, seed: int = 42) -> float:
+    """Populate a fresh database at `path`; returns the build time in seconds."""
+    rng = random.Random(seed)
+    concept_count = max(10, size // 20)
+    start = time.perf_counter()
+    pool = get_pool(path)
+    with pool.write() as conn:
+        conn.executemany(
+            "INSERT INTO concepts (id, name) VALUES (?, ?)",
+            ((i + 1, f"Concept {i}") for i in range(concept_count))
+        )
+        for offset in range(0, size, BATCH):
+            batch = range(offset, min(size, offset + BATCH))
+            conn.executemany(
+                "INSERT INTO file_hashes (hash, filename) VALUES (?, ?)",
+                ((file_hash_for(i), f"document_{i}.pdf") for i in batch)
+            )
+            conn.executemany(
+                "INSERT INTO videos (id, url, title, concept) VALUES (?, ?, ?, ?)",
+                ((i + 1, f"https://www.youtube.com/watch?v=v{i:010d}", f"Video {i}", f"Concept {i % concept_count}")
+                 for i in batch)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO file_video_links (file_hash, video_id, concept, position) VALUES (?, ?, ?, ?)",
+                ((file_hash_for(i), rng.randrange(size) + 1, f"Concept {(i + p) % concept_count}", p)
+                 for i in batch for p in range(VIDEOS_PER_FILE))
+            )
+            conn.executemany(
+                "INSERT INTO file_concepts (file_hash, position, concept_id) VALUES (?, ?, ?)",
+                ((file_hash_for(i), p, (i * CONCEPTS_PER_FILE + p) % concept_count + 1)
+                 for i in batch for p in range(CONCEPTS_PER_FILE))
+            )
+    with pool.write() as conn:
+        conn.execute("ANALYZE")
+    return time.perf_counter() - start
@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from gemini import KeyConceptExtractor
+from pdf_pages import select_pages, split_pdf
+from rate_limit import BackendUnavailable
+from stringextractor import StringExtractor
+
+
+def _concept_key(concept: str) -> str:
+    return " ".join(concept.split()).casefold()
+
+
+def merge_concepts(chunk_concepts: List[List[str]], max_concepts: int = 50) -> List[str]:
+    """
+    Merge per-chunk concept lists into one deduplicated, ranked list.
+
+    Concepts found in more chunks rank first; ties go to the concept with the
+    better average position within its chunks, then to the one seen first.
+    The first spelling seen is kept.
+    """
+    stats: Dict[str, dict] = {}
+    for chunk_index, concepts in enumerate(chunk_concepts):
+        seen_in_chunk = set()
+        for position, concept in enumerate(concepts):
+            concept = concept.strip()
+            key = _concept_key(concept)
+            if not key or key in seen_in_chunk:
+                continue
+            seen_in_chunk.add(key)
+            entry = stats.setdefault(key, {
+                'name': concept, 'chunks': 0, 'rank_sum': 0.0, 'first_seen': (chunk_index, position)
+            })
+            entry['chunks'] += 1
+            entry['rank_sum'] += position / max(len(concepts), 1)
+
+    ranked = sorted(
+        stats.values(),
+        key=lambda e: (-e['chunks'], e['rank_sum'] / e['chunks'], e['first_seen'])
+    )
+    return [entry['name'] for entry in ranked[:max_concepts]]
+
+
+class ChunkedConceptExtractor:
+    """
+    Map-reduce concept extraction for large PDFs.
+
+    The PDF is split into page ranges, each chunk is sent to the model
+    concurrently (at most `max_concurrency` requests in flight), and the
+    per-chunk lists are merged and ranked. Documents that fit in one chunk go
+    through the extractor's normal single-request path.
+    """
+
+    def __init__(self, concept_extractor: KeyConceptExtractor, string_extractor: StringExtractor,
+                 pages_per_chunk: int = 40, max_concurrency: int = 4, max_concepts: int = 50,
+                 splitter: Callable[[bytes, int], List[bytes]] = split_pdf):
+        self.concept_extractor = concept_extractor
+        self.string_extractor = string_extractor
+        self.pages_per_chunk = pages_per_chunk
+        self.max_concurrency = max_concurrency
+        self.max_concepts = max_concepts
+        self.splitter = splitter
+
+    def iter_concepts(self, pdf_bytes: bytes, file_hash: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield concepts as they become available. Single-chunk documents are
+        streamed, so each concept is yielded as soon as the model finishes it;
+        chunked documents yield the merged list once every chunk is done.
+        """
+        chunks = self.splitter(pdf_bytes, self.pages_per_chunk)
+        if len(chunks) > 1:
+            yield from self._extract_chunks(chunks) or []
+            return
+
+        if file_hash:
+            stream = self.concept_extractor.stream_with_upload(file_hash, pdf_bytes)
+        else:
+            stream = self.concept_extractor.stream_from_bytes(pdf_bytes)
+        yield from self.string_extractor.iter_list_items(stream)
+
+    def iter_text_concepts(self, prepared: Dict, pdf_bytes: bytes) -> Iterator[str]:
+        """
+        Like iter_concepts, for a document prepared by TextPreExtractor: each
+        chunk of `pages_per_chunk` pages is sent as its cleaned text, plus a PDF
+        of just its scanned pages if it has any.
+        """
+        chunks = self._text_chunks(prepared, pdf_bytes)
+        if len(chunks) > 1:
+            merged = self._extract_chunks(chunks, lambda chunk: self.concept_extractor.extract_from_text(*chunk))
+            yield from merged or []
+            return
+        yield from self.string_extractor.iter_list_items(self.concept_extractor.stream_from_text(*chunks[0]))
+
+    def _text_chunks(self, prepared: Dict, pdf_bytes: bytes) -> List[Tuple[str, Optional[bytes]]]:
+        pages = prepared['pages']
+        scanned_pages = set(prepared['scanned_pages'])
+        chunks = []
+        for start in range(0, len(pages), self.pages_per_chunk):
+            numbers = range(start, min(start + self.pages_per_chunk, len(pages)))
+            text = "\n\n".join(pages[n] for n in numbers if n not in scanned_pages)
+            scanned = [n for n in numbers if n in scanned_pages]
+            chunks.append((text, select_pages(pdf_bytes, scanned) if scanned else None))
+        return chunks
+
+    def extract(self, pdf_bytes: bytes, file_hash: Optional[str] = None) -> Optional[List[str]]:
+        """Return the merged concept list for a PDF, or None if nothing could be parsed."""
+        chunks = self.splitter(pdf_bytes, self.pages_per_chunk)
+        if len(chunks) <= 1:
+            if file_hash:
+                text = self.concept_extractor.extract_with_upload(file_hash, pdf_bytes)
+            else:
+                text = self.concept_extractor.extract_from_bytes(pdf_bytes)
+            return self.string_extractor.extract_list_from_string(text)
+        return self._extract_chunks(chunks)
+
+    def _extract_chunks(self, chunks: list, extract: Optional[Callable[..., str]] = None) -> Optional[List[str]]:
+        extract = extract or self.concept_extractor.extract_from_bytes
+
+        def run(chunk):
+            try:
+                text = extract(chunk)
+                return self.string_extractor.extract_list_from_string(text) or [], None
+            except Exception as e:
+                return [], e
+
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(chunks)),
+                                thread_name_prefix="concept-chunk") as pool:
+            outcomes = list(pool.map(run, chunks))
+
+        # A merge missing any chunk would be stored as if complete; fail so the document is
+        # extracted again later. BackendUnavailable goes first so the job is requeued.
+        failures = [error for _, error in outcomes if error is not None]
+        if failures:
+            raise next((e for e in failures if isinstance(e, BackendUnavailable)), failures[0])
+
+        merged = merge_concepts([concepts for concepts, _ in outcomes], self.max_concepts)
+        return merged or None
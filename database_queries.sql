@@ -2,26 +2,35 @@
 
 -- View all processed files
 -- This shows the hash, original filename, and when it was first added.
-SELECT * FROM files;
+SELECT * FROM file_hashes;
 
 -- View all unique videos stored in the database
 -- This shows every unique video URL, its title, and the concept it was originally found for.
 SELECT * FROM videos;
 
+-- View key concepts per file, in their original order
+SELECT fc.file_hash, fc.position, c.name
+FROM file_concepts fc JOIN concepts c ON c.id = fc.concept_id
+ORDER BY fc.file_hash, fc.position;
+
+-- Most common concepts across all documents
+SELECT name, doc_count FROM concepts ORDER BY doc_count DESC LIMIT 20;
+
 -- View the links between files and videos
--- This table shows which videos are associated with which files.
-SELECT * FROM file_video_links;
+-- This table shows which videos are associated with which files, in display order.
+SELECT * FROM file_video_links ORDER BY file_hash, position;
 
 -- Get all video details for a specific file hash
--- Replace 'YOUR_FILE_HASH_HERE' with an actual hash from the 'files' table.
+-- Replace 'YOUR_FILE_HASH_HERE' with an actual hash from the 'file_hashes' table.
 /*
 SELECT
     f.filename,
-    v.concept,
+    fvl.concept,
     v.title,
     v.url
-FROM files f
+FROM file_hashes f
 JOIN file_video_links fvl ON f.hash = fvl.file_hash
 JOIN videos v ON fvl.video_id = v.id
-WHERE f.hash = 'YOUR_FILE_HASH_HERE';
+WHERE f.hash = 'YOUR_FILE_HASH_HERE'
+ORDER BY fvl.position;
 */
@@ -1,16 +1,42 @@
+import functools
+import io
+import itertools
 import os
 import pathlib
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+import time
+from typing import Callable, Iterator, Optional
+
+from instrumentation import span
+from rate_limit import Backend, BackendUnavailable, scheduler
+from upload_cache import UploadCache
+
+PDF_MIME_TYPE = 'application/pdf'
+# Uploaded files are kept by the Files API for 48 hours
+DEFAULT_FILE_LIFETIME_SECONDS = 48 * 3600
+
+@functools.lru_cache(maxsize=None)
+def _load_env() -> None:
+    """Read .env into the environment once per process."""
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class KeyConceptExtractor:
-    def __init__(self, api_key_env: str = "GEMINI_API_KEY"):
-        load_dotenv()
-        api_key = os.getenv(api_key_env)
-        if not api_key:
-            raise ValueError(f"API key not found in environment variable '{api_key_env}'")
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, api_key_env: str = "GEMINI_API_KEY", client=None,
+                 upload_cache: Optional[UploadCache] = None, cache_ttl_seconds: int = 3600,
+                 backend: Optional[Backend] = None):
+        if client is None:
+            _load_env()
+            api_key = os.getenv(api_key_env)
+            if not api_key:
+                raise ValueError(f"API key not found in environment variable '{api_key_env}'")
+            # google-genai is slow to import, so it is only loaded when a real client is needed
+            from google import genai
+            client = genai.Client(api_key=api_key)
+        self.client = client
+        # Shared rate limit, retries and circuit breaker for every Gemini call in the process
+        self.backend = backend or scheduler.backend("gemini")
+        self.upload_cache = upload_cache
+        self.cache_ttl_seconds = cache_ttl_seconds
         self.model = "gemini-2.5-flash"
         self.prompt = (
             "Identify the key concepts discussed in this document. "
@@ -22,10 +48,152 @@ class KeyConceptExtractor:
         path = pathlib.Path(pdf_path)
         if not (path.exists() and path.suffix == ".pdf"):
             raise FileNotFoundError(f"Invalid PDF path: {pdf_path}")
-        return self.client.models.generate_content(
-            model=self.model,
-            contents=[
-                types.Part.from_bytes(data=path.read_bytes(), mime_type='application/pdf'),
-                self.prompt
-            ]
-        ).text
+        pdf_bytes = path.read_bytes()
+        with span("extract_from_pdf", bytes=len(pdf_bytes)):
+            return self.extract_from_bytes(pdf_bytes)
+
+    def extract_from_bytes(self, pdf_bytes: bytes) -> str:
+        """Extract key concepts from PDF content already held in memory."""
+        return self._generate(self._inline_contents(pdf_bytes))
+
+    def stream_from_bytes(self, pdf_bytes: bytes) -> Iterator[str]:
+        """Like extract_from_bytes, but yields the response text as it is generated."""
+        return self._stream(self._inline_contents(pdf_bytes))
+
+    def extract_from_text(self, text: str, scanned_pdf: Optional[bytes] = None) -> str:
+        """
+        Extract key concepts from text extracted locally from a PDF, plus an
+        optional PDF of the pages that had no text layer.
+        """
+        return self._generate(self._text_contents(text, scanned_pdf))
+
+    def stream_from_text(self, text: str, scanned_pdf: Optional[bytes] = None) -> Iterator[str]:
+        """Like extract_from_text, but yields the response text as it is generated."""
+        return self._stream(self._text_contents(text, scanned_pdf))
+
+    def extract_with_upload(self, file_hash: str, pdf_bytes: bytes) -> str:
+        """
+        Extract key concepts by referencing an uploaded copy of the PDF instead of
+        sending it inline. The upload and its context cache are remembered by
+        document hash, so repeated extractions of the same PDF reuse them until
+        they expire. Falls back to inline extraction when no UploadCache is set.
+        """
+        return self._send_with_upload(file_hash, pdf_bytes, self._generate)
+
+    def stream_with_upload(self, file_hash: str, pdf_bytes: bytes) -> Iterator[str]:
+        """Like extract_with_upload, but yields the response text as it is generated."""
+        return self._send_with_upload(file_hash, pdf_bytes, self._stream)
+
+    def _inline_contents(self, pdf_bytes: bytes) -> list:
+        from google.genai import types
+        return [types.Part.from_bytes(data=pdf_bytes, mime_type=PDF_MIME_TYPE), self.prompt]
+
+    def _text_contents(self, text: str, scanned_pdf: Optional[bytes]) -> list:
+        contents = [f"Document text:\n{text}"]
+        if scanned_pdf:
+            from google.genai import types
+            contents.append("Pages of the same document without extractable text:")
+            contents.append(types.Part.from_bytes(data=scanned_pdf, mime_type=PDF_MIME_TYPE))
+        return contents + [self.prompt]
+
+    def _generate(self, contents: list, config=None) -> str:
+        with span("gemini_request", cache_hit=config is not None, streamed=False):
+            return self.backend.call(
+                lambda: self.client.models.generate_content(model=self.model, contents=contents, config=config).text
+            )
+
+    def _stream(self, contents: list, config=None) -> Iterator[str]:
+        # For streamed requests the span measures time to the first chunk
+        with span("gemini_request", cache_hit=config is not None, streamed=True):
+            def open_stream():
+                stream = iter(self.client.models.generate_content_stream(
+                    model=self.model, contents=contents, config=config
+                ))
+                # Pull the first chunk now so request errors surface here, where they
+                # can be retried or the caller can fall back
+                return stream, next(stream, None)
+            stream, first = self.backend.call(open_stream)
+
+        def texts():
+            for chunk in itertools.chain([first] if first is not None else [], stream):
+                if chunk.text:
+                    yield chunk.text
+        return texts()
+
+    def _send_with_upload(self, file_hash: str, pdf_bytes: bytes, send: Callable):
+        if self.upload_cache is None:
+            return send(self._inline_contents(pdf_bytes))
+
+        cache_name = self.upload_cache.get_context_cache(file_hash, self.model)
+        if cache_name:
+            try:
+                return send(*self._context_cache_request(cache_name))
+            except BackendUnavailable:
+                raise
+            except Exception:
+                # Deleted or expired on the provider side; rebuild below
+                self.upload_cache.forget_context_cache(file_hash)
+
+        uploaded = self.upload_cache.get_file(file_hash)
+        if uploaded:
+            try:
+                return send(*self._file_request(file_hash, uploaded))
+            except BackendUnavailable:
+                raise
+            except Exception:
+                self.upload_cache.forget(file_hash)
+
+        return send(*self._file_request(file_hash, self._upload(file_hash, pdf_bytes)))
+
+    def _upload(self, file_hash: str, pdf_bytes: bytes) -> dict:
+        """Upload the PDF through the Files API and remember the handle."""
+        from google.genai import types
+        uploaded = self.backend.call(
+            self.client.files.upload,
+            file=io.BytesIO(pdf_bytes),
+            config=types.UploadFileConfig(mime_type=PDF_MIME_TYPE, display_name=f"{file_hash}.pdf")
+        )
+        record = {
+            'name': uploaded.name,
+            'uri': uploaded.uri,
+            'mime_type': uploaded.mime_type or PDF_MIME_TYPE,
+        }
+        self.upload_cache.put_file(
+            file_hash, record['name'], record['uri'], record['mime_type'],
+            _expiry_timestamp(uploaded.expiration_time, DEFAULT_FILE_LIFETIME_SECONDS)
+        )
+        return record
+
+    def _file_request(self, file_hash: str, uploaded: dict) -> tuple:
+        """Build a request on an uploaded file, creating a context cache for next time when possible."""
+        from google.genai import types
+        file_part = types.Part.from_uri(file_uri=uploaded['uri'], mime_type=uploaded['mime_type'])
+        try:
+            cache = self.backend.call(
+                self.client.caches.create,
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    contents=[types.Content(role='user', parts=[file_part])],
+                    ttl=f"{self.cache_ttl_seconds}s"
+                )
+            )
+        except Exception:
+            # Context caching has a minimum token count; small PDFs just use the file reference
+            return [file_part, self.prompt], None
+
+        self.upload_cache.put_context_cache(
+            file_hash, self.model, cache.name,
+            _expiry_timestamp(cache.expire_time, self.cache_ttl_seconds)
+        )
+        return self._context_cache_request(cache.name)
+
+    def _context_cache_request(self, cache_name: str) -> tuple:
+        from google.genai import types
+        return [self.prompt], types.GenerateContentConfig(cached_content=cache_name)
+
+
+def _expiry_timestamp(expires, default_lifetime_seconds: int) -> float:
+    """Convert a provider expiry (datetime or None) to a Unix timestamp."""
+    if expires is None:
+        return time.time() + default_lifetime_seconds
+    return expires.timestamp()
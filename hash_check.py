@@ -1,118 +1,164 @@
 import hashlib
-import sqlite3
+
+from typing import List, Optional, Tuple
+
+from instrumentation import span
+from memory_cache import MemoryCache
+from storage import DEFAULT_DB_PATH
+from storage_backends import StorageBackend, get_backend
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Process-wide cache of the key concepts of known documents, keyed by (db_path, file_hash).
+# Only documents present in the database are cached.
+concept_cache = MemoryCache("concepts", max_entries=2048, ttl_seconds=600)
 
 
 class PDFDuplicateChecker:
-    def __init__(self, db_path: str = "file_hashes.db"):
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, backend: Optional[StorageBackend] = None):
         self.db_path = db_path
-        self.conn = None
+        # Shared, process-wide backend chosen by configuration (see storage_backends.py)
+        self.backend = backend or get_backend(db_path)
 
     def __enter__(self):
-        """Enable the use of 'with' statement for safe connection handling."""
-        self.conn = sqlite3.connect(self.db_path)
-        self._create_table()
+        """Enable the use of 'with' statement; storage is owned by the shared backend."""
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Ensure the database connection is closed on exit."""
-        if self.conn:
-            self.conn.close()
-
-    def _create_table(self):
-        with self.conn:
-            self.conn.execute(
-                "CREATE TABLE IF NOT EXISTS file_hashes (hash TEXT PRIMARY KEY, key_concepts TEXT)"
-            )
+        """Nothing to release: the shared backend owns its connections."""
+        pass
 
     def compute_hash(self, file_bytes: bytes) -> str:
         """Compute SHA-256 hash of the given file content."""
-        return hashlib.sha256(file_bytes).hexdigest()
+        return self.compute_hash_stream(file_bytes)
+
+    @staticmethod
+    def compute_hash_stream(source, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+        """
+        Compute SHA-256 hash in fixed-size chunks without copying the data.
+        `source` may be any bytes-like object (bytes, memoryview, an upload's
+        getbuffer()) or a binary file object.
+        """
+        with span("compute_hash") as hash_span:
+            hasher = hashlib.sha256()
+            size = 0
+            if hasattr(source, 'read'):
+                for chunk in iter(lambda: source.read(chunk_size), b''):
+                    hasher.update(chunk)
+                    size += len(chunk)
+            else:
+                view = memoryview(source).cast('B')
+                size = len(view)
+                for start in range(0, size, chunk_size):
+                    hasher.update(view[start:start + chunk_size])
+            hash_span.set(bytes=size)
+            return hasher.hexdigest()
 
     def is_duplicate(self, file_bytes: bytes) -> bool:
         """Check if the file hash exists in the database."""
-        file_hash = self.compute_hash(file_bytes)
-        cursor = self.conn.execute(
-            "SELECT 1 FROM file_hashes WHERE hash = ?", (file_hash,)
-        )
-        return cursor.fetchone() is not None
+        return self.is_duplicate_hash(self.compute_hash(file_bytes))
+
+    def is_duplicate_hash(self, file_hash: str) -> bool:
+        """Check if a precomputed file hash exists in the database."""
+        if concept_cache.get((self.db_path, file_hash)) is not None:
+            return True
+        return self.backend.has_file(file_hash)
 
     def mark_uploaded(self, file_bytes: bytes) -> None:
         """Insert the new file hash into the database."""
-        file_hash = self.compute_hash(file_bytes)
-        with self.conn:
-            self.conn.execute(
-                "INSERT OR IGNORE INTO file_hashes (hash, key_concepts) VALUES (?, NULL)", (file_hash,)
-            )
+        self.mark_uploaded_hash(self.compute_hash(file_bytes))
+
+    def mark_uploaded_hash(self, file_hash: str) -> None:
+        """Insert a precomputed file hash into the database."""
+        self.backend.add_file(file_hash)
 
     def check_and_mark(self, file_bytes: bytes) -> bool:
         """
         Returns True if the file is a duplicate.
         Otherwise, stores it in the database and returns False.
         """
-        if self.is_duplicate(file_bytes):
+        file_hash = self.compute_hash(file_bytes)
+        if self.is_duplicate_hash(file_hash):
             return True
         else:
-            self.mark_uploaded(file_bytes)
+            self.mark_uploaded_hash(file_hash)
             return False
-            
+
     def store_key_concepts(self, file_bytes: bytes, key_concepts: list) -> None:
         """
         Store key concepts for a file in the database.
         """
-        file_hash = self.compute_hash(file_bytes)
-        # Convert list to string for storage
-        key_concepts_str = ', '.join(key_concepts) if key_concepts else ''
-        
-        with self.conn:
-            self.conn.execute(
-                "UPDATE file_hashes SET key_concepts = ? WHERE hash = ?", 
-                (key_concepts_str, file_hash)
-            )
-    
+        self.store_key_concepts_for_hash(self.compute_hash(file_bytes), key_concepts)
+
+    def store_key_concepts_for_hash(self, file_hash: str, key_concepts: list) -> None:
+        """
+        Store key concepts for a precomputed file hash in the database.
+        """
+        self.backend.set_concepts(file_hash, key_concepts or [])
+        concept_cache.invalidate((self.db_path, file_hash))
+
     def get_key_concepts(self, file_bytes: bytes) -> list:
         """
         Retrieve key concepts for a file from the database.
         Returns empty list if not found.
         """
-        file_hash = self.compute_hash(file_bytes)
-        cursor = self.conn.execute(
-            "SELECT key_concepts FROM file_hashes WHERE hash = ?", (file_hash,)
-        )
-        result = cursor.fetchone()
-        
-        if result and result[0]:
-            return result[0].split(', ')
-        return []
-    
+        return self.get_key_concepts_for_hash(self.compute_hash(file_bytes))
+
+    def get_key_concepts_for_hash(self, file_hash: str) -> list:
+        """
+        Retrieve key concepts for a precomputed file hash.
+        Returns empty list if not found.
+        """
+        return self._lookup_concepts(file_hash)[1]
+
+    def _lookup_concepts(self, file_hash: str) -> Tuple[bool, List[str]]:
+        """Return (is_known, key_concepts), from the shared cache when possible."""
+        key = (self.db_path, file_hash)
+        cached = concept_cache.get(key)
+        if cached is not None:
+            return True, list(cached)
+        generation = concept_cache.generation()
+        concepts = self.backend.get_concepts(file_hash)
+        if concepts is None:
+            return False, []
+        concept_cache.put(key, tuple(concepts), generation)
+        return True, concepts
+
     def check_and_store_key_concepts(self, file_bytes: bytes, key_concepts: list) -> tuple:
         """
         Check if the file is a duplicate and store key concepts if it's not.
         Returns (is_duplicate, existing_key_concepts)
         """
-        file_hash = self.compute_hash(file_bytes)
-        cursor = self.conn.execute(
-            "SELECT key_concepts FROM file_hashes WHERE hash = ?", (file_hash,)
-        )
-        result = cursor.fetchone()
-        
-        if result:  # File exists in database
-            existing_concepts = result[0].split(', ') if result[0] else []
-            return (True, existing_concepts)
-        else:
-            # Not a duplicate, store file hash and key concepts
-            key_concepts_str = ', '.join(key_concepts) if key_concepts else ''
-            with self.conn:
-                self.conn.execute(
-                    "INSERT INTO file_hashes (hash, key_concepts) VALUES (?, ?)",
-                    (file_hash, key_concepts_str)
-                )
-            return (False, [])
+        return self.check_and_store_key_concepts_for_hash(self.compute_hash(file_bytes), key_concepts)
 
-    def close(self):
-        """Close the database connection."""
-        if self.conn:
-            self.conn.close()
+    def check_and_store_key_concepts_for_hash(self, file_hash: str, key_concepts: list) -> tuple:
+        """
+        Same as check_and_store_key_concepts, for a precomputed file hash.
+        Returns (is_duplicate, existing_key_concepts)
+        """
+        known, concepts = self._lookup_concepts(file_hash)
+        if known:
+            # File exists in database
+            return (True, concepts)
+
+        # The backend re-checks atomically, so concurrent sessions insert only once
+        existing = self.backend.add_file_with_concepts(file_hash, key_concepts or [])
+        if existing is not None:
+            return (True, existing)
+        concept_cache.invalidate((self.db_path, file_hash))
+        return (False, [])
+
+    def find_documents_by_concept(self, concept: str, limit: int = 100) -> List[str]:
+        """
+        Return hashes of documents whose key concepts include `concept`
+        (case-insensitive). Served from the concept -> file index.
+        """
+        return self.backend.find_files_by_concept(concept, limit)
+
+    def top_concepts(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """Return the most common concepts across all documents as (concept, document_count)."""
+        return self.backend.top_concepts(limit)
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
+        """Kept for API compatibility; the shared backend owns the connections."""
+        pass
@@ -0,0 +1,208 @@
+"""
+Pre-process a folder of PDFs from the command line, so students opening any
+of them later get stored concepts and videos immediately:
+
+    python ingest.py path/to/course --workers 4 --search-workers 8
+
+Files are hashed in a process pool and documents already in the database are
+skipped. New ones run through the same pipeline as the app (concept extraction,
+then video search). Progress is checkpointed to a JSON file after every
+document, so an interrupted run resumes where it stopped.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from gemini import KeyConceptExtractor
+from hash_check import PDFDuplicateChecker
+from pdf_text import TextPreExtractor
+from pipeline import StudyPipeline
+from search_cache import SearchCache
+from storage import DEFAULT_DB_PATH, get_pool
+from storage_backends import get_backend
+from stringextractor import StringExtractor
+from upload_cache import UploadCache
+from youtube import YouTubeSearcher
+
+DEFAULT_CHECKPOINT = ".ingest_checkpoint.json"
+
+
+def find_pdfs(root: str) -> List[str]:
+    """Return every PDF under `root`, sorted so runs process files in the same order."""
+    paths = []
+    for directory, _, files in os.walk(root):
+        paths.extend(os.path.join(directory, name) for name in files if name.lower().endswith(".pdf"))
+    return sorted(paths)
+
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return PDFDuplicateChecker.compute_hash_stream(f)
+
+
+def try_hash_file(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """hash_file, returning (hash, None) or (None, error) so one unreadable file cannot stop a run."""
+    try:
+        return hash_file(path), None
+    except OSError as e:
+        return None, str(e)
+
+
+class Checkpoint:
+    """
+    Per-file progress saved as JSON: path -> size, mtime, hash and status.
+    A file whose size and mtime are unchanged and whose status is final is
+    not even hashed again on the next run.
+    """
+
+    FINAL_STATUSES = ('done', 'known', 'empty')
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries: Dict[str, Dict] = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def is_finished(self, path: str) -> bool:
+        entry = self.entries.get(path)
+        if not entry or entry['status'] not in self.FINAL_STATUSES:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+    def record(self, path: str, file_hash: Optional[str], status: str, **details) -> None:
+        try:
+            stat = os.stat(path)
+            size, mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            # The file vanished; its entry is still recorded, and never counts as finished
+            size = mtime = None
+        with self._lock:
+            self.entries[path] = {
+                'size': size, 'mtime': mtime, 'hash': file_hash, 'status': status, **details
+            }
+            # Write to a temporary file and swap it in, so an interruption never leaves a torn checkpoint
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(temp_path, self.path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", help="directory to scan for PDFs (recursively)")
+    parser.add_argument("--workers", type=int, default=4, help="documents extracted concurrently")
+    parser.add_argument("--search-workers", type=int, default=8, help="concurrent YouTube searches per document")
+    parser.add_argument("--hash-processes", type=int, default=os.cpu_count() or 2, help="processes used for hashing")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="progress file used to resume runs")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database to fill")
+    parser.add_argument("--send-pdf", action="store_true",
+                        help="send whole PDFs to the model instead of locally extracted text")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    checkpoint = Checkpoint(args.checkpoint)
+    paths = [p for p in find_pdfs(args.folder) if not checkpoint.is_finished(p)]
+    print(f"{len(paths)} PDFs to check ({len(checkpoint.entries)} in checkpoint)")
+
+    with ProcessPoolExecutor(max_workers=args.hash_processes) as executor:
+        hashed = dict(zip(paths, executor.map(try_hash_file, paths, chunksize=8)))
+    hashes = {}
+    unreadable = 0
+    for path, (file_hash, error) in hashed.items():
+        if error is None:
+            hashes[path] = file_hash
+        else:
+            # Failed files are not final, so the next run tries them again
+            unreadable += 1
+            print(f"FAILED {path}: {error}")
+            checkpoint.record(path, None, 'failed', error=error)
+
+    # Run migrations once before the workers start, on the shard files too
+    get_pool(args.db)
+    get_backend(args.db)
+    duplicate_checker = PDFDuplicateChecker(args.db)
+    new_documents = {}
+    for path, file_hash in hashes.items():
+        # Partially processed documents go through the pipeline again, which searches only what is missing
+        retry = checkpoint.entries.get(path, {}).get('status') == 'partial'
+        if not retry and duplicate_checker.get_key_concepts_for_hash(file_hash):
+            checkpoint.record(path, file_hash, 'known')
+        else:
+            # Identical copies in the folder are processed once
+            new_documents.setdefault(file_hash, []).append(path)
+    print(f"{len(hashes) - sum(map(len, new_documents.values()))} already known, {len(new_documents)} new documents"
+          + (f", {unreadable} unreadable" if unreadable else ""))
+
+    pipeline = StudyPipeline(
+        KeyConceptExtractor(upload_cache=UploadCache(args.db)),
+        StringExtractor(),
+        YouTubeSearcher(max_workers=args.search_workers, cache=SearchCache(args.db)),
+        db_path=args.db,
+        text_pre_extractor=None if args.send_pdf else TextPreExtractor(args.db),
+    )
+
+    def process(file_hash: str, path: str) -> Dict:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        return pipeline.process_document(file_hash, pdf_bytes, os.path.basename(path))
+
+    processed = failed = 0
+    bytes_saved = tokens_saved = 0
+    with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="ingest") as executor:
+        futures = {executor.submit(process, file_hash, copies[0]): file_hash
+                   for file_hash, copies in new_documents.items()}
+        try:
+            for future in as_completed(futures):
+                file_hash = futures[future]
+                copies = new_documents[file_hash]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"FAILED {copies[0]}: {e}")
+                    for path in copies:
+                        checkpoint.record(path, file_hash, 'failed', error=str(e))
+                    continue
+                processed += 1
+                status = 'done' if result['concepts'] else 'empty'
+                if result['errors']:
+                    # Concepts are stored; a later run searches the failed concepts again
+                    status = 'partial'
+                for path in copies:
+                    checkpoint.record(path, file_hash, status, concepts=len(result['concepts']),
+                                      videos=sum(len(v) for v in result['video_results'].values()))
+                savings = result.get('input_savings')
+                saved = ""
+                if savings:
+                    bytes_saved += savings['bytes_saved']
+                    tokens_saved += savings['tokens_saved']
+                    saved = f", {savings['bytes_saved'] / 1024:,.0f} KB / ~{savings['tokens_saved']:,} tokens saved"
+                elapsed_minutes = (time.perf_counter() - started) / 60
+                print(f"[{processed + failed}/{len(futures)}] {status:<7} {copies[0]} "
+                      f"({len(result['concepts'])} concepts{saved}, {processed / elapsed_minutes:.1f} docs/min)")
+        except KeyboardInterrupt:
+            print("Interrupted; finished documents are saved in the checkpoint. Run again to resume.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            sys.exit(130)
+
+    elapsed = time.perf_counter() - started
+    print(f"Processed {processed} new documents ({failed} failed, {unreadable} unreadable) in {elapsed:.1f}s: "
+          f"{processed / (elapsed / 60) if elapsed else 0:.1f} documents/min")
+    if bytes_saved or tokens_saved:
+        print(f"Sending extracted text saved {bytes_saved / 1e6:.1f} MB and about {tokens_saved:,} input tokens")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Span:
+    """One timed stage. Attributes such as cache_hit or bytes can be set while it runs."""
+
+    def __init__(self, stage: str, **attributes):
+        self.stage = stage
+        self.attributes = dict(attributes)
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict:
+        return {
+            'stage': self.stage,
+            'started_at': self.started_at,
+            'duration_seconds': self.duration,
+            'error': self.error,
+            **self.attributes,
+        }
+
+
+class _StageStats:
+    def __init__(self, reservoir_size: int):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.payload_bytes = 0
+        self.recent = deque(maxlen=reservoir_size)
+
+
+class MetricsRegistry:
+    """Thread-safe aggregation of spans into per-stage latency histograms and counters."""
+
+    def __init__(self, recent_spans: int = 1000, reservoir_size: int = 500):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _StageStats] = {}
+        self._recent = deque(maxlen=recent_spans)
+        self._reservoir_size = reservoir_size
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            stats = self._stages.get(span.stage)
+            if stats is None:
+                stats = self._stages[span.stage] = _StageStats(self._reservoir_size)
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if span.duration <= bound),
+                         len(LATENCY_BUCKETS))
+            stats.bucket_counts[index] += 1
+            stats.count += 1
+            stats.total += span.duration
+            stats.recent.append(span.duration)
+            if span.error:
+                stats.errors += 1
+            cache_hit = span.attributes.get('cache_hit')
+            if cache_hit is True:
+                stats.cache_hits += 1
+            elif cache_hit is False:
+                stats.cache_misses += 1
+            stats.payload_bytes += int(span.attributes.get('bytes') or 0)
+            self._recent.append(span)
+
+    def summary(self) -> List[Dict]:
+        """Per-stage count, latency percentiles, error count, cache hit rate and payload bytes."""
+        rows = []
+        with self._lock:
+            for stage, stats in sorted(self._stages.items()):
+                recent = sorted(stats.recent)
+                lookups = stats.cache_hits + stats.cache_misses
+                rows.append({
+                    'stage': stage,
+                    'count': stats.count,
+                    'p50_ms': _percentile(recent, 0.50) * 1000,
+                    'p95_ms': _percentile(recent, 0.95) * 1000,
+                    'max_ms': (recent[-1] if recent else 0.0) * 1000,
+                    'errors': stats.errors,
+                    'cache_hit_rate': stats.cache_hits / lookups if lookups else None,
+                    'bytes': stats.payload_bytes,
+                })
+        return rows
+
+    def to_prometheus(self) -> str:
+        """Render all stages in the Prometheus text exposition format."""
+        lines = [
+            "# HELP studybud_stage_duration_seconds Time spent in each processing stage.",
+            "# TYPE studybud_stage_duration_seconds histogram",
+        ]
+        counters = []
+        with self._lock:
+            for stage, stats in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'studybud_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'studybud_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+                lines.append(f'studybud_stage_duration_seconds_sum{{stage="{stage}"}} {stats.total}')
+                lines.append(f'studybud_stage_duration_seconds_count{{stage="{stage}"}} {stats.count}')
+                counters.append((stage, stats))
+
+        for name, help_text, attr in (
+            ("studybud_stage_errors_total", "Stage executions that raised.", "errors"),
+            ("studybud_stage_cache_hits_total", "Stage executions served from a cache.", "cache_hits"),
+            ("studybud_stage_cache_misses_total", "Stage executions that missed a cache.", "cache_misses"),
+            ("studybud_stage_payload_bytes_total", "Bytes processed by each stage.", "payload_bytes"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for stage, stats in counters:
+                lines.append(f'{name}{{stage="{stage}"}} {getattr(stats, attr)}')
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self) -> str:
+        """Render the most recent spans, one JSON object per line."""
+        with self._lock:
+            spans = list(self._recent)
+        return "".join(json.dumps(span.to_dict()) + "\n" for span in spans)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+# Process-wide registry shared by every session
+registry = MetricsRegistry()
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[Span]:
+    """Time a block of code as one stage, recording it even if the block raises."""
+    current = Span(stage, **attributes)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        registry.record(current)
+
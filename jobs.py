@@ -0,0 +1,226 @@
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from instrumentation import span
+from rate_limit import BackendUnavailable
+from storage import DEFAULT_DB_PATH, get_pool
+
+# Job states; a job is unfinished while queued or running
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+class Job:
+    """A claimed job as seen by its handler: its input, plus a way to report progress."""
+
+    def __init__(self, queue: 'JobQueue', job_id: int, kind: str, payload: Dict,
+                 data: Optional[bytes], attempts: int):
+        self.queue = queue
+        self.id = job_id
+        self.kind = kind
+        self.payload = payload
+        self.data = data
+        self.attempts = attempts
+        self._last_progress = None
+
+    def progress(self, stage: str, fraction: float, partial: Optional[Dict] = None) -> None:
+        """
+        Record the current stage, completion (0-1) and optionally a partial result for pollers.
+        Each write takes the database's write lock, so updates within one stage are
+        written at most once per the queue's `progress_interval`; a new stage always is.
+        """
+        now = time.monotonic()
+        if self._last_progress is not None:
+            last_stage, last_time = self._last_progress
+            if stage == last_stage and now - last_time < self.queue.progress_interval:
+                return
+        self._last_progress = (stage, now)
+        self.queue._update_progress(self.id, stage, fraction, partial)
+
+
+class JobQueue:
+    """
+    Background jobs persisted in the `jobs` table and run by a pool of worker threads.
+
+    `submit()` stores a job and returns its id straight away; the UI polls
+    `get()` for status, stage, progress and (partial) results. Each kind of job
+    has a handler that receives a `Job` and returns a JSON-serializable result.
+
+    Running jobs hold a lease that a heartbeat thread renews. A job whose lease
+    has expired, because its process stopped or was restarted, is claimed
+    again by any worker, so unfinished work resumes after a restart; after
+    `max_attempts` such attempts it is marked failed instead. Jobs failing
+    with BackendUnavailable are requeued after the suggested delay, up to
+    `max_attempts`.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[Job], Dict]], db_path: str = DEFAULT_DB_PATH,
+                 workers: int = 4, lease_seconds: float = 60, max_attempts: int = 3,
+                 poll_interval: float = 2.0, progress_interval: float = 1.0):
+        self.handlers = handlers
+        self.db_path = db_path
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        # The UI polls job status once a second; more frequent progress writes go unseen
+        self.progress_interval = progress_interval
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.pool = get_pool(db_path)
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, kind: str, payload: Dict, data: Optional[bytes] = None,
+               dedupe_key: Optional[str] = None) -> int:
+        """
+        Queue a job and return its id. If an unfinished job with the same
+        `dedupe_key` exists, its id is returned instead, so sessions asking for
+        the same work share one job.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = time.time()
+        with self.pool.write() as conn:
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)",
+                    (dedupe_key, QUEUED, RUNNING)
+                ).fetchone()
+                if row:
+                    return row[0]
+            job_id = conn.execute("""
+                INSERT INTO jobs (kind, dedupe_key, status, payload, data, created_at, updated_at, run_after)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (kind, dedupe_key, QUEUED, json.dumps(payload), data, now, now, now)).lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[Dict]:
+        """Return a job's status, stage, progress, result and error, or None if unknown."""
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, stage, progress, result, error, attempts FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'stage': row[3],
+            'progress': row[4] or 0.0,
+            'result': json.loads(row[5]) if row[5] else None,
+            'error': row[6],
+            'attempts': row[7],
+        }
+
+    def start(self) -> 'JobQueue':
+        """Start the worker and heartbeat threads. Unfinished jobs from earlier runs are picked up."""
+        if self._threads:
+            return self
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True))
+        self._threads.append(threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the threads to exit after their current job and wait for them."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self) -> Optional[Job]:
+        now = time.time()
+        with self.pool.write() as conn:
+            # A job whose worker died on every attempt would otherwise be reclaimed forever
+            conn.execute("""
+                UPDATE jobs SET status = ?, error = ?, owner = NULL, lease_expires_at = NULL, data = NULL,
+                    updated_at = ?
+                WHERE status = ? AND lease_expires_at < ? AND attempts >= ?
+            """, (FAILED, f"Worker stopped during each of {self.max_attempts} attempts", now,
+                  RUNNING, now, self.max_attempts))
+            row = conn.execute("""
+                SELECT id, kind, payload, data, attempts FROM jobs
+                WHERE (status = ? AND run_after <= ?) OR (status = ? AND lease_expires_at < ?)
+                ORDER BY id LIMIT 1
+            """, (QUEUED, now, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                UPDATE jobs SET status = ?, owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            """, (RUNNING, self.owner, now + self.lease_seconds, now, row[0]))
+        return Job(self, row[0], row[1], json.loads(row[2]), row[3], row[4] + 1)
+
+    def _update_progress(self, job_id: int, stage: str, fraction: float, partial: Optional[Dict]) -> None:
+        with self.pool.write() as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, progress = ?, result = COALESCE(?, result), updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (stage, fraction, json.dumps(partial) if partial is not None else None, time.time(),
+                 job_id, self.owner)
+            )
+
+    def _finish(self, job: Job, status: str, result: Optional[Dict] = None, error: Optional[str] = None,
+                run_after: Optional[float] = None) -> None:
+        now = time.time()
+        with self.pool.write() as conn:
+            conn.execute("""
+                UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, owner = NULL,
+                    lease_expires_at = NULL, progress = CASE WHEN ? = ? THEN 1.0 ELSE progress END,
+                    data = CASE WHEN ? = ? THEN data ELSE NULL END, run_after = COALESCE(?, run_after),
+                    updated_at = ?
+                WHERE id = ? AND owner = ?
+            """, (status, json.dumps(result) if result is not None else None, error, status, DONE,
+                  status, QUEUED, run_after, now, job.id, self.owner))
+
+    def _run(self, job: Job) -> None:
+        with span("job", kind=job.kind, attempt=job.attempts) as job_span:
+            try:
+                result = self.handlers[job.kind](job)
+            except BackendUnavailable as e:
+                if job.attempts < self.max_attempts:
+                    job_span.set(requeued=True)
+                    self._finish(job, QUEUED, error=str(e), run_after=time.time() + e.retry_after)
+                else:
+                    self._finish(job, FAILED, error=str(e))
+            except Exception as e:
+                job_span.set(failed=True)
+                self._finish(job, FAILED, error=f"{type(e).__name__}: {e}")
+            else:
+                self._finish(job, DONE, result=result)
+
+    def _worker_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stopping.wait(self.lease_seconds / 3):
+            try:
+                with self.pool.write() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status = ?",
+                        (time.time() + self.lease_seconds, self.owner, RUNNING)
+                    )
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
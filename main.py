@@ -1,10 +1,30 @@
 import streamlit as st
-import os
-from youtube import YouTubeSearcher
+from youtube import YouTubeSearcher, thumbnail_url
 from gemini import KeyConceptExtractor
 from stringextractor import StringExtractor
-from hash_check import PDFDuplicateChecker
-from video_storage import VideoStorage
+from hash_check import PDFDuplicateChecker, concept_cache
+from video_storage import VideoStorage, video_cache
+from search_cache import SearchCache
+from storage import get_pool
+from upload_cache import UploadCache
+from instrumentation import registry, span
+from rate_limit import scheduler
+from singleflight import SingleFlight
+from jobs import DONE, FAILED, JobQueue
+from pipeline import StudyPipeline
+from pdf_text import TextPreExtractor
+from maintenance import document_retention_options, start_background
+
+# Thumbnails per page of the video grid
+VIDEOS_PER_PAGE = 8
+# Videos added per "More videos" click, paged from the stored search results
+MORE_VIDEOS_PER_CLICK = 4
+# Progress labels for the stages of background jobs
+JOB_STAGE_LABELS = {
+    'similar': "Checking for similar documents...",
+    'extract': "Extracting key concepts from PDF...",
+    'videos': "Searching YouTube for relevant videos...",
+}
 
 def parse_and_validate_concepts(text: str, max_concepts: int = 50) -> tuple[list, str]:
     """
@@ -45,97 +65,287 @@ def parse_and_validate_concepts(text: str, max_concepts: int = 50) -> tuple[list
     except Exception as e:
         return [], f"❌ Error parsing concepts: {str(e)}"
 
-def handle_pdf_upload(uploaded_file, concept_extractor, string_extractor):
-    """Handles the processing of the uploaded PDF file."""
-    temp_path = f"temp_{uploaded_file.name}"
-    with open(temp_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+def render_concept_preview(placeholder, concepts, num_columns=4):
+    """Renders concepts received so far as disabled buttons while extraction streams in."""
+    with placeholder.container():
+        cols = st.columns(num_columns)
+        for i, concept in enumerate(concepts):
+            with cols[i % num_columns]:
+                st.button(concept, key=f"preview_{len(concepts)}_{i}", disabled=True, use_container_width=True)
 
-    try:
-        with open(temp_path, "rb") as f:
-            file_bytes = f.read()
+def handle_pdf_upload(uploaded_file, job_queue):
+    """
+    Handles the processing of the uploaded PDF file. Known documents are loaded
+    from the database; new ones are queued as a background job.
+    """
+    # Streamlit reruns the script on every interaction; skip re-hashing the same upload
+    upload_id = getattr(uploaded_file, 'file_id', None)
+    if upload_id is not None and st.session_state.get('current_upload_id') == upload_id:
+        return
 
-        with PDFDuplicateChecker() as duplicate_checker:
-            file_hash = duplicate_checker.compute_hash(file_bytes)
+    with span("handle_pdf_upload", bytes=uploaded_file.size, cache_hit=False) as upload_span:
+        try:
+            # Hash once, in chunks, straight from the upload buffer
+            file_hash = PDFDuplicateChecker.compute_hash_stream(uploaded_file.getbuffer())
+            st.session_state.current_upload_id = upload_id
 
             if st.session_state.get('current_file_hash') == file_hash:
                 return
 
-            # Reset state for the new file
-            st.session_state.current_file_hash = file_hash
-            st.session_state.concepts = []
-            st.session_state.video_results = None
-            st.session_state.num_videos_to_show = 4 # Reset video count
+            with PDFDuplicateChecker() as duplicate_checker:
+                # Reset state for the new file
+                st.session_state.current_file_hash = file_hash
+                st.session_state.concepts = []
+                st.session_state.video_results = None
+                st.session_state.video_page = 0
+                st.session_state.playing_video = None
+                st.session_state.active_job = None
+                st.session_state.retry_available = False
 
-            is_duplicate, existing_concepts = duplicate_checker.check_and_store_key_concepts(file_bytes, [])
-            
-            if is_duplicate and existing_concepts:
-                st.info("This PDF has been processed before. Using stored key concepts.")
-                st.session_state.concepts = existing_concepts
-                
-                existing_videos = get_cached_videos(file_hash)
-                if existing_videos:
-                    st.info("Found and loaded previously saved YouTube videos for this document.")
-                    st.session_state.video_results = existing_videos
-            else:
-                with st.spinner("Extracting key concepts from PDF..."):
-                    concepts_text = concept_extractor.extract_from_pdf(temp_path)
-                    extracted_concepts = string_extractor.extract_list_from_string(concepts_text)
-                    if extracted_concepts:
-                        duplicate_checker.store_key_concepts(file_bytes, extracted_concepts)
-                        st.session_state.concepts = extracted_concepts
-                        st.success("Concepts extracted!")
+                is_duplicate, existing_concepts = duplicate_checker.check_and_store_key_concepts_for_hash(file_hash, [])
 
-    except Exception as e:
-        st.error(f"An error occurred during PDF processing: {e}")
-    finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-
-@st.cache_data
-def get_cached_videos(file_hash):
-    """Wrapper to cache database calls for videos."""
-    with VideoStorage() as vs:
-        return vs.get_videos_for_file(file_hash)
-
-def display_video_results(video_results):
-    """Displays video results with a 'Load More' button."""
+                if is_duplicate and existing_concepts:
+                    upload_span.set(cache_hit=True)
+                    st.info("This PDF has been processed before. Using stored key concepts.")
+                    st.session_state.concepts = existing_concepts
+
+                    with VideoStorage() as video_storage:
+                        existing_videos = video_storage.get_videos_for_file(file_hash)
+                    if existing_videos:
+                        st.info("Found and loaded previously saved YouTube videos for this document.")
+                        st.session_state.video_results = existing_videos
+                else:
+                    # Sessions uploading the same PDF share one job
+                    st.session_state.active_job = job_queue.submit(
+                        'pdf', {'file_hash': file_hash, 'filename': uploaded_file.name},
+                        data=uploaded_file.getvalue(), dedupe_key=f"pdf:{file_hash}"
+                    )
+
+        except Exception as e:
+            st.session_state.current_upload_id = None
+            st.session_state.current_file_hash = None
+            st.error(f"An error occurred during PDF processing: {e}")
+
+@st.fragment(run_every=1.0)
+def render_job_progress(job_queue):
+    """
+    Polls the session's background job once a second, showing its stage,
+    progress and the concepts found so far. When the job ends its result is
+    applied to the session and the whole app reruns to show it.
+    """
+    job_id = st.session_state.get('active_job')
+    if job_id is None:
+        return
+    job = job_queue.get(job_id)
+    if job is None or job['status'] in (DONE, FAILED):
+        st.session_state.active_job = None
+        apply_job_result(job)
+        st.rerun()
+
+    partial = job['result'] or {}
+    st.progress(job['progress'], text=JOB_STAGE_LABELS.get(job['stage'], "Waiting for a free worker..."))
+    if job['error']:
+        st.caption(f"Retrying after an error: {job['error']}")
+    if partial.get('concepts'):
+        render_concept_preview(st.empty(), partial['concepts'])
+
+def apply_job_result(job):
+    """Copies a finished job's result into the session, with a notice to show after the rerun."""
+    if job is None or job['status'] != DONE:
+        error = job['error'] if job else "the job was lost"
+        st.session_state.job_notice = ('error', f"An error occurred during processing: {error}")
+        st.session_state.retry_available = job is None or job['kind'] == 'pdf'
+        return
+
+    result = job['result']
+    if result.get('file_hash') != st.session_state.current_file_hash:
+        return  # The user has moved on to another document
+
+    notices = []
+    if job['kind'] == 'pdf':
+        st.session_state.concepts = result['concepts']
+        if not result['concepts']:
+            notices.append("No key concepts could be extracted from this PDF.")
+        elif result['similarity'] is not None:
+            notices.append(f"This PDF is {result['similarity']:.0%} similar to one processed before. "
+                           "Using its stored key concepts and videos.")
+        else:
+            notices.append("Concepts extracted!")
+        savings = result.get('input_savings')
+        if savings and savings['bytes_saved'] > 0:
+            notices.append(f"Sent the PDF's text instead of the file: {savings['bytes_saved'] / 1024:,.0f} KB "
+                           f"and about {savings['tokens_saved']:,} input tokens saved.")
+    known = st.session_state.video_results or {}
+    merged = {**known, **result['video_results']}
+    st.session_state.video_results = {c: merged[c] for c in st.session_state.concepts if c in merged} or None
+    if result['errors']:
+        notices.append(f"{len(result['errors'])} searches failed (YouTube may be throttling requests); "
+                       "click Find YouTube Videos to retry them.")
+    st.session_state.job_notice = ('info', " ".join(notices)) if notices else None
+
+def apply_concept_edit(new_concepts):
+    """
+    Replaces the concept list, keeping the videos of concepts that are still
+    present. The edited list is saved for the document and the videos of
+    removed concepts are dropped from its stored links, so a reload (or
+    another session opening the same PDF) sees the same concepts and videos.
+    Added concepts are searched on the next "Find".
+    """
+    removed = [c for c in st.session_state.concepts if c not in new_concepts]
+    st.session_state.concepts = new_concepts
+    if st.session_state.video_results:
+        st.session_state.video_results = {
+            c: v for c, v in st.session_state.video_results.items() if c in new_concepts
+        }
+    file_hash = st.session_state.current_file_hash
+    if file_hash:
+        with PDFDuplicateChecker() as duplicate_checker:
+            duplicate_checker.store_key_concepts_for_hash(file_hash, new_concepts)
+        if removed:
+            with VideoStorage() as video_storage:
+                video_storage.update_videos_for_file(file_hash, removed_concepts=removed)
+
+def display_video_results(video_results, pipeline, job_queue):
+    """Displays the study resource links and the paged video grid."""
     st.subheader("🎬 Study Resources")
-    for concept, videos in video_results.items():
-        st.markdown(f"**{concept}**")
-        for video in videos:
-            st.markdown(f"- [{video['title']}]({video['url']})")
+    total = sum(len(videos) for videos in video_results.values())
+    with st.expander(f"All video links ({total})", expanded=False):
+        # One markdown element rather than one per video
+        lines = []
+        for concept, videos in video_results.items():
+            lines.append(f"**{concept}**")
+            lines.extend(f"- [{video['title']}]({video['url']})" for video in videos)
+        st.markdown("\n".join(lines))
 
     st.markdown("---")
     st.subheader("📺 Watch Videos")
+    render_video_grid(pipeline, job_queue)
 
-    # Flatten all videos to manage display count easily
+def set_video_page(page):
+    st.session_state.video_page = page
+    st.session_state.playing_video = None
+
+def play_video(url):
+    st.session_state.playing_video = url
+
+def load_more_videos(pipeline, job_queue, concept):
+    """
+    Adds the next videos for a concept from its stored search results. Returns
+    True if a background search had to be queued because the stored list is
+    stale or used up.
+    """
+    file_hash = st.session_state.current_file_hash
+    videos = pipeline.more_videos(file_hash, concept, MORE_VIDEOS_PER_CLICK, fetch=False)
+    if videos is None:
+        st.session_state.active_job = job_queue.submit(
+            'search', {'file_hash': file_hash, 'concepts': [concept], 'more': MORE_VIDEOS_PER_CLICK}
+        )
+        return True
+    if len(videos) == len(st.session_state.video_results.get(concept, [])):
+        st.toast(f"No more videos found for {concept}.")
+    st.session_state.video_results[concept] = videos
+    return False
+
+@st.fragment
+def render_video_grid(pipeline, job_queue, num_columns=4):
+    """
+    Paged grid of video thumbnails. As a fragment, paging and playing a video
+    rerun only this grid, not the rest of the app. Videos are shown as static
+    thumbnails and only the one the user clicked is embedded as a player, so
+    the page costs the same however many videos the document has.
+    """
+    video_results = st.session_state.video_results or {}
     all_videos_flat = [(concept, video) for concept, videos in video_results.items() for video in videos]
-    
-    num_to_show = st.session_state.get('num_videos_to_show', 4)
-    videos_to_display = all_videos_flat[:num_to_show]
+    page_count = max(1, -(-len(all_videos_flat) // VIDEOS_PER_PAGE))
+    page = min(st.session_state.get('video_page', 0), page_count - 1)
+    page_videos = all_videos_flat[page * VIDEOS_PER_PAGE:(page + 1) * VIDEOS_PER_PAGE]
 
-    # Display videos grouped by concept
-    displayed_videos_by_concept = {}
-    for concept, video in videos_to_display:
-        if concept not in displayed_videos_by_concept:
-            displayed_videos_by_concept[concept] = []
-        displayed_videos_by_concept[concept].append(video)
+    # Group the page's videos by concept
+    videos_by_concept = {}
+    for concept, video in page_videos:
+        videos_by_concept.setdefault(concept, []).append(video)
 
-    for concept, videos in displayed_videos_by_concept.items():
+    for concept, videos in videos_by_concept.items():
         st.markdown(f"### {concept}")
-        if videos:
-            # Create columns with a max of 4 per row for better layout
-            cols = st.columns(min(len(videos), 4))
-            for i, video in enumerate(videos):
-                with cols[i % 4]:
+        cols = st.columns(num_columns)
+        for i, video in enumerate(videos):
+            with cols[i % num_columns]:
+                if st.session_state.get('playing_video') == video['url']:
                     st.video(video['url'])
-    
-    # 'Load More' button logic
-    if len(all_videos_flat) > num_to_show:
-        if st.button("Load More Videos"):
-            st.session_state.num_videos_to_show += 4
-            st.rerun()
+                else:
+                    thumbnail = thumbnail_url(video['url'])
+                    if thumbnail:
+                        st.image(thumbnail, use_container_width=True)
+                    st.button("▶ Play", key=f"play_{page}_{concept}_{i}", on_click=play_video,
+                              args=(video['url'],), use_container_width=True)
+                st.caption(video['title'])
+        if st.button("➕ More videos", key=f"more_{page}_{concept}",
+                     disabled=st.session_state.active_job is not None):
+            # A queued search shows its progress outside this fragment, so rerun the whole app
+            st.rerun(scope="app" if load_more_videos(pipeline, job_queue, concept) else "fragment")
+
+    if page_count > 1:
+        prev_col, info_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            st.button("◀ Previous", disabled=page == 0, on_click=set_video_page,
+                      args=(page - 1,), use_container_width=True)
+        with info_col:
+            st.caption(f"Page {page + 1} of {page_count} · {len(all_videos_flat)} videos")
+        with next_col:
+            st.button("Next ▶", disabled=page >= page_count - 1, on_click=set_video_page,
+                      args=(page + 1,), use_container_width=True)
+
+def render_diagnostics_sidebar():
+    """Optional sidebar with per-stage latency, cache hit rates and metric exports."""
+    with st.sidebar:
+        if not st.checkbox("Show diagnostics", value=False):
+            return
+        st.subheader("⏱️ Stage timings")
+        summary = registry.summary()
+        if not summary:
+            st.caption("No stages recorded yet.")
+            return
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        st.subheader("🗄️ Caches")
+        cache_stats = [video_cache.stats(), concept_cache.stats()]
+        search_cache = get_pipeline().youtube_searcher.cache
+        if search_cache is not None:
+            cache_stats.append(search_cache.stats())
+        st.dataframe(cache_stats, use_container_width=True, hide_index=True)
+        st.subheader("🚦 Outbound calls")
+        st.dataframe(scheduler.stats(), use_container_width=True, hide_index=True)
+        st.download_button("Prometheus metrics", registry.to_prometheus(),
+                           file_name="studybud_metrics.prom", mime="text/plain")
+        st.download_button("Recent spans (JSON lines)", registry.to_json_lines(),
+                           file_name="studybud_spans.jsonl", mime="application/x-ndjson")
+
+@st.cache_resource
+def get_pipeline():
+    """
+    Creates the concept extractor, string extractor and YouTube searcher once
+    per process. They are thread-safe, so every browser session shares the
+    same clients and database pool.
+    """
+    get_pool()  # Opens the shared database and runs schema setup
+    return StudyPipeline(
+        KeyConceptExtractor(upload_cache=UploadCache()),
+        StringExtractor(),
+        YouTubeSearcher(cache=SearchCache(), flight=SingleFlight()),
+        text_pre_extractor=TextPreExtractor(),
+    )
+
+@st.cache_resource
+def get_job_queue():
+    """
+    Starts the background job queue, shared by every session, once per process.
+    Starting the queue resumes jobs left unfinished by an earlier run.
+    """
+    return JobQueue(get_pipeline().handlers()).start()
+
+@st.cache_resource
+def start_compaction():
+    """Starts periodic database compaction once per process."""
+    return start_background(**document_retention_options())
 
 def main():
     st.set_page_config(page_title="StudyBud", page_icon="📚", layout="wide")
@@ -147,34 +357,41 @@ def main():
         ('concepts', []),
         ('current_file_hash', None),
         ('video_results', None),
-        ('extractors_loaded', False),
-        ('num_videos_to_show', 4)
+        ('video_page', 0),
+        ('playing_video', None),
+        ('active_job', None),
+        ('job_notice', None),
+        ('retry_available', False)
     ]:
         if key not in st.session_state:
             st.session_state[key] = default_value
 
-    # Initialize heavy objects once
-    if not st.session_state.extractors_loaded:
-        try:
-            st.session_state.concept_extractor = KeyConceptExtractor()
-            st.session_state.string_extractor = StringExtractor()
-            st.session_state.youtube_searcher = YouTubeSearcher()
-            st.session_state.extractors_loaded = True
-        except Exception as e:
-            st.error(f"Error initializing core components: {e}")
-            st.session_state.extractors_loaded = False
-    
-    if not st.session_state.extractors_loaded:
+    # Shared, process-wide components (created on the first run of any session)
+    try:
+        pipeline = get_pipeline()
+        job_queue = get_job_queue()
+        start_compaction()
+    except Exception as e:
+        st.error(f"Error initializing core components: {e}")
         return
 
-    concept_extractor = st.session_state.concept_extractor
-    string_extractor = st.session_state.string_extractor
-    youtube_searcher = st.session_state.youtube_searcher
-
     # --- Main App Layout ---
     uploaded_file = st.file_uploader("Upload a PDF file", type=["pdf"])
     if uploaded_file:
-        handle_pdf_upload(uploaded_file, concept_extractor, string_extractor)
+        handle_pdf_upload(uploaded_file, job_queue)
+
+    if st.session_state.active_job is not None:
+        render_job_progress(job_queue)
+    notice = st.session_state.job_notice
+    if notice:
+        (st.error if notice[0] == 'error' else st.info)(notice[1])
+        st.session_state.job_notice = None
+    if st.session_state.retry_available and st.button("🔄 Retry processing"):
+        # Forget the upload so the next run hashes it again and queues a new job
+        st.session_state.current_upload_id = None
+        st.session_state.current_file_hash = None
+        st.session_state.retry_available = False
+        st.rerun()
 
 
 
@@ -186,9 +403,7 @@ def main():
         for i, concept in enumerate(st.session_state.concepts[:]):
             with cols[i % num_columns]:
                 if st.button(f"❌ {concept}", key=f"remove_{concept}_{i}", use_container_width=True):
-                    st.session_state.concepts.remove(concept)
-                    st.session_state.video_results = None  # Invalidate video results
-                    st.session_state.num_videos_to_show = 4 # Reset
+                    apply_concept_edit([c for c in st.session_state.concepts if c != concept])
                     st.rerun()
 
         # Bulk Edit Section
@@ -213,9 +428,7 @@ def main():
                     if error_msg:
                         st.error(error_msg)
                     else:
-                        st.session_state.concepts = validated_concepts
-                        st.session_state.video_results = None  # Invalidate video results
-                        st.session_state.num_videos_to_show = 4  # Reset
+                        apply_concept_edit(validated_concepts)
                         st.success(f"✅ Updated! {len(validated_concepts)} concepts saved.")
                         st.rerun()
             
@@ -223,23 +436,25 @@ def main():
                 if st.button("🔄 Reset", use_container_width=True):
                     st.rerun()
 
-        if st.button("Find YouTube Videos"):
-            if not st.session_state.video_results:
-                with st.spinner("Searching YouTube for relevant videos..."):
-                    video_results = youtube_searcher.search_multiple(st.session_state.concepts)
-                    st.session_state.video_results = video_results
-                    
-                    if st.session_state.current_file_hash:
-                        with VideoStorage() as video_storage:
-                            video_storage.store_videos_for_file(
-                                st.session_state.current_file_hash,
-                                video_results,
-                                filename=uploaded_file.name if 'uploaded_file' in locals() else None
-                            )
+        searching = st.session_state.active_job is not None
+        if st.button("Find YouTube Videos", disabled=searching):
+            # Only concepts without results are searched; the rest keep their videos
+            known = st.session_state.video_results or {}
+            missing = [c for c in st.session_state.concepts if c not in known]
+            if missing:
+                st.session_state.active_job = job_queue.submit('search', {
+                    'file_hash': st.session_state.current_file_hash,
+                    'concepts': missing,
+                    'filename': uploaded_file.name if uploaded_file else None,
+                })
+                st.rerun()
     
     # Display videos if they exist in the session state
     if st.session_state.video_results:
-        display_video_results(st.session_state.video_results)
+        display_video_results(st.session_state.video_results, pipeline, job_queue)
+
+    # Rendered last so it includes the stages recorded during this run
+    render_diagnostics_sidebar()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,276 @@
+"""
+Database compaction: applies the retention policy to documents, caches and
+job history, removes rows nothing refers to any more, and returns free pages
+to the file system a few at a time. Run it from the command line:
+
+    python maintenance.py --db file_hashes.db --job-retention-days 7 --max-documents 50000
+
+or in the background with `start_background()`, as the app does. Each step is
+its own short write transaction, so readers and the app keep running. With the
+sharded storage backend every shard file is compacted too.
+"""
+import argparse
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from hash_check import concept_cache
+from instrumentation import span
+from jobs import DONE, FAILED
+from search_cache import SearchCache
+from storage import DEFAULT_DB_PATH, get_pool
+from storage_backends import get_backend
+from video_storage import video_cache
+
+# Finished jobs are kept this long for status polls, then deleted
+JOB_RETENTION_SECONDS = 7 * 24 * 3600
+# Free pages released per run; bounded so a run never holds the lock for long
+VACUUM_PAGES_PER_RUN = 1000
+# Documents are kept forever unless these are set (see document_retention_options)
+DOCUMENT_RETENTION_DAYS_ENV = "STUDYBUD_DOCUMENT_RETENTION_DAYS"
+MAX_DOCUMENTS_ENV = "STUDYBUD_MAX_DOCUMENTS"
+# Rows examined per index by ANALYZE, keeping it cheap on large databases
+ANALYSIS_LIMIT = 400
+
+# Each statement removes one kind of row that nothing refers to any more. These
+# run in every file that holds documents (the shards, with the sharded backend).
+ORPHAN_QUERIES = {
+    'links': "DELETE FROM file_video_links WHERE file_hash NOT IN (SELECT hash FROM file_hashes) "
+             "OR video_id NOT IN (SELECT id FROM videos)",
+    'videos': "DELETE FROM videos WHERE NOT EXISTS "
+              "(SELECT 1 FROM file_video_links fvl WHERE fvl.video_id = videos.id)",
+    'file_concepts': "DELETE FROM file_concepts WHERE file_hash NOT IN (SELECT hash FROM file_hashes)",
+    'concepts': "DELETE FROM concepts WHERE doc_count <= 0",
+}
+# Per-document rows kept in the main database, whichever files hold the documents;
+# {documents} selects the hash of every stored document
+DOCUMENT_DATA_QUERIES = {
+    'signatures': "DELETE FROM doc_signatures WHERE file_hash NOT IN ({documents})",
+    'lsh_buckets': "DELETE FROM lsh_buckets WHERE file_hash NOT IN (SELECT file_hash FROM doc_signatures)",
+    'document_texts': "DELETE FROM document_texts WHERE file_hash NOT IN ({documents})",
+}
+
+
+def _delete(pool, query: str, params: tuple = ()) -> int:
+    with pool.write() as conn:
+        return conn.execute(query, params).rowcount
+
+
+def _sum_counts(reports: Iterable[Dict[str, int]]) -> Dict[str, int]:
+    total = {}
+    for report in reports:
+        for name, count in report.items():
+            total[name] = total.get(name, 0) + count
+    return total
+
+
+def _collect_document_data(db_path: str, document_paths: List[str]) -> Dict[str, int]:
+    """
+    Delete the main database's signatures, LSH buckets and cleaned texts of
+    documents that no longer exist in any of `document_paths`. Documents kept
+    only in memory cannot be listed, so nothing is collected for them.
+    """
+    if not document_paths:
+        return dict.fromkeys(DOCUMENT_DATA_QUERIES, 0)
+    pool = get_pool(db_path)
+    if [os.path.abspath(path) for path in document_paths] == [os.path.abspath(db_path)]:
+        return {name: _delete(pool, query.format(documents="SELECT hash FROM file_hashes"))
+                for name, query in DOCUMENT_DATA_QUERIES.items()}
+
+    # Hashes are gathered under the main write lock: a signature or text is written
+    # after its document, so every row present now belongs to a hash read below
+    with pool.write() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS known_documents (hash TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM temp.known_documents")
+        for path in document_paths:
+            with get_pool(path).read() as shard:
+                conn.executemany("INSERT OR IGNORE INTO temp.known_documents (hash) VALUES (?)",
+                                 shard.execute("SELECT hash FROM file_hashes"))
+        removed = {name: conn.execute(query.format(documents="SELECT hash FROM temp.known_documents")).rowcount
+                   for name, query in DOCUMENT_DATA_QUERIES.items()}
+        conn.execute("DELETE FROM temp.known_documents")
+    return removed
+
+
+def collect_garbage(db_path: str = DEFAULT_DB_PATH) -> Dict[str, int]:
+    """
+    Delete orphaned rows and return how many of each kind were removed.
+    Videos, links and concepts are collected in each file holding the storage
+    backend's documents; the main database's per-document rows are checked
+    against the documents of all of those files.
+    """
+    document_paths = get_backend(db_path).db_paths()
+    removed = _sum_counts(
+        {name: _delete(get_pool(path), query) for name, query in ORPHAN_QUERIES.items()}
+        for path in document_paths
+    ) or dict.fromkeys(ORPHAN_QUERIES, 0)
+    removed.update(_collect_document_data(db_path, document_paths))
+    if any(removed.values()):
+        _clear_document_caches()
+    return removed
+
+
+def _clear_document_caches() -> None:
+    """Drop this process's cached lookups, which may name rows just deleted."""
+    video_cache.clear()
+    concept_cache.clear()
+
+
+def document_retention_options() -> Dict[str, Optional[float]]:
+    """The document retention configured by environment variables; unset keeps every document."""
+    days = os.getenv(DOCUMENT_RETENTION_DAYS_ENV)
+    max_documents = os.getenv(MAX_DOCUMENTS_ENV)
+    return {
+        'document_retention_seconds': float(days) * 86400 if days else None,
+        'max_documents': int(max_documents) if max_documents else None,
+    }
+
+
+def apply_document_retention(db_path: str = DEFAULT_DB_PATH, retention_seconds: Optional[float] = None,
+                             max_documents: Optional[int] = None) -> int:
+    """
+    Delete documents first seen more than `retention_seconds` ago, then the
+    oldest ones beyond `max_documents` (documents first seen at the same time
+    as the last one kept are kept too). Only the document rows are deleted
+    here; `collect_garbage` then removes their concepts, links, videos and
+    per-document data. Returns the number of documents deleted.
+    """
+    document_paths = get_backend(db_path).db_paths()
+    removed = 0
+    if retention_seconds is not None:
+        for path in document_paths:
+            removed += _delete(get_pool(path), "DELETE FROM file_hashes WHERE created_at < datetime(?, 'unixepoch')",
+                               (time.time() - retention_seconds,))
+    if max_documents is not None:
+        if max_documents < 1:
+            raise ValueError("max_documents must be at least 1")
+        newest = []
+        for path in document_paths:
+            with get_pool(path).read() as conn:
+                newest.extend(created_at for (created_at,) in conn.execute(
+                    "SELECT created_at FROM file_hashes ORDER BY created_at DESC LIMIT ?", (max_documents + 1,)))
+        if len(newest) > max_documents:
+            cutoff = sorted(newest, reverse=True)[max_documents - 1]
+            for path in document_paths:
+                removed += _delete(get_pool(path), "DELETE FROM file_hashes WHERE created_at < ?", (cutoff,))
+    if removed:
+        _clear_document_caches()
+    return removed
+
+
+def apply_retention(db_path: str = DEFAULT_DB_PATH, job_retention_seconds: float = JOB_RETENTION_SECONDS,
+                    search_cache: Optional[SearchCache] = None, document_retention_seconds: Optional[float] = None,
+                    max_documents: Optional[int] = None) -> Dict[str, int]:
+    """
+    Delete documents beyond the document retention policy (see
+    apply_document_retention), finished jobs older than `job_retention_seconds`,
+    expired leases and Gemini upload records, and search results beyond the
+    cache's TTL and size limit. Returns the number of rows removed per kind.
+    """
+    pool = get_pool(db_path)
+    now = time.time()
+    search_cache = search_cache or SearchCache(db_path)
+    return {
+        'documents': apply_document_retention(db_path, document_retention_seconds, max_documents),
+        'jobs': _delete(pool, "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                        (DONE, FAILED, now - job_retention_seconds)),
+        'flight_leases': _delete(pool, "DELETE FROM flight_leases WHERE expires_at <= ?", (now,)),
+        'gemini_uploads': _delete(pool, "DELETE FROM gemini_uploads WHERE file_expires_at <= ? "
+                                        "AND COALESCE(cache_expires_at, 0) <= ?", (now, now)),
+        'search_cache': search_cache.prune(),
+    }
+
+
+def reclaim_space(db_path: str = DEFAULT_DB_PATH, pages: int = VACUUM_PAGES_PER_RUN,
+                  full_vacuum: bool = False) -> Dict[str, int]:
+    """
+    Release up to `pages` free pages and refresh the query planner statistics.
+
+    Incremental vacuuming needs auto_vacuum=INCREMENTAL, which only takes effect
+    after one full VACUUM; `full_vacuum` does that conversion (it rewrites the
+    whole file, so it is left to the command line). Returns the page counts.
+    """
+    pool = get_pool(db_path)
+    with pool.exclusive() as conn:
+        if full_vacuum:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {
+            'free_pages_released': free_before - free_after,
+            'free_pages_left': free_after,
+            'pages': conn.execute("PRAGMA page_count").fetchone()[0],
+        }
+
+
+def compact(db_path: str = DEFAULT_DB_PATH, job_retention_seconds: float = JOB_RETENTION_SECONDS,
+            vacuum_pages: int = VACUUM_PAGES_PER_RUN, full_vacuum: bool = False,
+            document_retention_seconds: Optional[float] = None,
+            max_documents: Optional[int] = None) -> Dict[str, Dict[str, int]]:
+    """Run retention, garbage collection and space reclamation; returns what each step did."""
+    with span("compact") as compact_span:
+        # Retention first, so the data of expired documents is collected in the same pass
+        report = {
+            'retention': apply_retention(db_path, job_retention_seconds, None, document_retention_seconds,
+                                         max_documents),
+            'orphans': collect_garbage(db_path),
+            'space': _sum_counts(reclaim_space(path, vacuum_pages, full_vacuum)
+                                 for path in dict.fromkeys([db_path] + get_backend(db_path).db_paths())),
+        }
+        compact_span.set(rows=sum(report['orphans'].values()) + sum(report['retention'].values()))
+        return report
+
+
+def start_background(db_path: str = DEFAULT_DB_PATH, interval_seconds: float = 6 * 3600,
+                     **options) -> threading.Thread:
+    """Run `compact()` now and then every `interval_seconds` in a daemon thread."""
+    def loop():
+        while True:
+            try:
+                compact(db_path, **options)
+            except Exception as e:
+                print(f"Compaction error: {e}")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=loop, name="db-compaction", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database to compact")
+    parser.add_argument("--job-retention-days", type=float, default=JOB_RETENTION_SECONDS / 86400,
+                        help="keep finished jobs this many days")
+    parser.add_argument("--document-retention-days", type=float,
+                        help=f"delete documents first seen more than this many days ago "
+                             f"(default: ${DOCUMENT_RETENTION_DAYS_ENV}, else keep them)")
+    parser.add_argument("--max-documents", type=int,
+                        help=f"keep at most this many of the newest documents (default: ${MAX_DOCUMENTS_ENV})")
+    parser.add_argument("--vacuum-pages", type=int, default=VACUUM_PAGES_PER_RUN,
+                        help="free pages to release in this run")
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="rewrite the whole file once and switch it to incremental vacuuming")
+    args = parser.parse_args()
+
+    size_before = os.path.getsize(args.db) if os.path.exists(args.db) else 0
+    retention = document_retention_options()
+    if args.document_retention_days is not None:
+        retention['document_retention_seconds'] = args.document_retention_days * 86400
+    if args.max_documents is not None:
+        retention['max_documents'] = args.max_documents
+    report = compact(args.db, args.job_retention_days * 86400, args.vacuum_pages, args.full_vacuum, **retention)
+    for step, counts in report.items():
+        print(f"{step}: " + ", ".join(f"{name}={count}" for name, count in counts.items()))
+    print(f"size: {size_before / 1e6:.2f} MB -> {os.path.getsize(args.db) / 1e6:.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import re
+from array import array
+from typing import List, Optional, Tuple
+
+from storage import DEFAULT_DB_PATH, get_pool
+
+_WORD_PATTERN = re.compile(r"\w+")
+# One-permutation MinHash stores hash // num_perm, so values stay below 2**57
+# and a densified value (value + distance * 2**57) still fits in 64 bits.
+_DENSIFY_STEP = 1 << 57
+
+
+def _hash64(data: bytes, signed: bool = False) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=signed)
+
+
+class NearDuplicateIndex:
+    """
+    Near-duplicate document lookup over extracted PDF text.
+
+    Each document's text is reduced to word shingles and a MinHash signature
+    (one-permutation hashing with rotation densification, so it costs one hash
+    per shingle). Signatures are split into `bands` LSH bands stored as
+    indexed (band, bucket) rows in SQLite. A lookup touches only the documents
+    that share a bucket with the query, then confirms them by estimated Jaccard
+    similarity against `threshold`.
+
+    With the default 32 bands of 4 rows, documents are found as candidates from
+    a similarity of roughly 0.45 upward, so thresholds below that miss matches.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, threshold: float = 0.8,
+                 num_perm: int = 128, bands: int = 32, shingle_size: int = 5,
+                 max_candidates: int = 200):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.db_path = db_path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_candidates = max_candidates
+        self.pool = get_pool(db_path)
+
+    def _shingle_hashes(self, text: str) -> set:
+        words = _WORD_PATTERN.findall(text.casefold())
+        if not words:
+            return set()
+        k = min(self.shingle_size, len(words))
+        return {
+            _hash64(" ".join(words[i:i + k]).encode())
+            for i in range(len(words) - k + 1)
+        }
+
+    def signature_for_text(self, text: str) -> Optional[List[int]]:
+        """Return the MinHash signature of a document's text, or None if it has no words."""
+        hashes = self._shingle_hashes(text)
+        if not hashes:
+            return None
+
+        empty = 1 << 64
+        signature = [empty] * self.num_perm
+        for h in hashes:
+            slot, value = h % self.num_perm, h // self.num_perm
+            if value < signature[slot]:
+                signature[slot] = value
+
+        # Fill empty slots from the next non-empty one so every slot is comparable
+        filled = list(signature)
+        for slot in range(self.num_perm):
+            if signature[slot] == empty:
+                for distance in range(1, self.num_perm):
+                    source = signature[(slot + distance) % self.num_perm]
+                    if source != empty:
+                        filled[slot] = source + distance * _DENSIFY_STEP
+                        break
+        return filled
+
+    def similarity(self, a: List[int], b: List[int]) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for x, y in zip(a, b) if x == y) / self.num_perm
+
+    def _band_buckets(self, signature: List[int]) -> List[Tuple[int, int]]:
+        buckets = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            buckets.append((band, _hash64(array('Q', rows).tobytes(), signed=True)))
+        return buckets
+
+    def add(self, file_hash: str, signature: List[int]) -> None:
+        """Index a document's signature, replacing any earlier one."""
+        buckets = self._band_buckets(signature)
+        with self.pool.write() as conn:
+            previous = conn.execute(
+                "SELECT signature FROM doc_signatures WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+            if previous:
+                conn.executemany(
+                    "DELETE FROM lsh_buckets WHERE band = ? AND bucket = ? AND file_hash = ?",
+                    [(band, bucket, file_hash)
+                     for band, bucket in self._band_buckets(array('Q', previous[0]).tolist())]
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO doc_signatures (file_hash, signature) VALUES (?, ?)",
+                (file_hash, array('Q', signature).tobytes())
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO lsh_buckets (band, bucket, file_hash) VALUES (?, ?, ?)",
+                [(band, bucket, file_hash) for band, bucket in buckets]
+            )
+
+    def find_similar(self, signature: List[int], exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Return (file_hash, similarity) of the most similar indexed document at
+        or above the threshold, or None.
+        """
+        values = ",".join("(?, ?)" for _ in range(self.bands))
+        params = [v for pair in self._band_buckets(signature) for v in pair]
+        with self.pool.read() as conn:
+            # One primary-key probe per band
+            candidates = [row[0] for row in conn.execute(f"""
+                SELECT DISTINCT l.file_hash
+                FROM (VALUES {values}) AS q
+                JOIN lsh_buckets l ON l.band = q.column1 AND l.bucket = q.column2
+                LIMIT ?
+            """, params + [self.max_candidates])]
+            candidates = [c for c in candidates if c != exclude]
+            if not candidates:
+                return None
+            rows = conn.execute(
+                "SELECT file_hash, signature FROM doc_signatures WHERE file_hash IN (SELECT value FROM json_each(?))",
+                (json.dumps(candidates),)
+            ).fetchall()
+
+        best = None
+        for file_hash, blob in rows:
+            score = self.similarity(signature, array('Q', blob).tolist())
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (file_hash, score)
+        return best
+
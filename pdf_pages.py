@@ -0,0 +1,100 @@
+import io
+import re
+from collections import Counter
+from typing import Iterable, List
+
+# A line holding only a page number: "12", "Page 3", "3 / 40", "- 7 -"
+_PAGE_NUMBER_LINE = re.compile(r"^[\s\-–—]*(?:page\s*)?\d+(?:\s*(?:/|of)\s*\d+)?[\s\-–—]*$", re.IGNORECASE)
+_DIGITS = re.compile(r"\d+")
+_HYPHENATED_BREAK = re.compile(r"(\w)-\n(\w)")
+
+
+def split_pdf(pdf_bytes: bytes, pages_per_chunk: int) -> List[bytes]:
+    """
+    Split a PDF into standalone PDFs of at most `pages_per_chunk` pages each.
+    Returns the original bytes as a single chunk when the document is small
+    enough or pypdf is not installed.
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        return [pdf_bytes]
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    if page_count <= pages_per_chunk:
+        return [pdf_bytes]
+
+    chunks = []
+    for start in range(0, page_count, pages_per_chunk):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_chunk]:
+            writer.add_page(page)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        chunks.append(buffer.getvalue())
+    return chunks
+
+
+def extract_page_texts(pdf_bytes: bytes) -> List[str]:
+    """
+    Return the text layer of each page. Scanned pages come back empty, and
+    an empty list is returned when pypdf is not installed or cannot parse the file.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return []
+
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        return [page.extract_text() or '' for page in reader.pages]
+    except Exception:
+        return []
+
+
+def select_pages(pdf_bytes: bytes, page_numbers: Iterable[int]) -> bytes:
+    """Return a standalone PDF holding only the given (0-based) pages."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    writer = PdfWriter()
+    for number in page_numbers:
+        writer.add_page(reader.pages[number])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _line_key(line: str) -> str:
+    # Running headers differ only in their page numbers
+    return _DIGITS.sub("#", " ".join(line.split()).casefold())
+
+
+def strip_boilerplate(page_texts: List[str], edge_lines: int = 3, min_repeat_fraction: float = 0.5) -> List[str]:
+    """
+    Remove running headers and footers from extracted page texts.
+
+    A line among the first or last `edge_lines` of a page is dropped when it
+    repeats, ignoring digits, on at least `min_repeat_fraction` of the pages
+    with text (and on at least three pages), or when it is a bare page number.
+    Whitespace is collapsed and words hyphenated across line breaks rejoined.
+    """
+    pages = [[line for line in text.splitlines() if line.strip()] for text in page_texts]
+    text_pages = sum(1 for lines in pages if lines)
+    edge_counts = Counter()
+    for lines in pages:
+        edge_counts.update({_line_key(line) for line in lines[:edge_lines] + lines[-edge_lines:]})
+    repeated = {key for key, count in edge_counts.items()
+                if count >= max(3, min_repeat_fraction * text_pages)}
+
+    stripped = []
+    for lines in pages:
+        kept = []
+        for i, line in enumerate(lines):
+            at_edge = i < edge_lines or i >= len(lines) - edge_lines
+            if at_edge and (_line_key(line) in repeated or _PAGE_NUMBER_LINE.match(line)):
+                continue
+            kept.append(" ".join(line.split()))
+        stripped.append(_HYPHENATED_BREAK.sub(r"\1\2", "\n".join(kept)))
+    return stripped
@@ -0,0 +1,101 @@
+import json
+import time
+from typing import Dict, List, Optional
+
+from instrumentation import span
+from pdf_pages import extract_page_texts, strip_boilerplate
+from storage import DEFAULT_DB_PATH, get_pool
+
+# Pages with less text than this are treated as scanned and sent as PDF pages
+MIN_PAGE_CHARS = 80
+# Rough token costs used to report savings: Gemini bills each PDF page as an
+# image on top of its text layer, and English text runs about 4 characters per token
+TOKENS_PER_PDF_PAGE = 258
+CHARS_PER_TOKEN = 4
+
+
+class TextPreExtractor:
+    """
+    Local pre-processing of PDFs before concept extraction.
+
+    Text is extracted page by page and running headers, footers and page
+    numbers are stripped, so the model can be sent compact text instead of the
+    whole PDF. Pages without a usable text layer (scans, images) are listed in
+    `scanned_pages` and still sent as PDF pages. When more than
+    `max_scanned_fraction` of the pages are scanned, the document is not worth
+    pre-extracting and `use_text` is False. Results are stored by document hash,
+    so re-extracting a document skips parsing.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, min_page_chars: int = MIN_PAGE_CHARS,
+                 max_scanned_fraction: float = 0.5):
+        self.db_path = db_path
+        self.min_page_chars = min_page_chars
+        self.max_scanned_fraction = max_scanned_fraction
+        self.pool = get_pool(db_path)
+
+    def prepare(self, file_hash: str, pdf_bytes: bytes) -> Dict:
+        """
+        Return the document's cleaned text as {pages, scanned_pages, use_text,
+        raw_chars, pdf_bytes}; `pages` holds one string per page ('' for scanned
+        pages) and is empty when the PDF has no text layer or cannot be parsed.
+        """
+        with span("pre_extract", bytes=len(pdf_bytes), cache_hit=False) as extract_span:
+            stored = self._load(file_hash)
+            if stored is not None:
+                extract_span.set(cache_hit=True)
+                pages, raw_chars = stored
+            else:
+                raw_pages = extract_page_texts(pdf_bytes)
+                raw_chars = sum(len(text) for text in raw_pages)
+                pages = [text if len(text) >= self.min_page_chars else ''
+                         for text in strip_boilerplate(raw_pages)]
+                if pages:
+                    self._store(file_hash, pages, raw_chars, len(pdf_bytes))
+
+            scanned_pages = [number for number, text in enumerate(pages) if not text]
+            use_text = bool(pages) and len(scanned_pages) <= self.max_scanned_fraction * len(pages)
+            extract_span.set(pages=len(pages), scanned_pages=len(scanned_pages), use_text=use_text)
+            return {
+                'pages': pages,
+                'scanned_pages': scanned_pages,
+                'use_text': use_text,
+                'raw_chars': raw_chars,
+                'pdf_bytes': len(pdf_bytes),
+            }
+
+    @staticmethod
+    def savings(prepared: Dict) -> Dict[str, int]:
+        """
+        Estimate what sending the prepared text saves over sending the PDF:
+        bytes of request payload and input tokens. Scanned pages are assumed to
+        cost their share of the PDF's bytes and a page's image tokens.
+        """
+        page_count = len(prepared['pages'])
+        scanned = len(prepared['scanned_pages'])
+        text_chars = sum(len(text) for text in prepared['pages'])
+        payload_bytes = (sum(len(text.encode('utf-8')) for text in prepared['pages'])
+                         + prepared['pdf_bytes'] * scanned // max(page_count, 1))
+        pdf_tokens = page_count * TOKENS_PER_PDF_PAGE + prepared['raw_chars'] // CHARS_PER_TOKEN
+        text_tokens = scanned * TOKENS_PER_PDF_PAGE + text_chars // CHARS_PER_TOKEN
+        return {
+            'pdf_bytes': prepared['pdf_bytes'],
+            'payload_bytes': payload_bytes,
+            'bytes_saved': prepared['pdf_bytes'] - payload_bytes,
+            'tokens_saved': pdf_tokens - text_tokens,
+        }
+
+    def _load(self, file_hash: str) -> Optional[tuple]:
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT pages, raw_chars FROM document_texts WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _store(self, file_hash: str, pages: List[str], raw_chars: int, pdf_bytes: int) -> None:
+        with self.pool.write() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO document_texts (file_hash, pages, raw_chars, pdf_bytes, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (file_hash, json.dumps(pages), raw_chars, pdf_bytes, time.time())
+            )
@@ -0,0 +1,191 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from chunked_extraction import ChunkedConceptExtractor
+from gemini import KeyConceptExtractor
+from hash_check import PDFDuplicateChecker
+from instrumentation import span
+from jobs import Job
+from near_duplicate import NearDuplicateIndex
+from pdf_pages import extract_page_texts
+from pdf_text import TextPreExtractor
+from rate_limit import BackendUnavailable
+from storage import DEFAULT_DB_PATH
+from stringextractor import StringExtractor
+from video_storage import VideoStorage
+from youtube import YouTubeSearcher
+
+# Minimum estimated text similarity for reusing another document's results
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+
+def _no_progress(stage: str, fraction: float, partial: Optional[Dict] = None) -> None:
+    pass
+
+
+class StudyPipeline:
+    """
+    The PDF -> key concepts -> videos pipeline, packaged as JobQueue handlers.
+
+    `pdf` jobs take the PDF bytes as job data and a payload with `file_hash`
+    and `filename`. They reuse stored or near-duplicate results when possible,
+    otherwise extract concepts with Gemini (publishing them as a partial
+    result as they stream in), then search and store videos for every concept.
+    With a `text_pre_extractor`, Gemini is sent the PDF's cleaned text instead
+    of the file whenever the document has a usable text layer.
+    `search` jobs search videos for a payload's `concepts` and link them to
+    `file_hash`, or with `more: n` link each concept's next n videos. Failed
+    searches are reported in `errors` and never stored.
+    """
+
+    def __init__(self, concept_extractor: KeyConceptExtractor, string_extractor: StringExtractor,
+                 youtube_searcher: YouTubeSearcher, db_path: str = DEFAULT_DB_PATH,
+                 near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                 text_pre_extractor: Optional[TextPreExtractor] = None):
+        self.concept_extractor = concept_extractor
+        self.string_extractor = string_extractor
+        self.youtube_searcher = youtube_searcher
+        self.db_path = db_path
+        self.near_duplicate_threshold = near_duplicate_threshold
+        # Optional: send cleaned text instead of the PDF when the document has a text layer
+        self.text_pre_extractor = text_pre_extractor
+
+    def handlers(self) -> Dict[str, Callable[[Job], Dict]]:
+        return {'pdf': self.process_pdf, 'search': self.search_videos}
+
+    def process_pdf(self, job: Job) -> Dict:
+        return self.process_document(job.payload['file_hash'], job.data, job.payload.get('filename'), job.progress)
+
+    def process_document(self, file_hash: str, pdf_bytes: bytes, filename: Optional[str] = None,
+                         progress: Callable[..., None] = _no_progress) -> Dict:
+        """
+        Run the whole pipeline for one PDF and return its concepts, videos,
+        search errors, near-duplicate similarity and, when extracted text was
+        sent instead of the PDF, the estimated `input_savings`.
+        `progress(stage, fraction, partial)` is called as the stages advance.
+        """
+        duplicate_checker = PDFDuplicateChecker(self.db_path)
+        duplicate_checker.mark_uploaded_hash(file_hash)
+        result = {'file_hash': file_hash, 'similarity': None, 'input_savings': None}
+
+        # A resumed or repeated job may find the concepts already stored
+        concepts = duplicate_checker.get_key_concepts_for_hash(file_hash)
+        if not concepts:
+            progress('similar', 0.05)
+            prepared = self.text_pre_extractor.prepare(file_hash, pdf_bytes) if self.text_pre_extractor else None
+            page_texts = prepared['pages'] if prepared else extract_page_texts(pdf_bytes)
+            near_duplicate_index = NearDuplicateIndex(self.db_path, threshold=self.near_duplicate_threshold)
+            signature = near_duplicate_index.signature_for_text("\n".join(page_texts))
+            if signature:
+                concepts, result['similarity'] = self._reuse_near_duplicate(
+                    file_hash, signature, near_duplicate_index, duplicate_checker
+                )
+            if not concepts:
+                if prepared and prepared['use_text']:
+                    result['input_savings'] = TextPreExtractor.savings(prepared)
+                else:
+                    prepared = None
+                concepts = self._extract_concepts(file_hash, pdf_bytes, progress, prepared)
+                if concepts:
+                    duplicate_checker.store_key_concepts_for_hash(file_hash, concepts)
+                    if signature:
+                        near_duplicate_index.add(file_hash, signature)
+        result['concepts'] = concepts
+        if not concepts:
+            return {**result, 'video_results': {}, 'errors': {}}
+
+        with VideoStorage(self.db_path) as video_storage:
+            video_results = video_storage.get_videos_for_file(file_hash)
+        missing = [c for c in concepts if c not in video_results]
+        errors = {}
+        if missing:
+            progress('videos', 0.7, {'concepts': concepts})
+            found, errors = self._search_and_store(file_hash, missing, filename)
+            video_results.update(found)
+        result['video_results'] = {c: video_results[c] for c in concepts if c in video_results}
+        result['errors'] = errors
+        return result
+
+    def search_videos(self, job: Job) -> Dict:
+        concepts = job.payload['concepts']
+        job.progress('videos', 0.1)
+        if job.payload.get('more'):
+            file_hash = job.payload['file_hash']
+            video_results, errors = {}, {}
+            for concept in concepts:
+                try:
+                    video_results[concept] = self.more_videos(file_hash, concept, job.payload['more'],
+                                                              job.payload.get('filename'))
+                except BackendUnavailable:
+                    raise
+                except Exception as e:
+                    errors[concept] = str(e)
+            return {'file_hash': file_hash, 'video_results': video_results, 'errors': errors}
+        found, errors = self._search_and_store(job.payload.get('file_hash'), concepts, job.payload.get('filename'))
+        return {'file_hash': job.payload.get('file_hash'), 'video_results': found, 'errors': errors}
+
+    def more_videos(self, file_hash: str, concept: str, limit: int, filename: Optional[str] = None,
+                    fetch: bool = True) -> Optional[List[Dict]]:
+        """
+        Link the next `limit` results of `concept`'s ranked search to the file
+        and return all of the concept's videos. The page comes from the stored
+        search results; with `fetch` false, None is returned when it would need
+        a new search (the stored list is stale or used up).
+        """
+        with VideoStorage(self.db_path) as video_storage:
+            shown = video_storage.get_videos_for_file(file_hash).get(concept, [])
+            page = self.youtube_searcher.search_page(concept, len(shown), limit, fetch)
+            if page is None:
+                return None
+            # A refreshed list may rank videos already shown differently
+            shown_urls = {video['url'] for video in shown}
+            added = [video for video in page if video['url'] not in shown_urls]
+            if added:
+                video_storage.update_videos_for_file(file_hash, added_results={concept: added}, filename=filename)
+        return shown + added
+
+    def _extract_concepts(self, file_hash: str, pdf_bytes: bytes, progress: Callable[..., None],
+                          prepared: Optional[Dict] = None) -> List[str]:
+        progress('extract', 0.1)
+        chunked_extractor = ChunkedConceptExtractor(self.concept_extractor, self.string_extractor)
+        # Covers the whole streamed extraction; gemini_request spans end at the first chunk
+        with span("extract_concepts", bytes=len(pdf_bytes), text=bool(prepared)) as extract_span:
+            if prepared:
+                stream = chunked_extractor.iter_text_concepts(prepared, pdf_bytes)
+            else:
+                stream = chunked_extractor.iter_concepts(pdf_bytes, file_hash)
+            concepts = []
+            for concept in stream:
+                if concept not in concepts:
+                    concepts.append(concept)
+                    # The total is unknown while streaming; approach 0.6 as concepts arrive
+                    progress('extract', 0.1 + 0.5 * len(concepts) / (len(concepts) + 10), {'concepts': concepts})
+            extract_span.set(concepts=len(concepts))
+        return concepts
+
+    def _reuse_near_duplicate(self, file_hash: str, signature: List[int], near_duplicate_index: NearDuplicateIndex,
+                              duplicate_checker: PDFDuplicateChecker) -> Tuple[List[str], Optional[float]]:
+        """Copy the concepts and videos of a similar enough stored document. Returns (concepts, similarity)."""
+        match = near_duplicate_index.find_similar(signature, exclude=file_hash)
+        if not match:
+            return [], None
+        match_hash, similarity = match
+        concepts = duplicate_checker.get_key_concepts_for_hash(match_hash)
+        if not concepts:
+            return [], None
+
+        duplicate_checker.store_key_concepts_for_hash(file_hash, concepts)
+        near_duplicate_index.add(file_hash, signature)
+        with VideoStorage(self.db_path) as video_storage:
+            videos = video_storage.get_videos_for_file(match_hash)
+            if videos:
+                video_storage.store_videos_for_file(file_hash, videos)
+        return concepts, similarity
+
+    def _search_and_store(self, file_hash: Optional[str], concepts: List[str],
+                          filename: Optional[str]) -> Tuple[Dict, Dict[str, str]]:
+        results, errors = self.youtube_searcher.search_multiple_detailed(concepts)
+        found = {c: v for c, v in results.items() if c not in errors}
+        if file_hash and found:
+            with VideoStorage(self.db_path) as video_storage:
+                video_storage.update_videos_for_file(file_hash, added_results=found, filename=filename)
+        return found, errors
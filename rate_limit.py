@@ -0,0 +1,283 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from instrumentation import span
+
+T = TypeVar('T')
+
+# HTTP statuses and error messages that mean "try again later" rather than "this request is wrong"
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_MESSAGE = re.compile(
+    r"\b(?:408|429|500|502|503|504)\b|too many requests|rate.?limit|resource.?exhausted|"
+    r"quota|timed? ?out|temporarily|service unavailable|connection (?:reset|aborted|refused)",
+    re.IGNORECASE
+)
+_THROTTLE_MESSAGE = re.compile(r"\b429\b|too many requests|rate.?limit|resource.?exhausted|quota", re.IGNORECASE)
+_RETRY_DELAY = re.compile(r"retry(?:.?after|.?delay| in)\D{0,6}(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class BackendUnavailable(RuntimeError):
+    """Raised when a backend's circuit is open or a call kept failing after every retry."""
+
+    def __init__(self, backend: str, retry_after: float, reason: str):
+        super().__init__(f"{backend} is unavailable ({reason}); retry in {retry_after:.0f}s")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for attr in ('code', 'status_code', 'status'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, 'response', None)
+    value = getattr(response, 'status_code', None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for throttling, server errors and timeouts; False for errors that will not go away."""
+    code = _status_code(error)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+    return bool(_RETRYABLE_MESSAGE.search(str(error)))
+
+
+def is_throttled(error: BaseException) -> bool:
+    """True if the backend told us to slow down (HTTP 429 or a quota message)."""
+    return _status_code(error) == 429 or bool(_THROTTLE_MESSAGE.search(str(error)))
+
+
+def retry_after_hint(error: BaseException) -> Optional[float]:
+    """Seconds to wait suggested by the backend, from a Retry-After header or a retry delay in the message."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        value = headers.get('retry-after') or headers.get('Retry-After')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            pass
+    match = _RETRY_DELAY.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `rate` tokens per second are added up to
+    `capacity`; `acquire()` blocks until a token is available. The rate can
+    be lowered and raised at runtime for adaptive throttling.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting at most `timeout` seconds. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. It then lets one trial call through (half-open):
+    success closes it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> Optional[float]:
+        """Return None if a call may proceed, otherwise the seconds until the next trial."""
+        with self._lock:
+            if self.state == 'closed':
+                return None
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == 'open' and remaining <= 0:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return None
+            return max(remaining, 1.0)
+
+    def release(self) -> None:
+        """Give up a granted call without an outcome, freeing the half-open trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self._failures >= self.failure_threshold:
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+
+class Backend:
+    """
+    Outbound-call policy for one external service.
+
+    Every call waits for a token from the backend's bucket, passes the circuit
+    breaker, and is retried on throttling, server errors and timeouts with
+    full-jitter exponential backoff, waiting at least as long as a retry-after
+    hint. When the service throttles, the bucket's rate is halved (down to
+    `min_rate`) and then recovers additively with each success, so throughput
+    settles just below what the service accepts instead of collapsing.
+    Errors that retrying cannot fix are raised immediately.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_retries: int = 4,
+                 base_delay: float = 1.0, max_delay: float = 30.0, min_rate: Optional[float] = None,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, max_queue_seconds: float = 60.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue_seconds = max_queue_seconds
+        self.sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.rejected = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, attr: str) -> None:
+        with self._stats_lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hint = retry_after_hint(error)
+        return max(delay, min(hint, self.max_delay * 4)) if hint is not None else delay
+
+    def _adapt(self, throttled: bool) -> None:
+        rate = self.bucket.rate
+        if throttled:
+            self.bucket.set_rate(max(self.min_rate, rate / 2))
+        elif rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, rate + self.max_rate / 10))
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run `func(*args, **kwargs)` under this backend's rate limit, retries and circuit breaker."""
+        attempt = 0
+        while True:
+            wait = self.breaker.allow()
+            if wait is not None:
+                self._count('rejected')
+                raise BackendUnavailable(self.name, wait, "circuit open")
+            if not self.bucket.acquire(timeout=self.max_queue_seconds):
+                self.breaker.release()
+                self._count('rejected')
+                raise BackendUnavailable(self.name, self.max_queue_seconds, "too many queued calls")
+
+            self._count('calls')
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The service answered; the request itself is the problem
+                    self.breaker.record_success()
+                    raise
+                throttled = is_throttled(e)
+                if throttled:
+                    self._count('throttled')
+                self._adapt(throttled)
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise BackendUnavailable(self.name, self._backoff(attempt, e), str(e)) from e
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                self._count('retries')
+                with span("backoff", backend=self.name, attempt=attempt, throttled=throttled):
+                    self.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            self._adapt(False)
+            return result
+
+    def stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                'backend': self.name,
+                'circuit': self.breaker.state,
+                'rate_per_s': round(self.bucket.rate, 3),
+                'calls': self.calls,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'rejected': self.rejected,
+            }
+
+
+class OutboundScheduler:
+    """Process-wide registry of backends, so every session shares one rate limit per service."""
+
+    def __init__(self):
+        self._backends: Dict[str, Backend] = {}
+        self._lock = threading.Lock()
+
+    def register(self, backend: Backend) -> Backend:
+        with self._lock:
+            self._backends[backend.name] = backend
+        return backend
+
+    def backend(self, name: str) -> Backend:
+        with self._lock:
+            return self._backends[name]
+
+    def stats(self) -> list:
+        with self._lock:
+            backends = list(self._backends.values())
+        return [backend.stats() for backend in backends]
+
+
+scheduler = OutboundScheduler()
+# Gemini: a few requests per second. YouTube: one document's concepts (up to 50)
+# may go out as one burst, with sustained load held to 10 searches per second.
+scheduler.register(Backend("gemini", rate=2.0, burst=4, base_delay=2.0, max_delay=60.0))
+scheduler.register(Backend("youtube", rate=10.0, burst=50, base_delay=1.0, max_delay=20.0))
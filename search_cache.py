@@ -0,0 +1,159 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Optional, Iterable
+
+from storage import DEFAULT_DB_PATH, get_pool
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query so equivalent concepts share one cache entry."""
+    return " ".join(query.split()).casefold()
+
+
+class SearchCache:
+    """
+    Persistent, concept-keyed cache of YouTube search results.
+
+    Entries are keyed by the normalized query plus the result count, expire after
+    `ttl_seconds` and are evicted least-recently-used once `max_entries` is exceeded.
+    Results are stored in ranked order, so a deep list also serves smaller
+    counts and pages (see YouTubeSearcher.search_page).
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 10000):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        self.pool = get_pool(db_path)
+
+    def _lookup(self, conn: sqlite3.Connection, query: str, count: int, now: float) -> Optional[tuple]:
+        # The deepest fresh list of at least `count` results; PRIMARY KEY range scan
+        row = conn.execute(
+            "SELECT results, count FROM search_cache WHERE query_key = ? AND count >= ? AND created_at > ? "
+            "ORDER BY count DESC LIMIT 1",
+            (normalize_query(query), count, now - self.ttl_seconds)
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _touch(self, keys: List[tuple], now: float) -> None:
+        # Refresh recency so LRU eviction keeps entries that are still in use
+        with self.pool.write() as conn:
+            conn.executemany(
+                "UPDATE search_cache SET last_used = ? WHERE query_key = ? AND count = ?",
+                [(now, normalize_query(query), count) for query, count in keys]
+            )
+
+    def get_many(self, queries: Iterable[str], count: int) -> Dict[str, List[Dict]]:
+        """
+        Look up cached results for several queries.
+        Returns a dict containing only the queries that were fresh hits. A list
+        stored from a deeper search also serves smaller counts (its top results).
+        """
+        queries = list(queries)
+        now = time.time()
+        found = {}
+        depths = []
+        with self.pool.read() as conn:
+            for query in queries:
+                stored = self._lookup(conn, query, count, now)
+                if stored:
+                    found[query] = stored[0][:count]
+                    depths.append((query, stored[1]))
+
+        if found:
+            self._touch(depths, now)
+
+        with self._stats_lock:
+            self.hits += len(found)
+            self.misses += len(queries) - len(found)
+        return found
+
+    def get(self, query: str, count: int) -> Optional[List[Dict]]:
+        """Return cached results for a single query, or None on a miss."""
+        return self.get_many([query], count).get(query)
+
+    def get_list(self, query: str) -> Optional[tuple]:
+        """
+        Return (results, depth) for the deepest fresh list stored for `query`,
+        where depth is the count it was fetched with, or None on a miss. A list
+        shorter than its depth holds every result the search had.
+        """
+        now = time.time()
+        with self.pool.read() as conn:
+            stored = self._lookup(conn, query, 0, now)
+        if stored:
+            self._touch([(query, stored[1])], now)
+        with self._stats_lock:
+            if stored:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return stored
+
+    def put_many(self, results: Dict[str, List[Dict]], count: int) -> None:
+        """Store search results for several queries and enforce the size bound."""
+        if not results:
+            return
+        now = time.time()
+        rows = [
+            (normalize_query(query), count, json.dumps(videos), now, now)
+            for query, videos in results.items()
+        ]
+        with self.pool.write() as conn:
+            # The newest list replaces every older one for the same query, deeper or not,
+            # so lookups never prefer stale results
+            conn.executemany(
+                "DELETE FROM search_cache WHERE query_key = ?",
+                [(query_key,) for query_key, *_ in rows]
+            )
+            conn.executemany(
+                "INSERT INTO search_cache (query_key, count, results, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict(conn, now)
+
+    def put(self, query: str, count: int, videos: List[Dict]) -> None:
+        """Store search results for a single query."""
+        self.put_many({query: videos}, count)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        conn.execute("DELETE FROM search_cache WHERE created_at <= ?", (now - self.ttl_seconds,))
+        conn.execute("""
+            DELETE FROM search_cache WHERE rowid IN (
+                SELECT rowid FROM search_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,))
+
+    def prune(self) -> int:
+        """Apply the TTL and size limits now and return the number of entries removed."""
+        with self.pool.write() as conn:
+            before = conn.total_changes
+            self._evict(conn, time.time())
+            return conn.total_changes - before
+
+    def clear(self) -> None:
+        """Remove every cached search result."""
+        with self.pool.write() as conn:
+            conn.execute("DELETE FROM search_cache")
+
+    def stats(self) -> Dict:
+        """Return entry count and hit/miss counters for this process."""
+        with self.pool.read() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                'cache': "searches",
+                'entries': entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
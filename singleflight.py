@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from instrumentation import span
+from storage import DEFAULT_DB_PATH, get_pool
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that would do the same work.
+
+    Within a process, the first caller for a key runs the work and concurrent
+    callers for that key wait for its result (or its exception). Across
+    processes sharing the database, the caller that runs the work also holds a
+    lease row in `flight_leases`. A caller that finds another process's lease
+    waits until it is released and then calls `recheck()`, which should read
+    the result the other process stored (e.g. from the database or a cache).
+    It does the work itself only if nothing was stored. Leases expire after
+    `lease_seconds`, so a crashed process cannot block a key forever.
+    `do_many` handles a batch of keys with one lease transaction for all of them.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, lease_seconds: float = 600,
+                 poll_interval: float = 0.25):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.pool = get_pool(db_path)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, func: Callable[[], T], recheck: Optional[Callable[[], Optional[T]]] = None) -> T:
+        """
+        Return `func()`, unless identical work is already running: then wait and
+        return its result. `recheck` returns a result stored by another process,
+        or None if the work still has to be done.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+
+        if not leader:
+            with span("singleflight_wait", key=key.split(":", 1)[0], cache_hit=True):
+                return future.result()
+
+        try:
+            result = self._run_with_lease(key, func, recheck)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def do_many(self, work: Dict[str, Callable[[], T]], store: Optional[Callable[[Dict[str, T]], None]] = None,
+                recheck: Optional[Callable[[str], Optional[T]]] = None, max_workers: int = 1) -> Dict[str, Future]:
+        """
+        Batch form of `do` for independent keys, returning a finished future per
+        key. Keys already running in this process are joined. The leases of the
+        others are taken in one write transaction, their work runs on up to
+        `max_workers` threads, `store` saves every successful result in one
+        call, and the leases are released in one more transaction. Keys leased
+        by another process are then waited for and `recheck(key)`ed as in `do`.
+        """
+        futures, led = {}, []
+        with self._lock:
+            for key in work:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    led.append(key)
+                futures[key] = future
+
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        results = {}
+
+        def run(key):
+            try:
+                if key in leased:
+                    results[key] = work[key]()
+                    futures[key].set_result(results[key])
+                else:
+                    futures[key].set_result(self._run_contested(key, work[key], store, recheck))
+            except Exception as e:
+                futures[key].set_exception(e)
+
+        def run_all(keys):
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keys) or 1)),
+                                    thread_name_prefix="singleflight") as pool:
+                list(pool.map(run, keys))
+
+        try:
+            leased = self._acquire_leases(led, owner)
+            try:
+                run_all([key for key in led if key in leased])
+                if results and store is not None:
+                    # Stored before the leases are released, so waiting processes find the results
+                    store(results)
+            finally:
+                self._release_leases(leased, owner)
+            # Keys leased by other processes are waited for only once this batch holds
+            # no leases, so two batches waiting on each other's keys cannot deadlock
+            run_all([key for key in led if key not in leased])
+        except BaseException as e:
+            for key in led:
+                if not futures[key].done():
+                    futures[key].set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                for key in led:
+                    del self._inflight[key]
+
+        for future in futures.values():
+            future.exception()  # Wait for keys joined from other callers
+        return futures
+
+    def _run_contested(self, key: str, func: Callable[[], T], store: Optional[Callable[[Dict[str, T]], None]],
+                       recheck: Optional[Callable[[str], Optional[T]]]) -> T:
+        """Run one key of `do_many` that another process held, storing its result before the lease is released."""
+        def lead():
+            value = func()
+            if store is not None:
+                store({key: value})
+            return value
+        # Another process held the key, so recheck even if it has already released it
+        return self._run_with_lease(key, lead, (lambda: recheck(key)) if recheck is not None else None, waited=True)
+
+    def _run_with_lease(self, key: str, func: Callable[[], T], recheck: Optional[Callable[[], Optional[T]]],
+                        waited: bool = False) -> T:
+        owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        while not self._acquire_lease(key, owner):
+            waited = True
+            with span("singleflight_wait", key=key.split(":", 1)[0], cross_process=True):
+                self._wait_for_release(key)
+
+        try:
+            if waited and recheck is not None:
+                # Another process held the lease; use what it stored
+                stored = recheck()
+                if stored is not None:
+                    return stored
+            return func()
+        finally:
+            self._release_leases([key], owner)
+
+    def _acquire_lease(self, key: str, owner: str) -> bool:
+        return key in self._acquire_leases([key], owner)
+
+    def _acquire_leases(self, keys: List[str], owner: str) -> set:
+        """Take the free leases among `keys` in one transaction and return the keys acquired."""
+        if not keys:
+            return set()
+        now = time.time()
+        with self.pool.write() as conn:
+            conn.executemany("DELETE FROM flight_leases WHERE key = ? AND expires_at <= ?",
+                             [(key, now) for key in keys])
+            conn.executemany(
+                "INSERT OR IGNORE INTO flight_leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                [(key, owner, now + self.lease_seconds) for key in keys]
+            )
+            return {key for (key,) in conn.execute(
+                "SELECT key FROM flight_leases WHERE owner = ? AND key IN (SELECT value FROM json_each(?))",
+                (owner, json.dumps(keys))
+            )}
+
+    def _release_leases(self, keys, owner: str) -> None:
+        if keys:
+            with self.pool.write() as conn:
+                conn.executemany("DELETE FROM flight_leases WHERE key = ? AND owner = ?",
+                                 [(key, owner) for key in keys])
+
+    def _wait_for_release(self, key: str) -> None:
+        while True:
+            with self.pool.read() as conn:
+                row = conn.execute(
+                    "SELECT 1 FROM flight_leases WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+            if row is None:
+                return
+            time.sleep(self.poll_interval)
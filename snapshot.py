@@ -0,0 +1,291 @@
+"""
+Portable snapshots of the stored results, for warming a new app instance:
+
+    python snapshot.py export studybud.snapshot.gz --db file_hashes.db
+    python snapshot.py import studybud.snapshot.gz --db file_hashes.db
+
+A snapshot is gzip-compressed JSON lines. The first line is a header naming
+the format and version; every other line is one record, a list starting with
+its kind:
+
+    ["document", hash, filename, created_at, [concept, ...]]
+    ["video", url, title, concept]
+    ["link", file_hash, video_url, concept, position]
+    ["search", query_key, count, results, created_at]
+
+Videos are identified by URL, so snapshots merge into databases with their
+own ids. Records are written in that order, so a link always follows its
+document and video.
+
+Each video is written in the same transaction as the links that reference
+it, so compaction cannot remove it in between; videos no document links are
+not imported. With the sharded storage backend, documents and links are read
+from and written to their shard, and a video goes to each shard that links
+it. Importing into a new shard layout is also how a database is re-sharded.
+
+Import streams the file and applies records in batches, each in its own
+short write transaction, so readers keep running. Nothing already stored
+is overwritten: known documents keep their concepts, and a search result
+replaces every local list for its query only if it is newer. Importing the same snapshot
+twice therefore changes nothing.
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from hash_check import concept_cache
+from instrumentation import span
+from storage import DEFAULT_DB_PATH, get_pool, write_many_file_concepts
+from storage_backends import get_backend
+from video_storage import video_cache
+
+SNAPSHOT_FORMAT = "studybud-snapshot"
+SNAPSHOT_VERSION = 1
+# Records applied per write transaction
+IMPORT_BATCH_SIZE = 20000
+
+RECORD_KINDS = ('document', 'video', 'link', 'search')
+
+_EXPORT_QUERIES = {
+    # Documents with their concepts in order; documents with neither concepts nor videos are left out
+    'document': """
+        SELECT h.hash, h.filename, h.created_at,
+               (SELECT json_group_array(name) FROM (
+                    SELECT COALESCE(fc.name, c.name) AS name FROM file_concepts fc JOIN concepts c ON c.id = fc.concept_id
+                    WHERE fc.file_hash = h.hash ORDER BY fc.position))
+        FROM file_hashes h
+        WHERE EXISTS (SELECT 1 FROM file_concepts fc WHERE fc.file_hash = h.hash)
+           OR EXISTS (SELECT 1 FROM file_video_links fvl WHERE fvl.file_hash = h.hash)
+    """,
+    'video': "SELECT url, title, concept FROM videos ORDER BY id",
+    'link': """
+        SELECT fvl.file_hash, v.url, fvl.concept, fvl.position
+        FROM file_video_links fvl JOIN videos v ON v.id = fvl.video_id
+        ORDER BY fvl.file_hash, fvl.position
+    """,
+    'search': "SELECT query_key, count, results, created_at FROM search_cache",
+}
+
+
+def export_snapshot(path: str, db_path: str = DEFAULT_DB_PATH, include_search_cache: bool = True) -> Dict[str, int]:
+    """Write a snapshot of the database to `path` and return the number of records of each kind."""
+    pool = get_pool(db_path)
+    document_paths = _document_paths(db_path)
+    counts = {kind: 0 for kind in RECORD_KINDS}
+    kinds = RECORD_KINDS if include_search_cache else RECORD_KINDS[:-1]
+    with span("snapshot_export") as export_span, gzip.open(path, "wt", compresslevel=6, encoding="utf-8") as out, \
+            contextlib.ExitStack() as stack:
+        header = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'schema_version': pool.schema_version,
+            'created_at': time.time(),
+        }
+        out.write(json.dumps(header) + "\n")
+        # One read transaction per file, so the records form a consistent snapshot
+        conns = {}
+        for source in dict.fromkeys([db_path] + document_paths):
+            conns[source] = stack.enter_context(get_pool(source).read())
+            conns[source].execute("BEGIN")
+            stack.callback(conns[source].rollback)
+        for kind in kinds:
+            # A video linked in several shards is exported once per shard; import merges them by URL
+            for source in ([db_path] if kind == 'search' else document_paths):
+                for row in conns[source].execute(_EXPORT_QUERIES[kind]):
+                    row = list(row)
+                    if kind == 'document':
+                        row[3] = [name for name in json.loads(row[3]) if name is not None]
+                    elif kind == 'search':
+                        row[2] = json.loads(row[2])
+                    out.write(json.dumps([kind] + row, separators=(",", ":")) + "\n")
+                    counts[kind] += 1
+        export_span.set(records=sum(counts.values()))
+    return counts
+
+
+def _document_paths(db_path: str) -> List[str]:
+    """The database files the configured storage backend keeps documents in."""
+    paths = get_backend(db_path).db_paths()
+    if not paths:
+        raise ValueError("The configured storage backend keeps no database files to snapshot")
+    return paths
+
+
+def read_snapshot(path: str) -> Iterator[List]:
+    """Yield the records of a snapshot file after checking its header."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get('format') != SNAPSHOT_FORMAT:
+            raise ValueError(f"{path} is not a StudyBud snapshot")
+        if header.get('version', 0) > SNAPSHOT_VERSION:
+            raise ValueError(f"Snapshot version {header['version']} is newer than supported ({SNAPSHOT_VERSION})")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _import_documents(conn, records: List[List]) -> int:
+    hashes = json.dumps([record[1] for record in records])
+    conn.executemany(
+        "INSERT INTO file_hashes (hash, filename, created_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (hash) DO UPDATE SET filename = COALESCE(file_hashes.filename, excluded.filename)",
+        [(file_hash, filename, created_at) for _, file_hash, filename, created_at, _ in records]
+    )
+    # Documents that already have concepts keep them
+    known = {file_hash for (file_hash,) in conn.execute(
+        "SELECT DISTINCT file_hash FROM file_concepts WHERE file_hash IN (SELECT value FROM json_each(?))",
+        (hashes,)
+    )}
+    new_concepts = {}
+    for _, file_hash, _, _, concepts in records:
+        if concepts and file_hash not in known:
+            new_concepts.setdefault(file_hash, concepts)
+    write_many_file_concepts(conn, new_concepts)
+    return len(new_concepts)
+
+
+def _stage_videos(staging: sqlite3.Connection, records: List[List]) -> None:
+    # The first record for a URL wins, as when merging into an existing database
+    staging.executemany(
+        "INSERT INTO videos (url, title, concept) VALUES (?, ?, ?) ON CONFLICT (url) DO NOTHING",
+        [tuple(record[1:]) for record in records]
+    )
+
+
+def _import_links(conn, records: List[List], staging: sqlite3.Connection) -> Tuple[int, int, int]:
+    """
+    Link documents to their videos, upserting the videos in the same transaction
+    so compaction cannot drop them first. Returns the new links, the new videos
+    and the links skipped because their video is neither stored nor in the snapshot.
+    """
+    urls = json.dumps([record[2] for record in records])
+    new_videos = conn.executemany(
+        "INSERT INTO videos (url, title, concept) VALUES (?, ?, ?) ON CONFLICT (url) DO NOTHING",
+        staging.execute("SELECT url, title, concept FROM videos WHERE url IN (SELECT value FROM json_each(?))",
+                        (urls,)).fetchall()
+    ).rowcount
+    video_ids = dict(conn.execute("SELECT url, id FROM videos WHERE url IN (SELECT value FROM json_each(?))", (urls,)))
+    links = [(file_hash, video_ids[url], concept, position)
+             for _, file_hash, url, concept, position in records if url in video_ids]
+    new_links = conn.executemany(
+        "INSERT INTO file_video_links (file_hash, video_id, concept, position) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (file_hash, video_id) DO NOTHING",
+        links
+    ).rowcount
+    return new_links, new_videos, len(records) - len(links)
+
+
+def _import_searches(conn, records: List[List]) -> int:
+    # One list per query, as SearchCache.put_many keeps it: the newest one wins
+    newest = {}
+    for _, query_key, count, results, created_at in records:
+        current = newest.get(query_key)
+        if current is None or (created_at, count) > (current[3], current[1]):
+            newest[query_key] = (query_key, count, json.dumps(results), created_at, created_at)
+    stored = dict(conn.execute(
+        "SELECT query_key, MAX(created_at) FROM search_cache "
+        "WHERE query_key IN (SELECT value FROM json_each(?)) GROUP BY query_key",
+        (json.dumps(list(newest)),)
+    ))
+    rows = [row for query_key, row in newest.items() if query_key not in stored or row[3] > stored[query_key]]
+    conn.executemany("DELETE FROM search_cache WHERE query_key = ?", [(row[0],) for row in rows])
+    conn.executemany(
+        "INSERT INTO search_cache (query_key, count, results, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    return len(rows)
+
+
+def import_snapshot(path: str, db_path: str = DEFAULT_DB_PATH,
+                    batch_size: int = IMPORT_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Merge a snapshot into the database and return the number of new rows of
+    each kind, and under 'skipped_link' the links left out because the
+    snapshot has no record of their video. Records of unknown kinds (from
+    newer minor versions) are skipped.
+    """
+    backend = get_backend(db_path)
+    document_paths = _document_paths(db_path)
+    added = {kind: 0 for kind in RECORD_KINDS}
+    added['skipped_link'] = 0
+    batches: Dict[str, List[List]] = {kind: [] for kind in RECORD_KINDS}
+    # Videos wait here, on disk rather than in memory, until the links that reference them arrive
+    staging = sqlite3.connect("")
+    staging.execute("CREATE TABLE videos (url TEXT PRIMARY KEY, title TEXT, concept TEXT)")
+
+    def targets(kind: str, records: List[List]) -> Dict[str, List[List]]:
+        """Group a batch by the database file each record belongs in."""
+        if kind == 'search':
+            return {db_path: records}
+        grouped = {}
+        for record in records:
+            grouped.setdefault(backend.db_path_for(record[1]), []).append(record)
+        return grouped
+
+    def flush(kind: str) -> None:
+        if kind == 'video':
+            _stage_videos(staging, batches[kind])
+            batches[kind] = []
+            return
+        for target, records in targets(kind, batches[kind]).items():
+            with get_pool(target).write() as conn:
+                if kind == 'document':
+                    added[kind] += _import_documents(conn, records)
+                elif kind == 'link':
+                    links, videos, skipped = _import_links(conn, records, staging)
+                    added['link'] += links
+                    added['video'] += videos
+                    added['skipped_link'] += skipped
+                else:
+                    added[kind] += _import_searches(conn, records)
+        batches[kind] = []
+
+    with span("snapshot_import") as import_span, contextlib.closing(staging):
+        for record in read_snapshot(path):
+            kind = record[0]
+            if kind not in batches:
+                continue
+            batches[kind].append(record)
+            if len(batches[kind]) >= batch_size:
+                # Earlier kinds first, so links never arrive before their documents and videos
+                for pending in RECORD_KINDS:
+                    if batches[pending]:
+                        flush(pending)
+        for kind in RECORD_KINDS:
+            if batches[kind]:
+                flush(kind)
+        import_span.set(records=sum(added.values()), skipped_links=added['skipped_link'])
+
+    # Lookups cached in this process may predate the import
+    video_cache.clear()
+    concept_cache.clear()
+    return added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="snapshot file (gzip-compressed JSON lines)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database to export from or import into")
+    parser.add_argument("--no-search-cache", action="store_true", help="leave search results out of the export")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        counts = export_snapshot(args.path, args.db, include_search_cache=not args.no_search_cache)
+        summary = "exported " + ", ".join(f"{count} {kind} records" for kind, count in counts.items())
+    else:
+        counts = import_snapshot(args.path, args.db)
+        skipped = counts.pop('skipped_link')
+        summary = "imported " + ", ".join(f"{count} new {kind} rows" for kind, count in counts.items())
+        if skipped:
+            summary += f" (skipped {skipped} links whose video is not in the snapshot)"
+    print(f"{summary} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
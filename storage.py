@@ -0,0 +1,514 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List
+
+DEFAULT_DB_PATH = "file_hashes.db"
+
+# Applied to every pooled connection. journal_mode=WAL lets readers run while a
+# single writer commits; synchronous=NORMAL is durable enough under WAL.
+# auto_vacuum only takes effect on new files (or after a VACUUM); it lets
+# maintenance.py return free pages a few at a time.
+CONNECTION_PRAGMAS = (
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+)
+
+
+def _migration_1(conn: sqlite3.Connection) -> None:
+    """Initial schema: file hashes, videos, file/video links and the search cache."""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_hashes (hash TEXT PRIMARY KEY, key_concepts TEXT)"
+    )
+    # Table for storing file information
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            hash TEXT PRIMARY KEY,
+            filename TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Table for storing unique video information
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS videos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            title TEXT,
+            concept TEXT
+        )
+    """)
+    # Linking table for the many-to-many relationship
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_video_links (
+            file_hash TEXT,
+            video_id INTEGER,
+            PRIMARY KEY (file_hash, video_id),
+            FOREIGN KEY (file_hash) REFERENCES files (hash) ON DELETE CASCADE,
+            FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_url ON videos (url)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_file_video_links_file_hash ON file_video_links (file_hash)")
+    # Concept-keyed YouTube search results shared across documents
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS search_cache (
+            query_key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            results TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (query_key, count)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache (last_used)")
+
+
+def _migration_2(conn: sqlite3.Connection) -> None:
+    """Make videos.url unique, folding any duplicate rows into the oldest one."""
+    conn.execute("""
+        CREATE TEMP TABLE duplicate_videos AS
+        SELECT v.id AS id, keep.id AS keep_id
+        FROM videos v
+        JOIN (SELECT url, MIN(id) AS id FROM videos GROUP BY url) keep ON keep.url = v.url
+        WHERE v.id != keep.id
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO file_video_links (file_hash, video_id)
+        SELECT fvl.file_hash, d.keep_id
+        FROM file_video_links fvl JOIN duplicate_videos d ON d.id = fvl.video_id
+    """)
+    conn.execute("DELETE FROM file_video_links WHERE video_id IN (SELECT id FROM duplicate_videos)")
+    conn.execute("DELETE FROM videos WHERE id IN (SELECT id FROM duplicate_videos)")
+    conn.execute("DROP TABLE duplicate_videos")
+    conn.execute("DROP INDEX IF EXISTS idx_videos_url")
+    conn.execute("CREATE UNIQUE INDEX idx_videos_url ON videos (url)")
+
+
+def _migration_3(conn: sqlite3.Connection) -> None:
+    """
+    Normalize key concepts into their own table with an ordered file link table,
+    and move the legacy ', '-joined file_hashes.key_concepts values into it.
+    """
+    conn.execute("""
+        CREATE TABLE concepts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE COLLATE NOCASE,
+            doc_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE file_concepts (
+            file_hash TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            concept_id INTEGER NOT NULL REFERENCES concepts (id),
+            PRIMARY KEY (file_hash, position)
+        ) WITHOUT ROWID
+    """)
+    # Inverted index: concept -> documents
+    conn.execute("CREATE INDEX idx_file_concepts_concept ON file_concepts (concept_id, file_hash)")
+    conn.execute("CREATE INDEX idx_concepts_doc_count ON concepts (doc_count DESC)")
+    # Keep per-concept document counts current so "top concepts" never scans the links
+    conn.execute("""
+        CREATE TRIGGER file_concepts_insert AFTER INSERT ON file_concepts BEGIN
+            UPDATE concepts SET doc_count = doc_count + 1 WHERE id = NEW.concept_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER file_concepts_delete AFTER DELETE ON file_concepts BEGIN
+            UPDATE concepts SET doc_count = doc_count - 1 WHERE id = OLD.concept_id;
+        END
+    """)
+
+    rows = conn.execute(
+        "SELECT hash, key_concepts FROM file_hashes WHERE key_concepts IS NOT NULL AND key_concepts != ''"
+    ).fetchall()
+    for file_hash, key_concepts in rows:
+        write_file_concepts(conn, file_hash, key_concepts.split(', '))
+    conn.execute("UPDATE file_hashes SET key_concepts = NULL")
+
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _nocase_key(name: str) -> str:
+    """Fold ASCII case only, matching SQLite's NOCASE collation."""
+    return name.translate(_ASCII_LOWER)
+
+
+def write_file_concepts(conn: sqlite3.Connection, file_hash: str, concepts: List[str]) -> None:
+    """Replace the ordered concept list stored for a file."""
+    write_many_file_concepts(conn, {file_hash: concepts})
+
+
+def write_many_file_concepts(conn: sqlite3.Connection, concepts_by_file: Dict[str, List[str]]) -> None:
+    """Replace the ordered concept lists of several files with one statement per step."""
+    # A document keeps its own spelling in file_concepts.name; the shared concepts
+    # row (and its case-insensitive match) holds the first spelling stored
+    names_by_file = {}
+    all_names = {}
+    for file_hash, concepts in concepts_by_file.items():
+        names = {}
+        for concept in concepts:
+            concept = concept.strip()
+            if concept:
+                names.setdefault(_nocase_key(concept), concept)
+        names_by_file[file_hash] = names
+        for key, name in names.items():
+            all_names.setdefault(key, name)
+
+    conn.execute(
+        "DELETE FROM file_concepts WHERE file_hash IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(concepts_by_file)),)
+    )
+    if not all_names:
+        return
+    conn.executemany(
+        "INSERT INTO concepts (name) VALUES (?) ON CONFLICT (name) DO NOTHING",
+        [(name,) for name in all_names.values()]
+    )
+    ids = {
+        _nocase_key(name): concept_id
+        for name, concept_id in conn.execute(
+            "SELECT name, id FROM concepts WHERE name IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(all_names.values())),)
+        )
+    }
+    conn.executemany(
+        "INSERT INTO file_concepts (file_hash, position, concept_id, name) VALUES (?, ?, ?, ?)",
+        [(file_hash, position, ids[key], name)
+         for file_hash, names in names_by_file.items() for position, (key, name) in enumerate(names.items())]
+    )
+
+
+def read_file_concepts(conn: sqlite3.Connection, file_hash: str) -> List[str]:
+    """Return the concepts stored for a file, in their original order and spelling."""
+    rows = conn.execute("""
+        SELECT COALESCE(fc.name, c.name)
+        FROM file_concepts fc JOIN concepts c ON c.id = fc.concept_id
+        WHERE fc.file_hash = ?
+        ORDER BY fc.position
+    """, (file_hash,)).fetchall()
+    return [name for (name,) in rows]
+
+
+def _migration_4(conn: sqlite3.Connection) -> None:
+    """Remember Gemini file uploads and context caches per document hash."""
+    conn.execute("""
+        CREATE TABLE gemini_uploads (
+            file_hash TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            file_uri TEXT NOT NULL,
+            mime_type TEXT NOT NULL,
+            file_expires_at REAL NOT NULL,
+            cache_name TEXT,
+            cache_model TEXT,
+            cache_expires_at REAL
+        )
+    """)
+
+
+def _migration_5(conn: sqlite3.Connection) -> None:
+    """MinHash signatures and LSH band buckets for near-duplicate document lookup."""
+    conn.execute("""
+        CREATE TABLE doc_signatures (
+            file_hash TEXT PRIMARY KEY,
+            signature BLOB NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE lsh_buckets (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            file_hash TEXT NOT NULL,
+            PRIMARY KEY (band, bucket, file_hash)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_6(conn: sqlite3.Connection) -> None:
+    """
+    Record on each file-video link the concept it was found for, so a file's
+    videos can be updated one concept at a time. Existing links take the
+    video's original concept.
+    """
+    conn.execute("ALTER TABLE file_video_links ADD COLUMN concept TEXT")
+    conn.execute("""
+        UPDATE file_video_links
+        SET concept = (SELECT v.concept FROM videos v WHERE v.id = file_video_links.video_id)
+    """)
+
+
+def _migration_7(conn: sqlite3.Connection) -> None:
+    """Leases that let one process at a time do a piece of work shared by several."""
+    conn.execute("""
+        CREATE TABLE flight_leases (
+            key TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    """)
+
+
+def _migration_8(conn: sqlite3.Connection) -> None:
+    """Persistent background jobs (see jobs.JobQueue)."""
+    conn.execute("""
+        CREATE TABLE jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            dedupe_key TEXT,
+            status TEXT NOT NULL,
+            stage TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            payload TEXT NOT NULL,
+            data BLOB,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            owner TEXT,
+            lease_expires_at REAL,
+            run_after REAL NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_jobs_status ON jobs (status, run_after)")
+    conn.execute("CREATE INDEX idx_jobs_dedupe_key ON jobs (dedupe_key, status)")
+
+
+def _migration_9(conn: sqlite3.Connection) -> None:
+    """
+    Merge the `files` table into `file_hashes`, so each document has one row
+    with its filename and first-seen time, and give file-video links an
+    explicit position. Both tables become clustered on their primary key, and
+    the link index that only repeated the primary-key prefix is replaced by
+    covering indexes for reading a file's videos in order and finding a
+    video's links.
+    """
+    conn.execute("""
+        CREATE TABLE file_hashes_merged (
+            hash TEXT PRIMARY KEY,
+            filename TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO file_hashes_merged (hash, filename, created_at)
+        SELECT h.hash, f.filename, COALESCE(f.created_at, CURRENT_TIMESTAMP)
+        FROM file_hashes h LEFT JOIN files f ON f.hash = h.hash
+        UNION ALL
+        SELECT f.hash, f.filename, f.created_at
+        FROM files f WHERE f.hash NOT IN (SELECT hash FROM file_hashes)
+    """)
+    conn.execute("""
+        CREATE TABLE file_video_links_ordered (
+            file_hash TEXT NOT NULL REFERENCES file_hashes (hash) ON DELETE CASCADE,
+            video_id INTEGER NOT NULL REFERENCES videos (id) ON DELETE CASCADE,
+            concept TEXT,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (file_hash, video_id)
+        ) WITHOUT ROWID
+    """)
+    # Existing links keep the order they were inserted in
+    conn.execute("""
+        INSERT INTO file_video_links_ordered (file_hash, video_id, concept, position)
+        SELECT fvl.file_hash, fvl.video_id, COALESCE(fvl.concept, v.concept),
+               ROW_NUMBER() OVER (PARTITION BY fvl.file_hash ORDER BY fvl.rowid) - 1
+        FROM file_video_links fvl LEFT JOIN videos v ON v.id = fvl.video_id
+    """)
+    conn.execute("DROP TABLE file_video_links")
+    conn.execute("DROP TABLE files")
+    conn.execute("DROP TABLE file_hashes")
+    conn.execute("ALTER TABLE file_hashes_merged RENAME TO file_hashes")
+    conn.execute("ALTER TABLE file_video_links_ordered RENAME TO file_video_links")
+    # Index entries of a WITHOUT ROWID table carry its primary key (here video_id),
+    # so a file's videos in order are read from this index alone
+    conn.execute("CREATE INDEX idx_file_video_links_order ON file_video_links (file_hash, position, concept)")
+    conn.execute("CREATE INDEX idx_file_video_links_video ON file_video_links (video_id)")
+
+
+def _migration_10(conn: sqlite3.Connection) -> None:
+    """Cleaned page texts extracted locally from each PDF (see pdf_text.TextPreExtractor)."""
+    conn.execute("""
+        CREATE TABLE document_texts (
+            file_hash TEXT PRIMARY KEY,
+            pages TEXT NOT NULL,
+            raw_chars INTEGER NOT NULL,
+            pdf_bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+
+
+def _migration_11(conn: sqlite3.Connection) -> None:
+    """
+    Store each document's own spelling of its concepts. Concepts are shared
+    case-insensitively, so a document used to read back whichever spelling was
+    stored first. Existing rows recover their spelling from the document's
+    video links where one differs only in case; the rest keep the shared name.
+    """
+    conn.execute("ALTER TABLE file_concepts ADD COLUMN name TEXT")
+    conn.execute("""
+        UPDATE file_concepts
+        SET name = (
+            SELECT fvl.concept
+            FROM file_video_links fvl JOIN concepts c ON c.id = file_concepts.concept_id
+            WHERE fvl.file_hash = file_concepts.file_hash
+              AND fvl.concept = c.name COLLATE NOCASE AND fvl.concept != c.name
+            LIMIT 1
+        )
+    """)
+
+
+# Schema migrations, applied in order. Migration N brings the database to
+# PRAGMA user_version N; append new ones, never edit released ones.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Apply any pending migrations and return the resulting schema version."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(MIGRATIONS)
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of SQLite connections to one database file.
+
+    Any number of threads can read concurrently through `read()`; writes go
+    through `write()`, which serializes writers in this process and opens an
+    IMMEDIATE transaction so other processes wait on busy_timeout instead of
+    failing with "database is locked".
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, max_connections: int = 8):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._write_lock = threading.Lock()
+        self._all: List[sqlite3.Connection] = []
+        self._all_lock = threading.Lock()
+
+        conn = self._open()
+        try:
+            self.schema_version = migrate(conn)
+        finally:
+            self._idle.put(conn)
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._all_lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def _checkout(self) -> Iterator[sqlite3.Connection]:
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._open()
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for read-only queries."""
+        with self._checkout() as conn:
+            yield conn
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection inside a single write transaction, committed on exit."""
+        with self._write_lock, self._checkout() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a connection outside any transaction while holding this process's
+        write lock, for statements that cannot run in one (VACUUM, some PRAGMAs).
+        """
+        with self._write_lock, self._checkout() as conn:
+            yield conn
+
+    def close(self) -> None:
+        """Close every connection owned by the pool."""
+        with self._all_lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DEFAULT_DB_PATH) -> ConnectionPool:
+    """
+    Return the shared pool for a database file, creating it (and running
+    schema migrations) the first time the file is used in this process.
+    """
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[key] = pool
+    return pool
+
+
+def close_all() -> None:
+    """Close every shared pool, e.g. at interpreter shutdown or between tests."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
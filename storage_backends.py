@@ -0,0 +1,443 @@
+"""
+Storage backends for documents, their key concepts and their videos.
+
+`PDFDuplicateChecker` and `VideoStorage` keep their caches and public API and
+delegate storage to a backend chosen by configuration:
+
+    STUDYBUD_STORAGE=sqlite    one SQLite file (default)
+    STUDYBUD_STORAGE=memory    process memory only, for tests and benchmarks
+    STUDYBUD_STORAGE=sharded   documents spread over STUDYBUD_SHARDS SQLite files (default 4)
+
+The sharded backend places each document, with its concepts and video links,
+in `file_hashes.shard<i>.db` chosen by a prefix of its hash. Every shard has
+its own pool and writer, so writes for different documents run in parallel
+and each file's indexes stay small. The shard count of an existing database
+must not change; to re-shard, export a snapshot and import it into the new
+layout. Search results, jobs and the other caches stay in the main database.
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from storage import DEFAULT_DB_PATH, _nocase_key, get_pool, read_file_concepts, write_file_concepts
+
+BACKEND_KINDS = ('sqlite', 'memory', 'sharded')
+DEFAULT_SHARDS = 4
+
+
+class StorageBackend(ABC):
+    """
+    Storage of known documents (by hash), their ordered key concepts and the
+    videos linked to them. Concept names are stripped, empty ones dropped and
+    duplicates removed ignoring ASCII case; each document keeps its own
+    spelling. A document's videos are returned grouped by concept in the
+    order they were linked.
+    """
+
+    @abstractmethod
+    def has_file(self, file_hash: str) -> bool:
+        """Whether the document is known."""
+
+    @abstractmethod
+    def add_file(self, file_hash: str, filename: Optional[str] = None) -> None:
+        """Record a document, or fill in its filename if it has none."""
+
+    @abstractmethod
+    def get_concepts(self, file_hash: str) -> Optional[List[str]]:
+        """Return the document's concepts, or None if the document is unknown."""
+
+    @abstractmethod
+    def set_concepts(self, file_hash: str, concepts: List[str]) -> None:
+        """Replace the concepts of a known document; unknown documents are ignored."""
+
+    @abstractmethod
+    def add_file_with_concepts(self, file_hash: str, concepts: List[str]) -> Optional[List[str]]:
+        """
+        Atomically record a new document with its concepts. If the document is
+        already known nothing is written and its stored concepts are returned.
+        """
+
+    @abstractmethod
+    def find_files_by_concept(self, concept: str, limit: int) -> List[str]:
+        """Up to `limit` documents with the concept, matched ignoring ASCII case."""
+
+    @abstractmethod
+    def top_concepts(self, limit: int) -> List[Tuple[str, int]]:
+        """The `limit` concepts found in most documents, with their document counts."""
+
+    @abstractmethod
+    def update_videos(self, file_hash: str, removed_concepts: Iterable[str] = (),
+                      added_results: Optional[Dict[str, List[Dict[str, str]]]] = None,
+                      filename: Optional[str] = None) -> None:
+        """
+        In one transaction, drop the links of `removed_concepts` and link the
+        videos of `added_results` after the existing ones (recording the
+        document if needed). A video linked again moves to its new concept.
+        """
+
+    @abstractmethod
+    def get_videos(self, file_hash: str) -> Dict[str, List[Dict[str, str]]]:
+        """The document's videos grouped by concept, in link order ({} if it has none)."""
+
+    def db_paths(self) -> List[str]:
+        """The database files holding documents (none for the in-memory backend)."""
+        return []
+
+    def db_path_for(self, file_hash: str) -> str:
+        """The database file holding a document."""
+        raise ValueError(f"{type(self).__name__} keeps no database files")
+
+
+class SQLiteBackend(StorageBackend):
+    """All documents in one SQLite file, through its shared connection pool."""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self.pool = get_pool(db_path)
+
+    def has_file(self, file_hash: str) -> bool:
+        with self.pool.read() as conn:
+            return self._has_file(conn, file_hash)
+
+    @staticmethod
+    def _has_file(conn: sqlite3.Connection, file_hash: str) -> bool:
+        return conn.execute("SELECT 1 FROM file_hashes WHERE hash = ?", (file_hash,)).fetchone() is not None
+
+    @staticmethod
+    def _add_file(conn: sqlite3.Connection, file_hash: str, filename: Optional[str] = None) -> None:
+        conn.execute(
+            "INSERT INTO file_hashes (hash, filename) VALUES (?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET filename = COALESCE(file_hashes.filename, excluded.filename)",
+            (file_hash, filename)
+        )
+
+    def add_file(self, file_hash: str, filename: Optional[str] = None) -> None:
+        with self.pool.write() as conn:
+            self._add_file(conn, file_hash, filename)
+
+    def get_concepts(self, file_hash: str) -> Optional[List[str]]:
+        with self.pool.read() as conn:
+            if not self._has_file(conn, file_hash):
+                return None
+            return read_file_concepts(conn, file_hash)
+
+    def set_concepts(self, file_hash: str, concepts: List[str]) -> None:
+        with self.pool.write() as conn:
+            if self._has_file(conn, file_hash):
+                write_file_concepts(conn, file_hash, concepts)
+
+    def add_file_with_concepts(self, file_hash: str, concepts: List[str]) -> Optional[List[str]]:
+        # Checked under the write lock so concurrent sessions insert only once
+        with self.pool.write() as conn:
+            if self._has_file(conn, file_hash):
+                return read_file_concepts(conn, file_hash)
+            conn.execute("INSERT INTO file_hashes (hash) VALUES (?)", (file_hash,))
+            write_file_concepts(conn, file_hash, concepts)
+        return None
+
+    def find_files_by_concept(self, concept: str, limit: int) -> List[str]:
+        with self.pool.read() as conn:
+            rows = conn.execute("""
+                SELECT fc.file_hash
+                FROM concepts c JOIN file_concepts fc ON fc.concept_id = c.id
+                WHERE c.name = ?
+                LIMIT ?
+            """, (concept.strip(), limit)).fetchall()
+        return [file_hash for (file_hash,) in rows]
+
+    def top_concepts(self, limit: int) -> List[Tuple[str, int]]:
+        with self.pool.read() as conn:
+            return conn.execute(
+                "SELECT name, doc_count FROM concepts WHERE doc_count > 0 ORDER BY doc_count DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    @staticmethod
+    def _upsert_videos(conn: sqlite3.Connection, video_results: Dict[str, List[Dict[str, str]]]) -> Dict[str, int]:
+        """
+        Inserts any new videos in one batch and returns a url -> id map for every
+        video in `video_results`. Existing rows keep their original title and concept.
+        """
+        rows = {}
+        for concept, videos in video_results.items():
+            for video in videos:
+                rows.setdefault(video['url'], (video['url'], video['title'], concept))
+        if not rows:
+            return {}
+
+        conn.executemany(
+            "INSERT INTO videos (url, title, concept) VALUES (?, ?, ?) ON CONFLICT (url) DO NOTHING",
+            rows.values()
+        )
+        cursor = conn.execute(
+            "SELECT url, id FROM videos WHERE url IN (SELECT value FROM json_each(?))",
+            (json.dumps(list(rows)),)
+        )
+        return dict(cursor.fetchall())
+
+    def _link_videos(self, conn: sqlite3.Connection, file_hash: str, video_results: Dict[str, List[Dict[str, str]]]):
+        """
+        Links the file to every video in `video_results` under the concept it was
+        found for. New links are positioned after the file's existing ones.
+        """
+        video_ids = self._upsert_videos(conn, video_results)
+        next_position = conn.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM file_video_links WHERE file_hash = ?", (file_hash,)
+        ).fetchone()[0]
+        links = [(concept, video) for concept, videos in video_results.items() for video in videos]
+        conn.executemany(
+            "INSERT INTO file_video_links (file_hash, video_id, concept, position) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (file_hash, video_id) DO UPDATE SET concept = excluded.concept",
+            [(file_hash, video_ids[video['url']], concept, next_position + i)
+             for i, (concept, video) in enumerate(links)]
+        )
+
+    def update_videos(self, file_hash: str, removed_concepts: Iterable[str] = (),
+                      added_results: Optional[Dict[str, List[Dict[str, str]]]] = None,
+                      filename: Optional[str] = None) -> None:
+        removed_concepts = list(removed_concepts)
+        with self.pool.write() as conn:
+            if removed_concepts:
+                conn.execute(
+                    "DELETE FROM file_video_links WHERE file_hash = ? AND concept IN (SELECT value FROM json_each(?))",
+                    (file_hash, json.dumps(removed_concepts))
+                )
+            if added_results:
+                self._add_file(conn, file_hash, filename)
+                self._link_videos(conn, file_hash, added_results)
+
+    def get_videos(self, file_hash: str) -> Dict[str, List[Dict[str, str]]]:
+        query = """
+            SELECT fvl.concept, v.title, v.url
+            FROM file_video_links fvl
+            JOIN videos v ON v.id = fvl.video_id
+            WHERE fvl.file_hash = ?
+            ORDER BY fvl.position
+        """
+        with self.pool.read() as conn:
+            rows = conn.execute(query, (file_hash,)).fetchall()
+        video_results = {}
+        for concept, title, url in rows:
+            video_results.setdefault(concept, []).append({'title': title, 'url': url})
+        return video_results
+
+    def db_paths(self) -> List[str]:
+        return [self.db_path]
+
+    def db_path_for(self, file_hash: str) -> str:
+        return self.db_path
+
+
+def shard_path(db_path: str, index: int) -> str:
+    """file_hashes.db -> file_hashes.shard<index>.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+
+class ShardedSQLiteBackend(StorageBackend):
+    """
+    Documents spread over `shards` SQLite files by hash prefix. Operations on
+    one document touch only its shard; concept queries merge all shards.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, shards: int = DEFAULT_SHARDS):
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.db_path = db_path
+        self.shards = [SQLiteBackend(shard_path(db_path, i)) for i in range(shards)]
+
+    def shard_for(self, file_hash: str) -> SQLiteBackend:
+        try:
+            # Document hashes are SHA-256 hex digests, uniform in their leading digits
+            key = int(file_hash[:8], 16)
+        except ValueError:
+            key = zlib.crc32(file_hash.encode('utf-8'))
+        return self.shards[key % len(self.shards)]
+
+    def has_file(self, file_hash: str) -> bool:
+        return self.shard_for(file_hash).has_file(file_hash)
+
+    def add_file(self, file_hash: str, filename: Optional[str] = None) -> None:
+        self.shard_for(file_hash).add_file(file_hash, filename)
+
+    def get_concepts(self, file_hash: str) -> Optional[List[str]]:
+        return self.shard_for(file_hash).get_concepts(file_hash)
+
+    def set_concepts(self, file_hash: str, concepts: List[str]) -> None:
+        self.shard_for(file_hash).set_concepts(file_hash, concepts)
+
+    def add_file_with_concepts(self, file_hash: str, concepts: List[str]) -> Optional[List[str]]:
+        return self.shard_for(file_hash).add_file_with_concepts(file_hash, concepts)
+
+    def find_files_by_concept(self, concept: str, limit: int) -> List[str]:
+        found = []
+        for shard in self.shards:
+            if len(found) >= limit:
+                break
+            found.extend(shard.find_files_by_concept(concept, limit - len(found)))
+        return found
+
+    def top_concepts(self, limit: int) -> List[Tuple[str, int]]:
+        # A concept's count is split across shards, so every shard's counts are needed
+        names, counts = {}, Counter()
+        for shard in self.shards:
+            with shard.pool.read() as conn:
+                for name, doc_count in conn.execute("SELECT name, doc_count FROM concepts WHERE doc_count > 0"):
+                    key = _nocase_key(name)
+                    names.setdefault(key, name)
+                    counts[key] += doc_count
+        return [(names[key], count) for key, count in counts.most_common(limit)]
+
+    def update_videos(self, file_hash: str, removed_concepts: Iterable[str] = (),
+                      added_results: Optional[Dict[str, List[Dict[str, str]]]] = None,
+                      filename: Optional[str] = None) -> None:
+        self.shard_for(file_hash).update_videos(file_hash, removed_concepts, added_results, filename)
+
+    def get_videos(self, file_hash: str) -> Dict[str, List[Dict[str, str]]]:
+        return self.shard_for(file_hash).get_videos(file_hash)
+
+    def db_paths(self) -> List[str]:
+        return [shard.db_path for shard in self.shards]
+
+    def db_path_for(self, file_hash: str) -> str:
+        return self.shard_for(file_hash).db_path
+
+
+class MemoryBackend(StorageBackend):
+    """Everything in dictionaries behind one lock; lost when the process exits."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filenames: Dict[str, Optional[str]] = {}
+        # file_hash -> concept key -> the document's own spelling
+        self._concepts: Dict[str, Dict[str, str]] = {}
+        # The first spelling of a concept names it in top_concepts, as in the SQLite concepts table
+        self._concept_names: Dict[str, str] = {}
+        self._videos: Dict[str, Tuple[str, str]] = {}
+        # file_hash -> url -> [concept, position]
+        self._links: Dict[str, Dict[str, list]] = {}
+
+    def has_file(self, file_hash: str) -> bool:
+        return file_hash in self._filenames
+
+    def _add_file(self, file_hash: str, filename: Optional[str]) -> None:
+        if self._filenames.get(file_hash) is None:
+            self._filenames[file_hash] = filename
+
+    def add_file(self, file_hash: str, filename: Optional[str] = None) -> None:
+        with self._lock:
+            self._add_file(file_hash, filename)
+
+    def _write_concepts(self, file_hash: str, concepts: List[str]) -> None:
+        keys = {}
+        for concept in concepts:
+            concept = concept.strip()
+            if concept:
+                key = _nocase_key(concept)
+                keys.setdefault(key, concept)
+                self._concept_names.setdefault(key, concept)
+        self._concepts[file_hash] = keys
+
+    def _read_concepts(self, file_hash: str) -> List[str]:
+        return list(self._concepts.get(file_hash, {}).values())
+
+    def get_concepts(self, file_hash: str) -> Optional[List[str]]:
+        with self._lock:
+            if file_hash not in self._filenames:
+                return None
+            return self._read_concepts(file_hash)
+
+    def set_concepts(self, file_hash: str, concepts: List[str]) -> None:
+        with self._lock:
+            if file_hash in self._filenames:
+                self._write_concepts(file_hash, concepts)
+
+    def add_file_with_concepts(self, file_hash: str, concepts: List[str]) -> Optional[List[str]]:
+        with self._lock:
+            if file_hash in self._filenames:
+                return self._read_concepts(file_hash)
+            self._filenames[file_hash] = None
+            self._write_concepts(file_hash, concepts)
+        return None
+
+    def find_files_by_concept(self, concept: str, limit: int) -> List[str]:
+        key = _nocase_key(concept.strip())
+        with self._lock:
+            return [file_hash for file_hash, keys in self._concepts.items() if key in keys][:limit]
+
+    def top_concepts(self, limit: int) -> List[Tuple[str, int]]:
+        with self._lock:
+            counts = Counter(key for keys in self._concepts.values() for key in keys)
+            return [(self._concept_names[key], count) for key, count in counts.most_common(limit)]
+
+    def update_videos(self, file_hash: str, removed_concepts: Iterable[str] = (),
+                      added_results: Optional[Dict[str, List[Dict[str, str]]]] = None,
+                      filename: Optional[str] = None) -> None:
+        removed_concepts = set(removed_concepts)
+        with self._lock:
+            links = self._links.get(file_hash, {})
+            for url in [url for url, (concept, _) in links.items() if concept in removed_concepts]:
+                del links[url]
+            if not added_results:
+                return
+            self._add_file(file_hash, filename)
+            links = self._links.setdefault(file_hash, links)
+            position = max((p for _, p in links.values()), default=-1) + 1
+            for concept, videos in added_results.items():
+                for video in videos:
+                    self._videos.setdefault(video['url'], (video['title'], concept))
+                    if video['url'] in links:
+                        links[video['url']][0] = concept
+                    else:
+                        links[video['url']] = [concept, position]
+                    position += 1
+
+    def get_videos(self, file_hash: str) -> Dict[str, List[Dict[str, str]]]:
+        with self._lock:
+            links = sorted(self._links.get(file_hash, {}).items(), key=lambda item: item[1][1])
+            video_results = {}
+            for url, (concept, _) in links:
+                video_results.setdefault(concept, []).append({'title': self._videos[url][0], 'url': url})
+            return video_results
+
+
+def create_backend(kind: str = 'sqlite', db_path: str = DEFAULT_DB_PATH,
+                   shards: int = DEFAULT_SHARDS) -> StorageBackend:
+    if kind == 'sqlite':
+        return SQLiteBackend(db_path)
+    if kind == 'sharded':
+        return ShardedSQLiteBackend(db_path, shards)
+    if kind == 'memory':
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{kind}'; expected one of {', '.join(BACKEND_KINDS)}")
+
+
+_backends: Dict[tuple, StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(db_path: str = DEFAULT_DB_PATH, kind: Optional[str] = None,
+                shards: Optional[int] = None) -> StorageBackend:
+    """
+    Return the shared backend for a database path, created on first use from
+    the arguments or, when they are omitted, from STUDYBUD_STORAGE and
+    STUDYBUD_SHARDS. In-memory backends are shared per path too, so every
+    checker and storage object in the process sees the same documents.
+    """
+    kind = kind or os.getenv("STUDYBUD_STORAGE", "sqlite")
+    shards = shards or int(os.getenv("STUDYBUD_SHARDS", DEFAULT_SHARDS))
+    key = (kind, os.path.abspath(db_path), shards if kind == 'sharded' else None)
+    backend = _backends.get(key)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(key)
+            if backend is None:
+                backend = create_backend(kind, db_path, shards)
+                _backends[key] = backend
+    return backend
+
@@ -1,58 +1,124 @@
 import re
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
+
+from instrumentation import span
 
 class StringExtractor:
     """
     A class for extracting structured data from text strings.
     Currently supports extracting Python lists from code blocks or direct list notation.
     """
-    
+
     def __init__(self):
-        """Initialize the StringExtractor with regular expression patterns."""
-        self._code_block_pattern = r"```python\s+([\s\S]*?)```"
-        self._list_pattern = r"(\w+)\s*=\s*\[([\s\S]*?)\]"
-        self._direct_list_pattern = r"\[([\s\S]*?)\]"
-        self._item_pattern = r'["\'](.*?)["\']'
-    
+        """Initialize the StringExtractor with compiled regular expression patterns."""
+        self._code_block_pattern = re.compile(r"```python\s+(.*?)```", re.DOTALL)
+        self._list_pattern = re.compile(r"(\w+)\s*=\s*\[([^\]]*)\]")
+        self._direct_list_pattern = re.compile(r"\[([^\]]*)\]")
+        self._item_pattern = re.compile(r'["\'](.*?)["\']')
+
     def extract_list_from_string(self, text: str) -> Optional[List[str]]:
         """
         Extract a Python list from a string containing code blocks or direct list notation.
-        
+
         Args:
             text (str): The input string that may contain a Python list
-        
+
         Returns:
-            list: The extracted list of items, or None if no list is found
+            list: The extracted list of items, or None if no list is found.
+            A list cut off before its closing bracket (a truncated response)
+            returns the items that were completed.
         """
-        # First try to extract from code blocks
-        extracted_list = self._extract_from_code_blocks(text)
-        if extracted_list:
-            return extracted_list
-        
-        # If not found in code blocks, try direct list pattern
-        return self._extract_from_direct_list(text)
-    
+        with span("extract_list_from_string", bytes=len(text)):
+            # First try to extract from code blocks
+            extracted_list = self._extract_from_code_blocks(text)
+            if extracted_list:
+                return extracted_list
+
+            # If not found in code blocks, try direct list pattern
+            extracted_list = self._extract_from_direct_list(text)
+            if extracted_list:
+                return extracted_list
+
+            # Finally, salvage the completed items of an unterminated list
+            parser = IncrementalListParser()
+            parser.feed(text)
+            return parser.items or extracted_list
+
+    def iter_list_items(self, chunks: Iterable[str]) -> Iterator[str]:
+        """
+        Yield list items from a stream of text chunks as soon as each item's
+        closing quote arrives, e.g. while a model response is still streaming.
+        """
+        parser = IncrementalListParser()
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+            if parser.done:
+                break
+
     def _extract_from_code_blocks(self, text: str) -> Optional[List[str]]:
         """Extract list from Python code blocks in the text."""
-        code_blocks = re.findall(self._code_block_pattern, text)
-        
-        for block in code_blocks:
-            list_matches = re.findall(self._list_pattern, block)
-            
-            for _, list_content in list_matches:
-                items = re.findall(self._item_pattern, list_content)
-                return items
-        
+        for block in self._code_block_pattern.findall(text):
+            for _, list_content in self._list_pattern.findall(block):
+                return self._item_pattern.findall(list_content)
+
         return None
-    
+
     def _extract_from_direct_list(self, text: str) -> Optional[List[str]]:
         """Extract list from direct list notation in the text."""
-        direct_matches = re.findall(self._direct_list_pattern, text)
-        
-        if direct_matches:
-            items = re.findall(self._item_pattern, direct_matches[0])
-            return items
-        
+        direct_match = self._direct_list_pattern.search(text)
+
+        if direct_match:
+            return self._item_pattern.findall(direct_match.group(1))
+
         return None
 
 
+class IncrementalListParser:
+    """
+    Incremental parser for a list of quoted strings arriving in pieces.
+
+    `feed()` accepts the next chunk of text and returns the items completed by
+    it. Text before the first '[' (prose, a ```python fence, `name =`) is
+    skipped; parsing stops at the closing ']'.
+    """
+
+    def __init__(self):
+        self.items: List[str] = []
+        self.done = False
+        self._in_list = False
+        self._quote = None
+        self._escaped = False
+        self._current: List[str] = []
+
+    def feed(self, text: str) -> List[str]:
+        """Consume a chunk of text and return the items it completed."""
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            if self._quote is not None:
+                if self._escaped:
+                    self._current.append(char)
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == self._quote:
+                    item = ''.join(self._current)
+                    self.items.append(item)
+                    completed.append(item)
+                    self._quote = None
+                    self._current = []
+                else:
+                    self._current.append(char)
+            elif not self._in_list:
+                if char == '[':
+                    self._in_list = True
+            elif char in '"\'':
+                self._quote = char
+            elif char == ']':
+                # An empty bracket pair (e.g. a citation) is not the list we want
+                if self.items:
+                    self.done = True
+                else:
+                    self._in_list = False
+        return completed
@@ -0,0 +1,17 @@
+import pytest
+
+from rate_limit import Backend
+from storage import close_all
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh database file per test; the shared pools are closed afterwards."""
+    yield str(tmp_path / "test.db")
+    close_all()
+
+
+@pytest.fixture
+def unlimited_backend():
+    """An outbound backend without rate limiting, so fake clients answer immediately."""
+    return Backend("test", rate=1e9, burst=1e9)
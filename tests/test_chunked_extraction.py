@@ -0,0 +1,41 @@
+import pytest
+
+from chunked_extraction import ChunkedConceptExtractor, merge_concepts
+from rate_limit import BackendUnavailable
+from stringextractor import StringExtractor
+
+
+class ChunkExtractor:
+    """Answers each chunk with its own concept list, or raises the error given for it."""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+
+    def extract_from_bytes(self, chunk: bytes) -> str:
+        if chunk in self.errors:
+            raise self.errors[chunk]
+        return f"['Shared', 'Only in {chunk.decode()}']"
+
+
+def make_extractor(errors=None):
+    return ChunkedConceptExtractor(ChunkExtractor(errors), StringExtractor(),
+                                   splitter=lambda pdf_bytes, pages: [b"a", b"b", b"c"])
+
+
+def test_chunks_are_merged_and_ranked():
+    assert make_extractor().extract(b"pdf") == ['Shared', 'Only in a', 'Only in b', 'Only in c']
+
+
+def test_one_failed_chunk_fails_the_extraction():
+    with pytest.raises(ValueError):
+        make_extractor({b"b": ValueError("bad response")}).extract(b"pdf")
+
+
+def test_backend_unavailable_is_raised_before_other_errors():
+    errors = {b"a": ValueError("bad response"), b"c": BackendUnavailable("gemini", 5.0, "circuit open")}
+    with pytest.raises(BackendUnavailable):
+        list(make_extractor(errors).iter_concepts(b"pdf"))
+
+
+def test_merge_keeps_first_spelling_and_drops_duplicates():
+    assert merge_concepts([["Entropy", " entropy "], ["ENTROPY", "Heat"]]) == ["Entropy", "Heat"]
@@ -0,0 +1,80 @@
+from fakes import FakeGenaiClient
+from gemini import KeyConceptExtractor
+from upload_cache import UploadCache
+
+FILE_HASH = "ab" * 32
+PDF_BYTES = b"%PDF-1.4 fake document"
+
+
+def make_extractor(db_path, backend):
+    client = FakeGenaiClient(latency=0)
+    extractor = KeyConceptExtractor(client=client, upload_cache=UploadCache(db_path), backend=backend)
+    return extractor, client, extractor.upload_cache
+
+
+def refuse_cache(**kwargs):
+    raise ValueError("Cached content is too small")
+
+
+def test_first_call_uploads_then_creates_cache(db_path, unlimited_backend):
+    extractor, client, upload_cache = make_extractor(db_path, unlimited_backend)
+
+    assert "Concept" in extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+
+    assert client.calls == ['files.upload', 'caches.create', 'generate_content']
+    assert upload_cache.get_file(FILE_HASH) is not None
+    assert upload_cache.get_context_cache(FILE_HASH, extractor.model) is not None
+
+
+def test_second_call_reuses_context_cache(db_path, unlimited_backend):
+    extractor, client, upload_cache = make_extractor(db_path, unlimited_backend)
+    extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+    cache_name = upload_cache.get_context_cache(FILE_HASH, extractor.model)
+    client.calls.clear()
+
+    extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+    assert "".join(extractor.stream_with_upload(FILE_HASH, PDF_BYTES))
+
+    assert client.calls == ['generate_content', 'generate_content_stream']
+    assert upload_cache.get_context_cache(FILE_HASH, extractor.model) == cache_name
+
+
+def test_expired_cache_is_rebuilt_on_the_stored_upload(db_path, unlimited_backend):
+    extractor, client, upload_cache = make_extractor(db_path, unlimited_backend)
+    extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+    uploaded = upload_cache.get_file(FILE_HASH)
+    old_cache = upload_cache.get_context_cache(FILE_HASH, extractor.model)
+    client.expired.add(old_cache)
+    client.calls.clear()
+
+    assert "Concept" in extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+
+    assert client.calls == ['generate_content', 'caches.create', 'generate_content']
+    assert upload_cache.get_file(FILE_HASH) == uploaded
+    new_cache = upload_cache.get_context_cache(FILE_HASH, extractor.model)
+    assert new_cache not in (None, old_cache)
+
+
+def test_expired_upload_is_forgotten_and_uploaded_again(db_path, unlimited_backend):
+    extractor, client, upload_cache = make_extractor(db_path, unlimited_backend)
+    extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+    uploaded = upload_cache.get_file(FILE_HASH)
+    client.expired.update({upload_cache.get_context_cache(FILE_HASH, extractor.model), uploaded['uri']})
+    # Without a context cache the request references the uploaded file directly
+    client.caches.create = refuse_cache
+    client.calls.clear()
+
+    assert "Concept" in extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+
+    assert client.calls == ['generate_content', 'generate_content', 'files.upload', 'generate_content']
+    assert upload_cache.get_file(FILE_HASH)['uri'] != uploaded['uri']
+    assert upload_cache.get_context_cache(FILE_HASH, extractor.model) is None
+
+
+def test_without_upload_cache_sends_inline(unlimited_backend):
+    client = FakeGenaiClient(latency=0)
+    extractor = KeyConceptExtractor(client=client, backend=unlimited_backend)
+
+    extractor.extract_with_upload(FILE_HASH, PDF_BYTES)
+
+    assert client.calls == ['generate_content']
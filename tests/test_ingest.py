@@ -0,0 +1,38 @@
+import json
+import os
+
+from ingest import Checkpoint, try_hash_file
+
+
+def test_unreadable_files_are_reported_instead_of_raised(tmp_path):
+    readable = tmp_path / "a.pdf"
+    readable.write_bytes(b"%PDF-1.4 a")
+
+    file_hash, error = try_hash_file(str(readable))
+    assert len(file_hash) == 64 and error is None
+
+    file_hash, error = try_hash_file(str(tmp_path / "vanished.pdf"))
+    assert file_hash is None and "vanished.pdf" in error
+
+
+def test_checkpoint_records_vanished_files_as_unfinished(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    missing = str(tmp_path / "vanished.pdf")
+
+    checkpoint.record(missing, None, 'failed', error="No such file")
+
+    with open(checkpoint.path) as f:
+        assert json.load(f)[missing]['status'] == 'failed'
+    assert not checkpoint.is_finished(missing)
+
+
+def test_checkpoint_skips_unchanged_finished_files(tmp_path):
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF-1.4 a")
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.record(str(path), "ab" * 32, 'done')
+
+    assert Checkpoint(checkpoint.path).is_finished(str(path))
+    path.write_bytes(b"%PDF-1.4 changed")
+    os.utime(path, (0, 0))
+    assert not checkpoint.is_finished(str(path))
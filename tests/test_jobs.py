@@ -0,0 +1,54 @@
+import time
+
+from jobs import DONE, FAILED, RUNNING, JobQueue
+
+
+def crash_while_running(queue, job_id):
+    """Leave the job as a worker that stopped mid-run would: running, with an expired lease."""
+    job = queue._claim()
+    assert job.id == job_id
+    with queue.pool.write() as conn:
+        conn.execute("UPDATE jobs SET owner = 'gone', lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    return job
+
+
+def test_job_of_a_stopped_worker_is_claimed_again(db_path):
+    queue = JobQueue({'echo': lambda job: job.payload}, db_path, max_attempts=3)
+    job_id = queue.submit('echo', {'n': 1})
+    crash_while_running(queue, job_id)
+
+    job = queue._claim()
+
+    assert job.id == job_id and job.attempts == 2
+    assert queue.get(job_id)['status'] == RUNNING
+    queue._run(job)
+    assert queue.get(job_id)['status'] == DONE
+
+
+def test_job_failed_after_max_attempts_of_stopped_workers(db_path):
+    queue = JobQueue({'echo': lambda job: job.payload}, db_path, max_attempts=2)
+    job_id = queue.submit('echo', {'n': 1}, data=b"pdf bytes")
+    crash_while_running(queue, job_id)
+    crash_while_running(queue, job_id)
+
+    assert queue._claim() is None
+    status = queue.get(job_id)
+    assert status['status'] == FAILED and status['attempts'] == 2
+    assert "2 attempts" in status['error']
+    with queue.pool.read() as conn:
+        assert conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()[0] is None
+
+
+def test_progress_within_a_stage_is_written_once_per_interval(db_path, monkeypatch):
+    queue = JobQueue({'echo': lambda job: job.payload}, db_path, progress_interval=60)
+    queue.submit('echo', {'n': 1})
+    job = queue._claim()
+    writes = []
+    monkeypatch.setattr(queue, '_update_progress', lambda *args: writes.append(args[1:3]))
+
+    for n in range(1, 50):
+        job.progress('extract', n / 100)
+    job.progress('videos', 0.7)
+    job.progress('videos', 0.8)
+
+    assert writes == [('extract', 0.01), ('videos', 0.7)]
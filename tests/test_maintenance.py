@@ -0,0 +1,95 @@
+import hashlib
+
+import pytest
+
+from hash_check import PDFDuplicateChecker
+from maintenance import compact, collect_garbage
+from near_duplicate import NearDuplicateIndex
+from storage import get_pool
+from storage_backends import get_backend
+from video_storage import VideoStorage
+
+TEXT = "Entropy measures the number of microstates of a thermodynamic system. " * 20
+
+
+def document_hash(n: int) -> str:
+    return hashlib.sha256(f"document {n}".encode()).hexdigest()
+
+
+def count(db_path: str, table: str) -> int:
+    with get_pool(db_path).read() as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "sharded"])
+def test_document_data_of_deleted_documents_is_collected(db_path, kind, monkeypatch):
+    monkeypatch.setenv("STUDYBUD_STORAGE", kind)
+    backend = get_backend(db_path)
+    index = NearDuplicateIndex(db_path)
+    signature = index.signature_for_text(TEXT)
+    kept, deleted = document_hash(1), document_hash(2)
+    for file_hash in (kept, deleted):
+        backend.add_file_with_concepts(file_hash, ["Entropy"])
+        index.add(file_hash, signature)
+        with get_pool(db_path).write() as conn:
+            conn.execute("INSERT INTO document_texts (file_hash, pages, raw_chars, pdf_bytes, created_at) "
+                         "VALUES (?, '[]', 0, 0, 0)", (file_hash,))
+    buckets_per_document = count(db_path, "lsh_buckets") // 2
+    with get_pool(backend.db_path_for(deleted)).write() as conn:
+        conn.execute("DELETE FROM file_hashes WHERE hash = ?", (deleted,))
+
+    removed = collect_garbage(db_path)
+
+    assert removed['signatures'] == 1 and removed['document_texts'] == 1
+    assert removed['lsh_buckets'] == buckets_per_document
+    assert removed['file_concepts'] == 1
+    with get_pool(db_path).read() as conn:
+        assert conn.execute("SELECT file_hash FROM doc_signatures").fetchall() == [(kept,)]
+        assert conn.execute("SELECT file_hash FROM document_texts").fetchall() == [(kept,)]
+    assert collect_garbage(db_path) == dict.fromkeys(removed, 0)
+
+
+def test_in_memory_documents_keep_their_data(db_path, monkeypatch):
+    monkeypatch.setenv("STUDYBUD_STORAGE", "memory")
+    get_backend(db_path).add_file(document_hash(1))
+    NearDuplicateIndex(db_path).add(document_hash(1), NearDuplicateIndex(db_path).signature_for_text(TEXT))
+
+    assert sum(collect_garbage(db_path).values()) == 0
+    assert count(db_path, "doc_signatures") == 1
+
+
+def add_document(backend, n: int, created_at: str) -> str:
+    file_hash = document_hash(n)
+    backend.add_file_with_concepts(file_hash, ["Entropy"])
+    backend.update_videos(file_hash, added_results={"Entropy": [{'title': f"Video {n}", 'url': f"u{n}"}]})
+    with get_pool(backend.db_path_for(file_hash)).write() as conn:
+        conn.execute("UPDATE file_hashes SET created_at = ? WHERE hash = ?", (created_at, file_hash))
+    return file_hash
+
+
+@pytest.mark.parametrize("kind", ["sqlite", "sharded"])
+def test_documents_beyond_the_retention_policy_are_deleted_with_their_data(db_path, kind, monkeypatch):
+    monkeypatch.setenv("STUDYBUD_STORAGE", kind)
+    backend = get_backend(db_path)
+    expired = add_document(backend, 1, "2000-01-01 00:00:00")
+    oldest, older, newest = (add_document(backend, n, f"2099-01-0{n} 00:00:00") for n in (2, 3, 4))
+
+    report = compact(db_path, document_retention_seconds=30 * 86400, max_documents=2)
+
+    assert report['retention']['documents'] == 2
+    assert [backend.has_file(h) for h in (expired, oldest, older, newest)] == [False, False, True, True]
+    assert report['orphans']['videos'] == 2 and report['orphans']['file_concepts'] == 2
+    assert backend.top_concepts(10)[0][1] == 2
+
+
+def test_compaction_clears_cached_lookups_of_deleted_rows(db_path):
+    backend = get_backend(db_path)
+    file_hash = add_document(backend, 1, "2000-01-01 00:00:00")
+    video_storage, checker = VideoStorage(db_path), PDFDuplicateChecker(db_path)
+    assert video_storage.get_videos_for_file(file_hash)
+    assert checker.get_key_concepts_for_hash(file_hash) == ["Entropy"]
+
+    compact(db_path, document_retention_seconds=86400)
+
+    assert video_storage.get_videos_for_file(file_hash) == {}
+    assert not checker.get_key_concepts_for_hash(file_hash)
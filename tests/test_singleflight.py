@@ -0,0 +1,142 @@
+import threading
+import time
+
+from fakes import youtube_dl_factory
+from search_cache import SearchCache
+from singleflight import SingleFlight
+from storage import get_pool
+from youtube import YouTubeSearcher
+
+QUERIES = [f"Query {i}" for i in range(10)]
+
+
+def counting_factory(counter, latency=0.05):
+    factory = youtube_dl_factory(latency)
+
+    def build(opts):
+        ydl = factory(opts)
+        extract_info = ydl.extract_info
+
+        def counted(*args, **kwargs):
+            with counter['lock']:
+                counter['calls'] += 1
+            return extract_info(*args, **kwargs)
+        ydl.extract_info = counted
+        return ydl
+    return build
+
+
+def make_searcher(db_path, backend, counter):
+    return YouTubeSearcher(cache=SearchCache(db_path), ydl_factory=counting_factory(counter), backend=backend,
+                           flight=SingleFlight(db_path, poll_interval=0.01))
+
+
+def test_concurrent_batches_search_each_query_once(db_path, unlimited_backend):
+    counter = {'calls': 0, 'lock': threading.Lock()}
+    searcher = make_searcher(db_path, unlimited_backend, counter)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(searcher.search_multiple_detailed(QUERIES)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter['calls'] == len(QUERIES)
+    assert all(errors == {} for _, errors in results)
+    assert all(found == results[0][0] for found, _ in results)
+    assert all(len(found[q]) == 2 for q in QUERIES for found, _ in results)
+
+
+def test_batch_uses_one_transaction_each_for_leases_results_and_release(db_path, unlimited_backend, monkeypatch):
+    counter = {'calls': 0, 'lock': threading.Lock()}
+    searcher = make_searcher(db_path, unlimited_backend, counter)
+    pool = get_pool(db_path)
+    writes = []
+    write = pool.write
+
+    def counted_write():
+        writes.append(1)
+        return write()
+    monkeypatch.setattr(pool, 'write', counted_write)
+
+    searcher.search_multiple_detailed(QUERIES)
+
+    assert len(writes) == 3
+    assert searcher.cache.get_many(QUERIES, 2).keys() == set(QUERIES)
+    with pool.read() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM flight_leases").fetchone()[0] == 0
+
+
+def test_key_leased_by_another_process_is_rechecked(db_path):
+    flight = SingleFlight(db_path, poll_interval=0.01)
+    stored = {}
+    with flight.pool.write() as conn:
+        conn.execute("INSERT INTO flight_leases (key, owner, expires_at) VALUES ('k1', 'other', ?)",
+                     (time.time() + 60,))
+
+    def other_process_finishes():
+        time.sleep(0.1)
+        stored['k1'] = "from other process"
+        with flight.pool.write() as conn:
+            conn.execute("DELETE FROM flight_leases WHERE key = 'k1'")
+    threading.Thread(target=other_process_finishes).start()
+
+    futures = flight.do_many({'k1': lambda: "computed", 'k2': lambda: "computed"},
+                             store=stored.update, recheck=stored.get, max_workers=2)
+
+    assert futures['k1'].result() == "from other process"
+    assert futures['k2'].result() == "computed"
+    assert stored['k2'] == "computed"
+
+
+def test_failed_work_is_not_stored(db_path):
+    flight = SingleFlight(db_path)
+    stored = {}
+
+    def fail():
+        raise RuntimeError("search failed")
+
+    futures = flight.do_many({'ok': lambda: 1, 'bad': fail}, store=stored.update)
+
+    assert stored == {'ok': 1}
+    assert isinstance(futures['bad'].exception(), RuntimeError)
+
+
+def test_batches_waiting_on_each_others_keys_do_not_deadlock(db_path):
+    # Two instances stand in for two processes: A leads k1 and waits on k2, B leads k2 and waits on k1
+    flight_a = SingleFlight(db_path, lease_seconds=5, poll_interval=0.01)
+    flight_b = SingleFlight(db_path, lease_seconds=5, poll_interval=0.01)
+    stored, calls = {}, []
+    a_working, b_working, go = threading.Event(), threading.Event(), threading.Event()
+
+    def work(name, started=None):
+        def run():
+            calls.append(name)
+            if started is not None:
+                started.set()
+                go.wait(5)
+            return name
+        return run
+
+    with flight_a.pool.write() as conn:
+        conn.execute("INSERT INTO flight_leases (key, owner, expires_at) VALUES ('k2', 'placeholder', ?)",
+                     (time.time() + 60,))
+    batch_a = threading.Thread(target=flight_a.do_many, args=(
+        {'k1': work("a1", a_working), 'k2': work("a2")},), kwargs={'store': stored.update, 'recheck': stored.get})
+    batch_b = threading.Thread(target=flight_b.do_many, args=(
+        {'k2': work("b2", b_working), 'k1': work("b1")},), kwargs={'store': stored.update, 'recheck': stored.get})
+    started = time.monotonic()
+    batch_a.start()
+    assert a_working.wait(5)
+    with flight_a.pool.write() as conn:
+        conn.execute("DELETE FROM flight_leases WHERE owner = 'placeholder'")
+    batch_b.start()
+    assert b_working.wait(5)
+    go.set()
+    batch_a.join(10)
+    batch_b.join(10)
+
+    assert time.monotonic() - started < 2
+    assert sorted(calls) == ["a1", "b2"]
+    assert stored == {'k1': "a1", 'k2': "b2"}
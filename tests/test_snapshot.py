@@ -0,0 +1,70 @@
+import gzip
+import json
+
+from search_cache import SearchCache
+from snapshot import SNAPSHOT_FORMAT, SNAPSHOT_VERSION, export_snapshot, import_snapshot
+from storage import get_pool
+from storage_backends import get_backend
+
+DOC = "ab" * 32
+
+
+def write_snapshot(path, records):
+    with gzip.open(path, "wt", encoding="utf-8") as out:
+        out.write(json.dumps({'format': SNAPSHOT_FORMAT, 'version': SNAPSHOT_VERSION}) + "\n")
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+
+
+def search_rows(db_path):
+    with get_pool(db_path).read() as conn:
+        return conn.execute("SELECT query_key, count, results FROM search_cache ORDER BY count").fetchall()
+
+
+def test_round_trip_into_an_empty_database(tmp_path, db_path):
+    backend = get_backend(db_path)
+    backend.add_file_with_concepts(DOC, ["Entropy"])
+    backend.update_videos(DOC, added_results={"Entropy": [{'title': "Video 1", 'url': "u1"}]})
+    SearchCache(db_path).put("Entropy", 2, [{'title': "Video 1", 'url': "u1"}])
+    path = str(tmp_path / "snapshot.gz")
+    export_snapshot(path, db_path)
+    target = str(tmp_path / "target.db")
+
+    added = import_snapshot(path, target)
+
+    assert added == {'document': 1, 'video': 1, 'link': 1, 'search': 1, 'skipped_link': 0}
+    assert get_backend(target).get_videos(DOC) == {"Entropy": [{'title': "Video 1", 'url': "u1"}]}
+    assert sum(import_snapshot(path, target).values()) == 0
+
+
+def test_videos_are_imported_only_with_their_links(tmp_path, db_path):
+    path = str(tmp_path / "snapshot.gz")
+    write_snapshot(path, [
+        ["document", DOC, "doc.pdf", "2024-01-01 00:00:00", ["Entropy"]],
+        ["video", "u1", "Video 1", "Entropy"],
+        ["video", "unlinked", "Unlinked", "Entropy"],
+        ["link", DOC, "u1", "Entropy", 0],
+        ["link", DOC, "missing", "Entropy", 1],
+    ])
+
+    added = import_snapshot(path, db_path, batch_size=1)
+
+    assert added['video'] == 1 and added['link'] == 1 and added['skipped_link'] == 1
+    with get_pool(db_path).read() as conn:
+        assert conn.execute("SELECT url FROM videos").fetchall() == [("u1",)]
+
+
+def test_newer_search_replaces_every_list_for_its_query(tmp_path, db_path):
+    cache = SearchCache(db_path)
+    cache.put("Entropy", 10, [{'url': "local"}])
+    with get_pool(db_path).read() as conn:
+        stored_at = conn.execute("SELECT created_at FROM search_cache").fetchone()[0]
+    older, newer = str(tmp_path / "older.gz"), str(tmp_path / "newer.gz")
+    write_snapshot(older, [["search", "entropy", 20, [{'url': "old"}], stored_at - 60]])
+    write_snapshot(newer, [["search", "entropy", 20, [{'url': "new"}], stored_at + 60]])
+
+    assert import_snapshot(older, db_path)['search'] == 0
+    assert search_rows(db_path) == [("entropy", 10, json.dumps([{'url': "local"}]))]
+
+    assert import_snapshot(newer, db_path)['search'] == 1
+    assert search_rows(db_path) == [("entropy", 20, json.dumps([{'url': "new"}]))]
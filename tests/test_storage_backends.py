@@ -0,0 +1,171 @@
+"""The StorageBackend contract, checked against every backend."""
+import sqlite3
+
+import pytest
+
+from storage import MIGRATIONS
+from storage_backends import (BACKEND_KINDS, MemoryBackend, ShardedSQLiteBackend, StorageBackend, create_backend,
+                              get_backend)
+
+DOC, OTHER, THIRD = "ab" * 32, "cd" * 32, "ef" * 32
+
+
+def video(n: int) -> dict:
+    return {'title': f"Video {n}", 'url': f"https://www.youtube.com/watch?v={n}"}
+
+
+@pytest.fixture(params=BACKEND_KINDS)
+def backend(request, db_path):
+    return create_backend(request.param, db_path)
+
+
+def test_unknown_document(backend):
+    assert not backend.has_file(DOC)
+    assert backend.get_concepts(DOC) is None
+    assert backend.get_videos(DOC) == {}
+
+
+def test_set_concepts_ignores_unknown_documents(backend):
+    backend.set_concepts(DOC, ["Ignored"])
+
+    assert not backend.has_file(DOC)
+
+
+def test_add_file_with_concepts_inserts_once(backend):
+    assert backend.add_file_with_concepts(DOC, [" Entropy ", "entropy", "", "Heat engines"]) is None
+    assert backend.has_file(DOC)
+    assert backend.get_concepts(DOC) == ["Entropy", "Heat engines"]
+
+    assert backend.add_file_with_concepts(DOC, ["Other"]) == ["Entropy", "Heat engines"]
+    assert backend.get_concepts(DOC) == ["Entropy", "Heat engines"]
+
+
+def test_add_file_then_set_concepts(backend):
+    backend.add_file(OTHER, "other.pdf")
+    assert backend.get_concepts(OTHER) == []
+
+    backend.set_concepts(OTHER, ["Carnot cycle", "CARNOT CYCLE", "Entropy"])
+
+    assert backend.get_concepts(OTHER) == ["Carnot cycle", "Entropy"]
+
+
+def test_documents_keep_their_own_concept_spelling(backend):
+    backend.add_file_with_concepts(DOC, ["Machine learning", "Entropy"])
+    backend.add_file_with_concepts(OTHER, ["Machine Learning"])
+
+    assert backend.get_concepts(DOC) == ["Machine learning", "Entropy"]
+    assert backend.get_concepts(OTHER) == ["Machine Learning"]
+    assert sorted(backend.find_files_by_concept("MACHINE LEARNING", 10)) == sorted([DOC, OTHER])
+
+
+def test_concept_queries_span_all_documents(backend):
+    backend.add_file_with_concepts(DOC, ["Entropy", "Heat engines"])
+    backend.add_file_with_concepts(OTHER, ["ENTROPY", "Carnot cycle"])
+
+    assert sorted(backend.find_files_by_concept("entropy", 10)) == sorted([DOC, OTHER])
+    assert len(backend.find_files_by_concept("Entropy", 1)) == 1
+    assert backend.find_files_by_concept("Unknown", 10) == []
+    top = backend.top_concepts(10)
+    # Which spelling of a shared concept is kept may differ between shards
+    assert (top[0][0].lower(), top[0][1]) == ("entropy", 2)
+    assert sorted(name for name, _ in top[1:]) == ["Carnot cycle", "Heat engines"]
+    assert len(backend.top_concepts(1)) == 1
+
+
+def test_videos_are_grouped_by_concept_in_link_order(backend):
+    backend.update_videos(DOC, added_results={"Entropy": [video(1), video(2)], "Heat engines": [video(3)]})
+    backend.update_videos(DOC, added_results={"Entropy": [video(4)]})
+
+    assert backend.get_videos(DOC) == {"Entropy": [video(1), video(2), video(4)], "Heat engines": [video(3)]}
+
+
+def test_update_removes_concepts_and_moves_relinked_videos(backend):
+    backend.update_videos(DOC, added_results={"Entropy": [video(1), video(2)], "Heat engines": [video(3)]})
+
+    backend.update_videos(DOC, removed_concepts=["Heat engines"], added_results={"Carnot cycle": [video(2)]})
+
+    # A relinked video moves to its new concept and keeps its position
+    assert backend.get_videos(DOC) == {"Entropy": [video(1)], "Carnot cycle": [video(2)]}
+
+
+def test_linking_videos_records_the_document(backend):
+    backend.update_videos(THIRD, added_results={"Entropy": [video(1)]}, filename="third.pdf")
+
+    assert backend.has_file(THIRD)
+    assert backend.get_concepts(THIRD) == []
+    assert backend.get_videos(THIRD) == {"Entropy": [video(1)]}
+    assert backend.get_videos(DOC) == {}
+
+
+def test_documents_linking_the_same_video_are_independent(backend):
+    backend.update_videos(DOC, added_results={"Entropy": [video(1)]})
+    backend.update_videos(OTHER, added_results={"Thermodynamics": [video(1)]})
+
+    backend.update_videos(DOC, removed_concepts=["Entropy"])
+
+    assert backend.get_videos(DOC) == {}
+    assert backend.get_videos(OTHER) == {"Thermodynamics": [video(1)]}
+
+
+def test_database_files(backend, db_path):
+    paths = backend.db_paths()
+    if isinstance(backend, MemoryBackend):
+        assert paths == []
+        with pytest.raises(ValueError):
+            backend.db_path_for(DOC)
+    else:
+        assert backend.db_path_for(DOC) in paths
+        assert (db_path in paths) == (not isinstance(backend, ShardedSQLiteBackend))
+
+
+def test_sharded_backend_spreads_documents_by_hash_prefix(db_path):
+    backend = create_backend('sharded', db_path, shards=4)
+    hashes = [f"{prefix:08x}" + "0" * 56 for prefix in range(8)]
+    for file_hash in hashes:
+        backend.add_file(file_hash)
+
+    assert [backend.shards.index(backend.shard_for(h)) for h in hashes] == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert all(shard.has_file(h) == (backend.shard_for(h) is shard) for h in hashes for shard in backend.shards)
+
+
+def test_get_backend_is_configured_by_environment(db_path, monkeypatch):
+    monkeypatch.setenv("STUDYBUD_STORAGE", "sharded")
+    monkeypatch.setenv("STUDYBUD_SHARDS", "3")
+
+    backend = get_backend(db_path)
+
+    assert isinstance(backend, ShardedSQLiteBackend) and len(backend.shards) == 3
+    assert get_backend(db_path) is backend
+    with pytest.raises(ValueError):
+        create_backend("postgres", db_path)
+
+
+def test_migration_recovers_spellings_from_video_links(db_path):
+    conn = sqlite3.connect(db_path)
+    for migration in MIGRATIONS[:10]:
+        migration(conn)
+    # Before migration 11 both documents shared the first spelling stored
+    conn.execute("INSERT INTO concepts (id, name) VALUES (1, 'Machine learning'), (2, 'Entropy')")
+    conn.execute("INSERT INTO file_concepts (file_hash, position, concept_id) VALUES (?, 0, 1), (?, 0, 1), (?, 1, 2)",
+                 (DOC, OTHER, OTHER))
+    conn.execute("INSERT INTO file_hashes (hash) VALUES (?), (?)", (DOC, OTHER))
+    conn.execute("INSERT INTO videos (id, url, title, concept) VALUES (1, 'u', 't', 'Machine Learning')")
+    conn.execute("INSERT INTO file_video_links (file_hash, video_id, concept, position) "
+                 "VALUES (?, 1, 'Machine Learning', 0)", (OTHER,))
+    conn.execute("PRAGMA user_version = 10")
+    conn.commit()
+    conn.close()
+
+    backend = create_backend('sqlite', db_path)
+
+    assert backend.get_concepts(DOC) == ["Machine learning"]
+    assert backend.get_concepts(OTHER) == ["Machine Learning", "Entropy"]
+
+
+def test_backend_missing_a_method_fails_at_construction():
+    class Incomplete(StorageBackend):
+        def has_file(self, file_hash):
+            return False
+
+    with pytest.raises(TypeError, match="abstract"):
+        Incomplete()
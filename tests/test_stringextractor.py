@@ -0,0 +1,33 @@
+from stringextractor import IncrementalListParser, StringExtractor
+
+RESPONSE = "Here are the key concepts:\n```python\nconcepts = ['Entropy', \"Carnot's cycle\", 'A \\'quoted\\' term']\n```\n"
+ITEMS = ["Entropy", "Carnot's cycle", "A 'quoted' term"]
+
+
+def test_items_split_at_every_position_are_parsed():
+    for size in range(1, len(RESPONSE) + 1):
+        chunks = [RESPONSE[i:i + size] for i in range(0, len(RESPONSE), size)]
+        assert list(StringExtractor().iter_list_items(chunks)) == ITEMS
+
+
+def test_items_are_returned_as_soon_as_they_close():
+    parser = IncrementalListParser()
+
+    assert parser.feed("concepts = ['Entro") == []
+    assert parser.feed("py', 'Heat") == ["Entropy"]
+    assert parser.feed(" engines']") == ["Heat engines"]
+    assert parser.done and parser.feed("['ignored']") == []
+
+
+def test_truncated_response_keeps_the_completed_items():
+    parser = IncrementalListParser()
+    for chunk in ["```python\n['Entropy', 'Heat en", "gines', 'Carnot cy"]:
+        parser.feed(chunk)
+
+    assert parser.items == ["Entropy", "Heat engines"] and not parser.done
+
+
+def test_empty_brackets_before_the_list_are_skipped():
+    parser = IncrementalListParser()
+
+    assert parser.feed("As shown in [] and [1]: ['Entropy']") == ["Entropy"]
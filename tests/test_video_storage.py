@@ -0,0 +1,23 @@
+import json
+
+from instrumentation import registry
+from video_storage import VideoStorage, video_cache
+
+DOC = "ab" * 32
+
+
+def read_spans():
+    spans = [json.loads(line) for line in registry.to_json_lines().splitlines()]
+    return [span for span in spans if span['stage'] == "get_videos_for_file"]
+
+
+def test_read_span_records_whether_the_cache_answered(db_path):
+    storage = VideoStorage(db_path)
+    storage.store_videos_for_file(DOC, {"Entropy": [{'title': "Video 1", 'url': "u1"}]})
+    video_cache.clear()
+    registry.reset()
+
+    storage.get_videos_for_file(DOC)
+    storage.get_videos_for_file(DOC)
+
+    assert [(span['cache_hit'], span.get('videos')) for span in read_spans()] == [(False, 1), (True, None)]
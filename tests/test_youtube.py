@@ -0,0 +1,92 @@
+import pytest
+
+from fakes import FakeYoutubeDL
+from rate_limit import Backend, BackendUnavailable
+from search_cache import SearchCache
+from youtube import YouTubeSearcher
+
+
+class FlakyYoutubeDL(FakeYoutubeDL):
+    """Raises the next scripted error for each search, then answers normally."""
+
+    def __init__(self, errors, opts=None):
+        super().__init__(opts, latency=0)
+        self.errors = errors
+        self.searches = 0
+
+    def extract_info(self, url, download=False):
+        self.searches += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().extract_info(url, download)
+
+
+def make_searcher(db_path, errors, **backend_options):
+    ydl = FlakyYoutubeDL(errors)
+    sleeps = []
+    backend = Backend("test", rate=1e9, burst=1e9, sleep=sleeps.append, **backend_options)
+    searcher = YouTubeSearcher(cache=SearchCache(db_path), ydl_factory=lambda opts: ydl, backend=backend)
+    return searcher, ydl, sleeps
+
+
+def test_throttled_searches_back_off_and_retry(db_path):
+    searcher, ydl, sleeps = make_searcher(db_path, [Exception("HTTP Error 429: Too Many Requests")] * 2,
+                                          base_delay=1.0, max_delay=8.0)
+
+    videos = searcher.search("Entropy")
+
+    assert len(videos) == 2 and ydl.searches == 3
+    assert len(sleeps) == 2 and all(0 <= delay <= 2.0 for delay in sleeps)
+    assert searcher.backend.throttled == 2 and searcher.backend.bucket.rate < searcher.backend.max_rate
+
+
+def test_retry_after_hint_sets_the_minimum_backoff(db_path):
+    searcher, _, sleeps = make_searcher(db_path, [Exception("429 Too Many Requests, retry after 5s")])
+
+    searcher.search("Entropy")
+
+    assert sleeps[0] >= 5
+
+
+def test_search_raises_when_the_backend_is_unavailable(db_path):
+    searcher, ydl, sleeps = make_searcher(db_path, [Exception("HTTP Error 503")] * 10,
+                                          max_retries=1, failure_threshold=2, reset_timeout=60)
+
+    with pytest.raises(BackendUnavailable):
+        searcher.search("Entropy")
+    assert searcher.backend.breaker.state == 'open'
+
+    # The open circuit rejects the next search without calling yt-dlp
+    with pytest.raises(BackendUnavailable, match="circuit open"):
+        searcher.search("Heat engines")
+    assert ydl.searches == 2 and len(sleeps) == 1
+    assert searcher.cache.get("Entropy", 2) is None
+
+
+def test_open_circuit_lets_one_trial_through_after_its_timeout(db_path):
+    searcher, ydl, _ = make_searcher(db_path, [Exception("HTTP Error 503")],
+                                     max_retries=0, failure_threshold=1, reset_timeout=0)
+
+    with pytest.raises(BackendUnavailable):
+        searcher.search("Entropy")
+
+    assert len(searcher.search("Entropy")) == 2
+    assert searcher.backend.breaker.state == 'closed' and ydl.searches == 2
+
+
+def test_other_search_errors_return_no_results(db_path):
+    searcher, _, sleeps = make_searcher(db_path, [Exception("This video is private")])
+
+    assert searcher.search("Entropy") == []
+    assert sleeps == [] and searcher.cache.get("Entropy", 2) is None
+
+
+def test_failed_queries_are_reported_and_not_cached(db_path):
+    searcher, _, _ = make_searcher(db_path, [Exception("This video is private")])
+
+    results, errors = searcher.search_multiple_detailed(["Entropy", "Heat engines"])
+
+    assert results["Entropy"] == [] and list(errors) == ["Entropy"]
+    assert len(results["Heat engines"]) == 2
+    assert searcher.cache.get("Entropy", 2) is None
+    assert searcher.cache.get("Heat engines", 2) == results["Heat engines"]
@@ -0,0 +1,73 @@
+import time
+from typing import Dict, Optional
+
+from storage import DEFAULT_DB_PATH, get_pool
+
+
+class UploadCache:
+    """
+    Remembers, per document hash, the Gemini file upload and context cache
+    created for a PDF so later extractions can reuse them until they expire.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, expiry_margin_seconds: int = 300):
+        self.db_path = db_path
+        # Treat handles as expired a little early so a request never races the expiry
+        self.expiry_margin_seconds = expiry_margin_seconds
+        self.pool = get_pool(db_path)
+
+    def _is_live(self, expires_at: Optional[float]) -> bool:
+        return expires_at is not None and expires_at - self.expiry_margin_seconds > time.time()
+
+    def get_file(self, file_hash: str) -> Optional[Dict]:
+        """Return the live uploaded file for a document as {name, uri, mime_type}, or None."""
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT file_name, file_uri, mime_type, file_expires_at FROM gemini_uploads WHERE file_hash = ?",
+                (file_hash,)
+            ).fetchone()
+        if row and self._is_live(row[3]):
+            return {'name': row[0], 'uri': row[1], 'mime_type': row[2]}
+        return None
+
+    def get_context_cache(self, file_hash: str, model: str) -> Optional[str]:
+        """Return the name of a live context cache for a document and model, or None."""
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT cache_name, cache_expires_at FROM gemini_uploads WHERE file_hash = ? AND cache_model = ?",
+                (file_hash, model)
+            ).fetchone()
+        if row and row[0] and self._is_live(row[1]):
+            return row[0]
+        return None
+
+    def put_file(self, file_hash: str, name: str, uri: str, mime_type: str, expires_at: float) -> None:
+        """Record a new upload for a document, dropping any cache built on the old one."""
+        with self.pool.write() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO gemini_uploads
+                    (file_hash, file_name, file_uri, mime_type, file_expires_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (file_hash, name, uri, mime_type, expires_at))
+
+    def put_context_cache(self, file_hash: str, model: str, cache_name: str, expires_at: float) -> None:
+        """Record the context cache created for a document's uploaded file."""
+        with self.pool.write() as conn:
+            conn.execute(
+                "UPDATE gemini_uploads SET cache_name = ?, cache_model = ?, cache_expires_at = ? WHERE file_hash = ?",
+                (cache_name, model, expires_at, file_hash)
+            )
+
+    def forget_context_cache(self, file_hash: str) -> None:
+        """Drop a context cache the provider no longer recognizes."""
+        with self.pool.write() as conn:
+            conn.execute(
+                "UPDATE gemini_uploads SET cache_name = NULL, cache_model = NULL, cache_expires_at = NULL "
+                "WHERE file_hash = ?",
+                (file_hash,)
+            )
+
+    def forget(self, file_hash: str) -> None:
+        """Drop everything remembered for a document."""
+        with self.pool.write() as conn:
+            conn.execute("DELETE FROM gemini_uploads WHERE file_hash = ?", (file_hash,))
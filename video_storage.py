@@ -1,112 +1,70 @@
-import sqlite3
-from typing import List, Dict
+import copy
+from typing import Iterable, List, Dict, Optional
+
+from instrumentation import span
+from memory_cache import MemoryCache
+from storage import DEFAULT_DB_PATH
+from storage_backends import StorageBackend, get_backend
+
+# Process-wide cache of get_videos_for_file results, keyed by (db_path, file_hash)
+video_cache = MemoryCache("videos", max_entries=512, ttl_seconds=600)
 
 class VideoStorage:
-    def __init__(self, db_path="file_hashes.db"):
+    def __init__(self, db_path=DEFAULT_DB_PATH, backend: Optional[StorageBackend] = None):
         self.db_path = db_path
-        self.conn = None
+        # Shared, process-wide backend chosen by configuration (see storage_backends.py)
+        self.backend = backend or get_backend(db_path)
 
     def __enter__(self):
         """Enable the use of 'with VideoStorage() as vs:' syntax."""
-        self.conn = sqlite3.connect(self.db_path)
-        self._create_tables()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """Ensure the connection is closed."""
-        if self.conn:
-            self.conn.close()
-
-    def _create_tables(self):
-        with self.conn:
-            # Table for storing file information
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS files (
-                    hash TEXT PRIMARY KEY,
-                    filename TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            # Table for storing unique video information
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS videos (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    url TEXT NOT NULL,
-                    title TEXT,
-                    concept TEXT
-                )
-            """)
-            # Linking table for the many-to-many relationship
-            self.conn.execute("""
-                CREATE TABLE IF NOT EXISTS file_video_links (
-                    file_hash TEXT,
-                    video_id INTEGER,
-                    PRIMARY KEY (file_hash, video_id),
-                    FOREIGN KEY (file_hash) REFERENCES files (hash) ON DELETE CASCADE,
-                    FOREIGN KEY (video_id) REFERENCES videos (id) ON DELETE CASCADE
-                )
-            """)
-            # Add indexes to speed up queries
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_url ON videos (url)")
-            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_file_video_links_file_hash ON file_video_links (file_hash)")
+        """Nothing to release: the shared backend owns its connections."""
+        pass
 
-    def _add_file(self, file_hash: str, filename: str = None):
-        """Adds a file record to the database, ignoring if it already exists."""
-        self.conn.execute(
-            "INSERT OR IGNORE INTO files (hash, filename) VALUES (?, ?)",
-            (file_hash, filename)
-        )
-
-    def _get_or_create_video(self, concept: str, video: Dict[str, str]) -> int:
+    def store_videos_for_file(self, file_hash: str, video_results: Dict[str, List[Dict[str, str]]], filename: str = None):
         """
-        Finds a video by URL or creates it if it doesn't exist.
-        Returns the video's ID.
+        Stores all videos and their links for a given file within a single transaction.
+        With the SQLite backends, videos are upserted in one batch, their ids read
+        back with one query and all links inserted with one executemany.
         """
-        cursor = self.conn.execute("SELECT id FROM videos WHERE url = ?", (video['url'],))
-        result = cursor.fetchone()
-        
-        if result:
-            return result[0]  # Video already exists, return its ID
-        else:
-            # Video doesn't exist, insert it and return the new ID
-            cursor = self.conn.execute(
-                "INSERT INTO videos (url, title, concept) VALUES (?, ?, ?)",
-                (video['url'], video['title'], concept)
-            )
-            return cursor.lastrowid
+        with span("store_videos_for_file", videos=sum(len(v) for v in video_results.values())):
+            if video_results:
+                self.backend.update_videos(file_hash, added_results=video_results, filename=filename)
+            else:
+                self.backend.add_file(file_hash, filename)
+        video_cache.invalidate((self.db_path, file_hash))
 
-    def _link_file_to_video(self, file_hash: str, video_id: int):
-        """Creates a link between a file and a video."""
-        self.conn.execute(
-            "INSERT OR IGNORE INTO file_video_links (file_hash, video_id) VALUES (?, ?)",
-            (file_hash, video_id)
-        )
-
-    def store_videos_for_file(self, file_hash: str, video_results: Dict[str, List[Dict[str, str]]], filename: str = None):
+    def update_videos_for_file(self, file_hash: str, removed_concepts: Iterable[str] = (),
+                               added_results: Dict[str, List[Dict[str, str]]] = None, filename: str = None):
         """
-        Stores all videos and their links for a given file within a single transaction.
+        Applies a concept edit to a file's stored videos in one transaction:
+        drops the links of `removed_concepts` and links the videos found for
+        newly added concepts. Links of unchanged concepts are left untouched.
         """
-        with self.conn:
-            self._add_file(file_hash, filename)
-            for concept, videos in video_results.items():
-                for video in videos:
-                    video_id = self._get_or_create_video(concept, video)
-                    self._link_file_to_video(file_hash, video_id)
+        removed_concepts = list(removed_concepts)
+        added_results = added_results or {}
+        with span("update_videos_for_file", removed=len(removed_concepts),
+                  videos=sum(len(v) for v in added_results.values())):
+            self.backend.update_videos(file_hash, removed_concepts, added_results, filename)
+        video_cache.invalidate((self.db_path, file_hash))
 
     def get_videos_for_file(self, file_hash: str) -> Dict[str, List[Dict[str, str]]]:
-        """Retrieves all videos for a given file, grouped by concept."""
-        query = """
-            SELECT v.concept, v.title, v.url
-            FROM videos v
-            JOIN file_video_links fvl ON v.id = fvl.video_id
-            WHERE fvl.file_hash = ?
         """
-        cursor = self.conn.execute(query, (file_hash,))
-        
-        video_results = {}
-        for concept, title, url in cursor.fetchall():
-            if concept not in video_results:
-                video_results[concept] = []
-            video_results[concept].append({'title': title, 'url': url})
-            
-        return video_results
+        Retrieves all videos for a given file, grouped by the concept they were found for
+        in the order they were linked (search rank, then later pages). Results are served from the shared in-process cache when present.
+        """
+        key = (self.db_path, file_hash)
+        with span("get_videos_for_file") as read_span:
+            cached = video_cache.get(key)
+            read_span.set(cache_hit=cached is not None)
+            if cached is not None:
+                return copy.deepcopy(cached)
+
+            generation = video_cache.generation()
+            video_results = self.backend.get_videos(file_hash)
+            read_span.set(videos=sum(len(v) for v in video_results.values()))
+
+        video_cache.put(key, video_results, generation)
+        return copy.deepcopy(video_results)
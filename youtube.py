@@ -1,42 +1,239 @@
-import yt_dlp
-from typing import List, Dict
+import asyncio
+import functools
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple
+
+from instrumentation import span
+from rate_limit import Backend, BackendUnavailable, scheduler
+from search_cache import SearchCache, normalize_query
+from singleflight import SingleFlight
+
+# Results fetched per search: one flat result page, stored in ranked order and
+# paged from storage, so showing more videos for a concept needs no new search
+FETCH_DEPTH = 20
+
+_VIDEO_ID_PATTERN = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/embed/)([\w-]{11})")
+
+def video_id_from_url(url: str) -> Optional[str]:
+    """Return the 11-character video id of a YouTube URL, or None if it has none."""
+    match = _VIDEO_ID_PATTERN.search(url or "")
+    return match.group(1) if match else None
+
+def thumbnail_url(url: str) -> Optional[str]:
+    """Static thumbnail image for a video, served by YouTube's image CDN."""
+    video_id = video_id_from_url(url)
+    return f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg" if video_id else None
+
+def _default_ydl_factory(opts: dict) -> Any:
+    # yt-dlp takes a noticeable time to import, so it is loaded on the first search
+    import yt_dlp
+    return yt_dlp.YoutubeDL(opts)
 
 class YouTubeSearcher:
     """Simple YouTube video searcher using yt-dlp."""
-    
-    def __init__(self):
+
+    def __init__(self, max_workers: int = 8, cache: Optional[SearchCache] = None,
+                 ydl_factory: Optional[Callable[[dict], Any]] = None, backend: Optional[Backend] = None,
+                 flight: Optional[SingleFlight] = None, fetch_depth: int = FETCH_DEPTH):
         self.ydl_opts = {
             'quiet': True,
             'no_warnings': True,
             'extract_flat': True
         }
-    
+        self.max_workers = max_workers
+        self.fetch_depth = fetch_depth
+        self.cache = cache
+        # Shared rate limit, retries and circuit breaker for every search in the process
+        self.backend = backend or scheduler.backend("youtube")
+        # Coalesces identical searches running at the same time in other sessions or processes
+        self.flight = flight
+        # Builds the extractor for each worker thread; replaceable with an offline stand-in
+        self.ydl_factory = ydl_factory or _default_ydl_factory
+        # One YoutubeDL instance per thread, reused across queries
+        self._local = threading.local()
+
+    def _get_ydl(self) -> Any:
+        """Return the calling thread's YoutubeDL instance, creating it on first use."""
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            ydl = self.ydl_factory(self.ydl_opts)
+            self._local.ydl = ydl
+        return ydl
+
+    def _fetch(self, query: str, count: int) -> List[Dict]:
+        """
+        Run a single search and return its videos. Throttled searches are
+        retried by the backend; errors are raised to the caller.
+        """
+        info = self.backend.call(self._get_ydl().extract_info, f"ytsearch{count}:{query}", download=False)
+
+        videos = []
+        if info and 'entries' in info and info['entries']:
+            for entry in info['entries']:
+                if entry:
+                    videos.append({
+                        'title': entry.get('title', 'Unknown'),
+                        'url': entry.get('webpage_url', entry.get('url', ''))
+                    })
+        return videos
+
+    def _fetch_shared(self, query: str, depth: int) -> List[Dict]:
+        """
+        Like _fetch, but through single-flight when configured. The search that
+        does the work caches its result before releasing its lease, so waiting
+        callers in other processes read it from the cache.
+        """
+        if self.flight is None:
+            return self._fetch(query, depth)
+
+        def lead():
+            videos = self._fetch(query, depth)
+            if self.cache:
+                self.cache.put(query, depth, videos)
+            return videos
+
+        recheck = (lambda: self.cache.get(query, depth)) if self.cache else None
+        return self.flight.do(f"search:{depth}:{normalize_query(query)}", lead, recheck)
+
+    def _fetch_and_store(self, query: str, depth: int) -> List[Dict]:
+        """_fetch_shared, caching the result when single-flight has not already done so."""
+        videos = self._fetch_shared(query, depth)
+        if self.cache and self.flight is None:
+            self.cache.put(query, depth, videos)
+        return videos
+
     def search(self, query: str, count: int = 2) -> List[Dict]:
-        """Search for videos with specified query and result count."""
-        try:
-            with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
-                info = ydl.extract_info(f"ytsearch{count}:{query}", download=False)
-                
-                videos = []
-                if 'entries' in info and info['entries']:
-                    for entry in info['entries']:
-                        if entry:
-                            videos.append({
-                                'title': entry.get('title', 'Unknown'),
-                                'url': entry.get('webpage_url', entry.get('url', ''))
-                            })
-                return videos
-        except Exception as e:
-            print(f"Search error: {e}")
-            return []
-    
-    def search_multiple(self, queries: List[str], count: int = 2) -> Dict:
-        """Search multiple queries and return results."""
-        results = {}
-        for query in queries:
-            results[query] = self.search(query, count)
+        """
+        Search for videos with specified query and result count. Other failures
+        return [], but BackendUnavailable (circuit open, or throttled past every
+        retry) is raised, so callers can tell it from a search without results.
+        Failed searches are never cached.
+        """
+        with span("search", cache_hit=False) as search_span:
+            if self.cache:
+                cached = self.cache.get(query, count)
+                if cached is not None:
+                    search_span.set(cache_hit=True, videos=len(cached))
+                    return cached
+            try:
+                videos = self._fetch_and_store(query, max(count, self.fetch_depth))[:count]
+            except BackendUnavailable:
+                search_span.set(failed=True)
+                raise
+            except Exception as e:
+                search_span.set(failed=True)
+                print(f"Search error: {e}")
+                return []
+            search_span.set(videos=len(videos))
+            return videos
+
+    def search_page(self, query: str, offset: int, limit: int, fetch: bool = True) -> Optional[List[Dict]]:
+        """
+        Return results `offset` to `offset + limit` of the query's ranked list.
+
+        Pages are served from the stored list. Only a stale list, or a page past
+        the end of a list that may have more results, triggers a deeper search;
+        with `fetch` false, None is returned instead of searching. Search errors
+        are raised.
+        """
+        end = offset + limit
+        stored = self.cache.get_list(query) if self.cache else None
+        with span("search_page", cache_hit=False) as page_span:
+            if stored:
+                videos, depth = stored
+                # A list shorter than its depth already holds every result
+                if len(videos) >= end or len(videos) < depth:
+                    page_span.set(cache_hit=True)
+                    return videos[offset:end]
+            if not fetch:
+                return None
+            depth = max(end, self.fetch_depth, stored[1] * 2 if stored else 0)
+            return self._fetch_and_store(query, depth)[offset:end]
+
+    def search_multiple_detailed(self, queries: List[str], count: int = 2,
+                                 max_workers: Optional[int] = None) -> Tuple[Dict, Dict[str, str]]:
+        """
+        Search multiple queries concurrently.
+
+        Returns (results, errors): results maps every query to its videos in input
+        order (empty for failed queries), errors maps each failed query to its message.
+        Cached queries are served without a network call; failed ones are never cached.
+        Each search fetches `fetch_depth` results, so later pages come from the cache.
+        """
+        with span("search_multiple", queries=len(queries)) as search_span:
+            outcomes = {}
+            unique_queries = list(dict.fromkeys(queries))
+            if self.cache:
+                for query, videos in self.cache.get_many(unique_queries, count).items():
+                    outcomes[query] = (videos, None)
+                unique_queries = [q for q in unique_queries if q not in outcomes]
+            search_span.set(cache_hits=len(outcomes), cache_hit=not unique_queries)
+
+            workers = max(1, min(max_workers or self.max_workers, len(unique_queries) or 1))
+            depth = max(count, self.fetch_depth)
+
+            def run(query):
+                try:
+                    return self._fetch(query, depth), None
+                except Exception as e:
+                    return [], str(e)
+
+            if self.flight is not None and unique_queries:
+                # One lease transaction and one cache write for the whole batch
+                keys = {f"search:{depth}:{normalize_query(q)}": q for q in unique_queries}
+
+                def store(found):
+                    self.cache.put_many({keys[key]: videos for key, videos in found.items()}, depth)
+
+                def recheck(key):
+                    return self.cache.get(keys[key], depth)
+
+                futures = self.flight.do_many(
+                    {key: functools.partial(self._fetch, query, depth) for key, query in keys.items()},
+                    store if self.cache else None, recheck if self.cache else None, workers
+                )
+                for key, query in keys.items():
+                    error = futures[key].exception()
+                    outcomes[query] = (futures[key].result(), None) if error is None else ([], str(error))
+            elif workers == 1:
+                for query in unique_queries:
+                    outcomes[query] = run(query)
+            else:
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="yt-search") as pool:
+                    for query, outcome in zip(unique_queries, pool.map(run, unique_queries)):
+                        outcomes[query] = outcome
+
+            # With single-flight, each search already cached its own result
+            if self.cache and self.flight is None:
+                self.cache.put_many(
+                    {q: outcomes[q][0] for q in unique_queries if outcomes[q][1] is None}, depth
+                )
+
+            results = {}
+            errors = {}
+            for query in queries:
+                videos, error = outcomes[query]
+                results[query] = videos[:count]
+                if error is not None:
+                    errors[query] = error
+            search_span.set(errors=len(errors))
+            return results, errors
+
+    def search_multiple(self, queries: List[str], count: int = 2,
+                        max_workers: Optional[int] = None) -> Dict:
+        """Search multiple queries concurrently and return results in input order."""
+        results, errors = self.search_multiple_detailed(queries, count, max_workers)
+        for query, error in errors.items():
+            print(f"Search error for '{query}': {error}")
         return results
-        
+
+    async def search_multiple_async(self, queries: List[str], count: int = 2,
+                                    max_workers: Optional[int] = None) -> Tuple[Dict, Dict[str, str]]:
+        """Awaitable version of search_multiple_detailed; runs the searches off the event loop."""
+        return await asyncio.to_thread(self.search_multiple_detailed, queries, count, max_workers)
+
     def print_results(self, results: Dict) -> None:
         """Print search results in a readable format."""
         for query, videos in results.items():
@@ -50,14 +247,14 @@ def main():
     """Demo the simplified YouTubeSearcher."""
     queries = ["Python programming", "Machine Learning"]
     searcher = YouTubeSearcher()
-    
+
     # Search single query
     python_videos = searcher.search("Python tutorial")
     print("=== PYTHON TUTORIALS ===")
     for i, video in enumerate(python_videos, 1):
         print(f"{i}. {video['title']}")
         print(f"   {video['url']}")
-    
+
     # Search multiple queries
     results = searcher.search_multiple(queries)
     print("\n=== MULTIPLE SEARCHES ===")
@@ -68,4 +265,4 @@ if __name__ == "__main__":
     try:
         main()
     except ImportError:
-        print("Install yt-dlp: pip install yt-dlp")
\ No newline at end of file
+        print("Install yt-dlp: pip install yt-dlp")